@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Headless settlement generator for building content packs without the website, e.g.
+#   python batch_generate.py --count 500 --size Town --quests 2 --concurrency 8 --output towns.jsonl
+#   python batch_generate.py --count 10000 --offline --output npcs.parquet
+
+SETTLEMENT_SIZES = ["Thorp", "Village", "Town", "City", "Metropolis"]
+
+# Settlements buffered before a Parquet row group is written
+PARQUET_ROW_GROUP = 256
+
+
+# Function run in the worker processes, generator is imported here so --offline is set before the catalog loads
+def generate_one(index, settlement_size, use_llm, quest_count, seed, cache_policy=None):
+    import generator
+    import tracing
+
+    if seed is not None:
+        random.seed(seed + index)
+    if settlement_size == "random":
+        settlement_size = random.choice(SETTLEMENT_SIZES)
+    try:
+        # Every settlement is one trace, written out when INSPIRAITION_TRACE_JSONL is set
+        with tracing.trace("settlement", size=settlement_size, index=index):
+            settlement = generator.generate_settlement(settlement_size, use_llm=use_llm, quest_count=quest_count, cache_policy=cache_policy)
+    except Exception as e:
+        return {"index": index, "error": repr(e)}
+    settlement["index"] = index
+    return settlement
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, settlement):
+        self.file.write(json.dumps(settlement) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow, install it or write .jsonl instead")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+        self.rows = []
+
+    def write(self, settlement):
+        # Nested data is stored as JSON strings so every settlement fits one flat row
+        self.rows.append({
+            "index": settlement["index"],
+            "name": settlement.get("name"),
+            "size": settlement.get("size"),
+            "population": settlement.get("population"),
+            "description": settlement.get("description"),
+            "history": settlement.get("history"),
+            "notable_locations": json.dumps(settlement.get("notable_locations", [])),
+            "image_url": settlement.get("image_url"),
+            "image_id": settlement.get("image_id"),
+            "npcs": json.dumps(settlement.get("npcs", [])),
+            "quests": json.dumps(settlement.get("quests", [])),
+            "error": settlement.get("error"),
+        })
+        if len(self.rows) >= PARQUET_ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pa.Table.from_pylist(self.rows, schema=self._schema())
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def _schema(self):
+        pa = self.pa
+        return pa.schema([
+            ("index", pa.int64()), ("name", pa.string()), ("size", pa.string()), ("population", pa.int64()),
+            ("description", pa.string()), ("history", pa.string()), ("notable_locations", pa.string()),
+            ("image_url", pa.string()), ("image_id", pa.string()),
+            ("npcs", pa.string()), ("quests", pa.string()), ("error", pa.string()),
+        ])
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, output_format):
+    if output_format is None:
+        output_format = "parquet" if path.endswith(".parquet") else "jsonl"
+    return ParquetWriter(path) if output_format == "parquet" else JsonlWriter(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate settlements, NPCs and quests without the website.")
+    parser.add_argument("--count", type=int, default=1, help="number of settlements to generate")
+    parser.add_argument("--size", choices=SETTLEMENT_SIZES + ["random"], default="random", help="settlement size")
+    parser.add_argument("--quests", type=int, default=0, help="quests to generate per settlement")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--output", default="-", help="output file (.jsonl or .parquet), - for stdout")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="output format, guessed from --output by default")
+    parser.add_argument("--no-llm", action="store_true", help="skip descriptions, histories, images and quests")
+    parser.add_argument("--offline", action="store_true", help="no network at all, implies --no-llm")
+    parser.add_argument("--cache-policy", choices=["fresh", "prefer_cache", "cache_only"], help="OpenAI response cache policy")
+    parser.add_argument("--seed", type=int, help="base random seed, settlement i uses seed + i")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.offline:
+        args.no_llm = True
+        os.environ["INSPIRAITION_OFFLINE"] = "1"
+        os.environ["INSPIRAITION_NAME_SOURCE"] = "local"
+    use_llm = not args.no_llm
+    if args.output == "-" and (args.format == "parquet" or args.output.endswith(".parquet")):
+        raise SystemExit("Parquet output needs a file path")
+
+    writer = open_writer(args.output, args.format)
+    # Only a couple of settlements per worker are ever in flight, so memory stays flat however large --count is
+    max_in_flight = max(1, args.concurrency) * 2
+    next_index = 0
+    running = set()
+    written = failed = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        while next_index < args.count or running:
+            while next_index < args.count and len(running) < max_in_flight:
+                running.add(executor.submit(generate_one, next_index, args.size, use_llm, args.quests, args.seed, args.cache_policy))
+                next_index += 1
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                settlement = future.result()
+                writer.write(settlement)
+                written += 1
+                if "error" in settlement:
+                    failed += 1
+                    print(f"Settlement {settlement['index']} failed: {settlement['error']}", file=sys.stderr)
+            print(f"\r{written}/{args.count} settlements", end="", file=sys.stderr)
+
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"\nWrote {written - failed} settlements ({failed} failed) in {elapsed:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
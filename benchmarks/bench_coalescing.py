@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Upstream SRD requests when many sessions ask for the same resources at once, with and without coalescing
+# Runs against the local stub server (see stub_servers.py), every simulated session fetches the race list,
+# the class list and the details of every race, all sessions starting at the same moment
+#   python benchmarks/bench_coalescing.py --sessions 50 --latency 80
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_servers import ServiceConfig, StubServer, StubServices
+
+
+def run_sessions(http_client, base_url, sessions, coalesce):
+    race_indexes = [race["index"] for race in http_client.get_json(f"{base_url}/races")["results"]]
+    paths = ["/races", "/classes"] + [f"/races/{index}" for index in race_indexes]
+    start_together = threading.Barrier(sessions)
+
+    def session():
+        start_together.wait()
+        for path in paths:
+            http_client.get_json(f"{base_url}{path}", coalesce=coalesce)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how request coalescing cuts upstream SRD requests.")
+    parser.add_argument("--sessions", type=int, default=50, help="sessions fetching at the same time")
+    parser.add_argument("--latency", type=float, default=80, help="stub latency in milliseconds")
+    args = parser.parse_args()
+
+    services = StubServices({"srd": ServiceConfig(args.latency)})
+    server = StubServer(services).start()
+    base_url = server.environ()["INSPIRAITION_SRD_API_URL"]
+
+    import http_client
+
+    print(f"{args.sessions} sessions, {args.latency:.0f} ms upstream latency")
+    print(f"{'mode':<12} {'calls':>7} {'upstream':>9} {'saved':>7} {'seconds':>8}")
+    for coalesce in (False, True):
+        http_client.reset_stats()
+        http_client.clear_shared_results()
+        services.reset_counts()
+        seconds, resources = run_sessions(http_client, base_url, args.sessions, coalesce)
+        upstream = services.counts()["calls"]["srd"] - 1
+        saved = http_client.get_coalescing_stats()["saved"]
+        print(f"{'coalesced' if coalesce else 'direct':<12} {args.sessions * resources:>7} {upstream:>9} {saved:>7} {seconds:>8.2f}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
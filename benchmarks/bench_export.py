@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+# Throughput of campaign_export.py: pages (PDF) and settlements per second for both formats, with one process
+# and with a worker pool, and the peak memory of in-process exports at two campaign sizes (it should stay flat)
+# The campaign is built offline: NPCs from the bundled SRD snapshot, quests from quest_corpus.jsonl and
+# generated town art in a scratch image store
+#   python benchmarks/bench_export.py --settlements 40 --workers 4
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+SCRATCH = tempfile.mkdtemp(prefix="inspiraition-export-")
+os.environ["INSPIRAITION_OFFLINE"] = "1"
+os.environ["INSPIRAITION_NAME_SOURCE"] = "local"
+os.environ["INSPIRAITION_IMAGE_DIR"] = os.path.join(SCRATCH, "town_images")
+
+import campaign_export
+import generator
+import image_store
+from stub_servers import gradient_png
+
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, "quest_corpus.jsonl")
+SETTLEMENT_SIZES = ["Village", "Town", "City", "Metropolis"]
+# Distinct town images, DALL-E sized
+IMAGE_COUNT = 8
+
+
+# Function to write a campaign of count settlements as batch_generate.py JSONL, returns its path
+def build_campaign(count, quests_per_settlement):
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        corpus = [json.loads(line)["quest_text"] for line in f if line.strip()]
+    image_ids = [image_store.store_image_bytes(gradient_png(1024 - i, 1024)) for i in range(IMAGE_COUNT)]
+
+    path = os.path.join(SCRATCH, f"campaign-{count}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            settlement = generator.generate_settlement(SETTLEMENT_SIZES[i % len(SETTLEMENT_SIZES)], use_llm=False)
+            settlement.update({
+                "description": " ".join(["The mist rolls in off the river every morning and the markets are loud."] * 4),
+                "history": " ".join(["Dwarven bridge builders founded the town two centuries ago."] * 3),
+                "notable_locations": ["The Old Stone Bridge", "Lamplighters' Guildhall"],
+                "image_id": image_ids[i % IMAGE_COUNT],
+                "quests": [{"quest_text": quest_text} for quest_text in random.sample(corpus, quests_per_settlement)],
+            })
+            f.write(json.dumps(settlement) + "\n")
+    return path
+
+
+def run_export(campaign, output_format, workers):
+    output = os.path.join(SCRATCH, f"campaign.{output_format}")
+    with open(output, "wb") as f:
+        return campaign_export.export(campaign_export.read_settlements([campaign]), f, output_format, workers)
+
+
+def peak_memory_kb(campaign, output_format):
+    tracemalloc.start()
+    run_export(campaign, output_format, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure campaign export throughput and memory.")
+    parser.add_argument("--settlements", type=int, default=40, help="settlements in the campaign")
+    parser.add_argument("--quests", type=int, default=3, help="quests per settlement")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="worker processes for the pooled runs")
+    args = parser.parse_args()
+    random.seed(0)
+
+    campaign = build_campaign(args.settlements, args.quests)
+    print(f"{args.settlements} settlements, {args.quests} quests each, scratch files in {SCRATCH}")
+    print(f"{'format':<7} {'workers':>7} {'pages':>6} {'pages/s':>8} {'towns/s':>8} {'MB':>7} {'seconds':>8}")
+    for output_format in ("pdf", "html"):
+        for workers in sorted({1, args.workers}):
+            stats = run_export(campaign, output_format, workers)
+            pages = stats["pages"] or 0
+            print(f"{output_format:<7} {workers:>7} {pages:>6} {pages / stats['seconds']:>8.1f} "
+                  f"{stats['settlements'] / stats['seconds']:>8.1f} {stats['bytes'] / 2 ** 20:>7.1f} {stats['seconds']:>8.2f}")
+
+    # Peak Python memory of the same export at a quarter and at the full campaign size
+    small = build_campaign(max(1, args.settlements // 4), args.quests)
+    for output_format in ("pdf", "html"):
+        print(f"{output_format} peak memory: {peak_memory_kb(small, output_format):.0f} KB for {max(1, args.settlements // 4)} settlements, "
+              f"{peak_memory_kb(campaign, output_format):.0f} KB for {args.settlements}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+# Names per second of name_engine, and how often it runs out of fresh names and falls back to "X the Nth"
+#   python benchmarks/bench_names.py --count 5000 --seed 0
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import name_engine
+from stat_engine import RACES
+
+
+# Function to time one call of names_for_races, returns (seconds, names)
+def time_names(engine, races, seed):
+    start = time.perf_counter()
+    names = engine.names_for_races(races, random.Random(seed))
+    return time.perf_counter() - start, names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the local name generator.")
+    parser.add_argument("--count", type=int, default=5000, help="unique names per run")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the races and the names")
+    parser.add_argument("--repeats", type=int, default=5, help="runs per row, the fastest is reported")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = name_engine.get_name_engine()
+    print(f"training: {1000 * (time.perf_counter() - start):.1f} ms")
+
+    mixed = [random.Random(args.seed).choice(RACES) for _ in range(args.count)]
+    rows = [("mixed races", mixed)] + [(race, [race] * args.count) for race in ("Human", "Elf", "Half-Orc")]
+    print(f"{'races':>12} {'ms':>8} {'names/s':>10} {'bynames':>8}")
+    for label, races in rows:
+        seconds, names = min(time_names(engine, races, args.seed) for _ in range(args.repeats))
+        bynames = sum(1 for name in names if " the " in name)
+        assert len(set(names)) == len(names), Counter(names).most_common(1)
+        print(f"{label:>12} {1000 * seconds:>8.1f} {len(names) / seconds:>10,.0f} {bynames:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# End-to-end benchmark of the settlement and quest pipelines against local stub servers (see stub_servers.py),
+# so it runs offline and without an OpenAI key
+#   python benchmarks/bench_pipeline.py --runs 5 --output results.json
+#   python benchmarks/bench_pipeline.py --latency openai=400 --error-rate srd=0.1 --compare results.json
+# Reports end-to-end and per-stage latency, HTTP calls per service and peak memory for every settlement size
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_servers import SERVICES, ServiceConfig, StubServer, StubServices
+
+# Default latencies in milliseconds, roughly what the real services answer in
+DEFAULT_LATENCY_MS = {"srd": 60, "randomuser": 150, "openai": 800, "images": 120}
+
+RESULTS_VERSION = 1
+
+
+def parse_service_values(values, option):
+    parsed = {}
+    for value in values or ():
+        service, _, number = value.partition("=")
+        if service not in SERVICES or not number:
+            raise SystemExit(f"{option} expects service=value with service one of {', '.join(SERVICES)}, got {value!r}")
+        parsed[service] = float(number)
+    return parsed
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Function to reduce a list of durations in seconds to milliseconds stats
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 2) if samples else 0.0,
+        "p50_ms": round(1000 * percentile(samples, 0.50), 2),
+        "p95_ms": round(1000 * percentile(samples, 0.95), 2),
+        "max_ms": round(1000 * max(samples, default=0.0), 2),
+    }
+
+
+# Function to collect span durations of a finished trace by name, the root span excluded
+def span_durations(trace_run, into):
+    for row in trace_run.rows():
+        if row["depth"] > 0:
+            into.setdefault(row["name"], []).append(row["duration_ms"] / 1000)
+
+
+def drain_quest_stream(generator, quest_parser_class, town_name, character_data, cache_policy):
+    parser = quest_parser_class()
+    start = time.perf_counter()
+    first_token = None
+    for piece in generator.generate_quest_stream(town_name, character_data, cache_policy):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        parser.feed(piece)
+    parser.finish()
+    parser.record()
+    return first_token or 0.0, time.perf_counter() - start
+
+
+def bench_size(size, args, services, modules):
+    generator, http_client, tracing, llm_cache, quest_stream = modules
+    totals, quest_totals, first_tokens, spans, failures = [], [], [], {}, 0
+    services.reset_counts()
+    http_client.reset_stats()
+
+    for _ in range(args.runs):
+        try:
+            with tracing.trace("bench.settlement", size=size) as run:
+                settlement = generator.generate_settlement(size, use_llm=True, quest_count=args.quests, cache_policy=llm_cache.FRESH)
+            totals.append(run.total_seconds)
+            span_durations(run, spans)
+
+            if args.stream_quests and settlement["npcs"]:
+                character_data = [f"[{c['name']}|{c['alignment']}|{c['class']}]" for c in settlement["npcs"]]
+                with tracing.trace("bench.quest_stream", size=size) as run:
+                    first_token, total = drain_quest_stream(generator, quest_stream.QuestSectionParser, settlement["name"], character_data, llm_cache.FRESH)
+                first_tokens.append(first_token)
+                quest_totals.append(total)
+                span_durations(run, spans)
+        except Exception as e:
+            failures += 1
+            print(f"  {size}: run failed with {e!r}")
+
+    counts = services.counts()
+    # One more run under tracemalloc, its overhead would distort the timings above
+    tracemalloc.start()
+    try:
+        generator.generate_settlement(size, use_llm=True, quest_count=args.quests, cache_policy=llm_cache.FRESH)
+    except Exception:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runs = max(1, args.runs)
+    return {
+        "runs": args.runs,
+        "failures": failures,
+        "settlement": summarize(totals),
+        "quest_stream": summarize(quest_totals),
+        "quest_first_token": summarize(first_tokens),
+        "stages": {name: summarize(samples) for name, samples in sorted(spans.items())},
+        "stub_calls_per_run": {service: round(count / runs, 2) for service, count in counts["calls"].items()},
+        "stub_errors": counts["errors"],
+        "http_endpoints": http_client.get_stats(),
+        "http_coalescing": http_client.get_coalescing_stats(),
+        "peak_python_kb": round(peak / 1024, 1),
+    }
+
+
+# Function to print the change of every latency and memory figure against an earlier results file
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('started_at', '?')}):")
+    print(f"{'size':<11} {'metric':<28} {'before':>10} {'after':>10} {'change':>8}")
+    for size, current in results["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if before is None:
+            continue
+        rows = [("settlement p50 ms", before["settlement"]["p50_ms"], current["settlement"]["p50_ms"]),
+                ("settlement p95 ms", before["settlement"]["p95_ms"], current["settlement"]["p95_ms"]),
+                ("quest first token p50 ms", before["quest_first_token"]["p50_ms"], current["quest_first_token"]["p50_ms"]),
+                ("peak python KB", before["peak_python_kb"], current["peak_python_kb"])]
+        for name, stats in current["stages"].items():
+            if name.startswith("stage.") and name in before["stages"]:
+                rows.append((f"{name} p50 ms", before["stages"][name]["p50_ms"], stats["p50_ms"]))
+        for metric, old, new in rows:
+            change = f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+            print(f"{size:<11} {metric:<28} {old:>10} {new:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the settlement and quest pipelines against local stub servers.")
+    parser.add_argument("--runs", type=int, default=3, help="settlements generated per size")
+    parser.add_argument("--sizes", nargs="+", help="settlement sizes to run (default: all)")
+    parser.add_argument("--quests", type=int, default=1, help="quests generated with every settlement")
+    parser.add_argument("--no-stream-quests", dest="stream_quests", action="store_false", help="skip the streamed quest run")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS", help=f"mean latency per service, default {DEFAULT_LATENCY_MS}")
+    parser.add_argument("--jitter", action="append", metavar="SERVICE=MS", help="random extra latency per service")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=RATE", help="share of requests failed with 500 (429 for openai)")
+    parser.add_argument("--names", choices=["local", "randomuser"], default="randomuser", help="NPC name source")
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--compare", metavar="RESULTS.json", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    latency = dict(DEFAULT_LATENCY_MS, **parse_service_values(args.latency, "--latency"))
+    jitter = parse_service_values(args.jitter, "--jitter")
+    error_rate = parse_service_values(args.error_rate, "--error-rate")
+    configs = {service: ServiceConfig(latency.get(service, 0), jitter.get(service, 0), error_rate.get(service, 0)) for service in SERVICES}
+    services = StubServices(configs)
+    server = StubServer(services).start()
+
+    # Everything the app talks to or writes goes to the stub server and a scratch directory
+    scratch = tempfile.mkdtemp(prefix="inspiraition-bench-")
+    os.environ.update(server.environ())
+    os.environ.update({
+        "INSPIRAITION_NAME_SOURCE": args.names,
+        "INSPIRAITION_LLM_CACHE": os.path.join(scratch, "llm_cache.sqlite3"),
+        "INSPIRAITION_SRD_CACHE": os.path.join(scratch, "srd_snapshot.json"),
+        "INSPIRAITION_IMAGE_DIR": os.path.join(scratch, "town_images"),
+    })
+    os.environ.pop("INSPIRAITION_OFFLINE", None)
+
+    import generator
+    import http_client
+    import llm_cache
+    import quest_stream
+    import srd_catalog
+    import tracing
+
+    modules = (generator, http_client, tracing, llm_cache, quest_stream)
+    sizes = args.sizes or list(generator.settlement_sizes)
+
+    # Cold SRD snapshot download, what a fresh install does on its first request
+    services.reset_counts()
+    with tracing.trace("bench.srd_refresh") as run:
+        srd_catalog.get_catalog().refresh()
+    srd_refresh = {"ms": round(1000 * run.total_seconds, 2), "stub_calls": services.counts()["calls"]["srd"]}
+
+    results = {
+        "version": RESULTS_VERSION,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "runs": args.runs,
+            "quests": args.quests,
+            "stream_quests": args.stream_quests,
+            "names": args.names,
+            "latency_ms": latency,
+            "jitter_ms": jitter,
+            "error_rate": error_rate,
+        },
+        "srd_refresh": srd_refresh,
+        "sizes": {},
+    }
+
+    print(f"{'size':<11} {'p50 ms':>9} {'p95 ms':>9} {'TTFT ms':>9} {'openai':>7} {'srd':>5} {'names':>6} {'peak KB':>9}")
+    for size in sizes:
+        result = bench_size(size, args, services, modules)
+        results["sizes"][size] = result
+        calls = result["stub_calls_per_run"]
+        print(f"{size:<11} {result['settlement']['p50_ms']:>9} {result['settlement']['p95_ms']:>9} "
+              f"{result['quest_first_token']['p50_ms']:>9} {calls['openai']:>7} {calls['srd']:>5} {calls['randomuser']:>6} {result['peak_python_kb']:>9}")
+
+    results["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["stage_metrics"] = tracing.metrics.summary()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nPeak RSS {results['peak_rss_kb']} KB, results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
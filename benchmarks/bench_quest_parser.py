@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import sys
+import time
+
+# Microbenchmark for quest_parser: the single-pass parser against the old three-step pipeline
+# (replace_bold_italic, extract_quest_details, insert_newlines_before_numbers) on recorded quest outputs
+# The old pipeline's functions are kept here as the baseline, the app no longer uses them
+#   python benchmarks/bench_quest_parser.py [repeats per quest]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quest_parser import QUEST_SECTIONS, parse_quest
+from quest_stream import QuestSectionParser
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quest_corpus.jsonl")
+
+
+def load_corpus():
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        return [json.loads(line)["quest_text"] for line in f if line.strip()]
+
+
+# The old pipeline, as generator.py had it
+def insert_newlines_before_numbers(text):
+    # Define the regex pattern to match numbers followed by a dot (e.g., "1.", "2.", ...)
+    pattern = r'(\d+\.)'
+    
+    def replace_match(match):
+        if match.group(1) == '1.':
+            return match.group(1)
+        else:
+            return f'<br>{match.group(1)}'
+    
+    # Replace the pattern using the replace_match function
+    modified_text = re.sub(pattern, replace_match, text)
+    
+    return modified_text
+
+def insert_newlines_before_hyphens(text):
+    # Replace each hyphen with a new-line character followed by the hyphen
+    modified_text = text.replace("-", "<br>-")
+    
+    return modified_text
+
+def replace_bold_italic(text: str) -> str:
+    # Define the regex pattern to match text between "**"
+    pattern = r'\*\*(.*?)\*\*'
+    
+    def replace_match(match):
+        inner_text = match.group(1)
+        if len(inner_text) < 50:
+            return f'<span style="font-weight:bold;font-style:italic;">{inner_text}</span>'
+        else:
+            return inner_text
+    
+    # Replace matching patterns using the replace_match function
+    modified_text = re.sub(pattern, replace_match, text)
+    
+    # Remove any remaining "**"
+    modified_text = modified_text.replace('**', '')
+    
+    return modified_text
+
+def extract_quest_details(quest_text):
+    # Define the substrings to search for
+    substrings = [
+        "Quest Title",
+        "Quest Giver",
+        "Quest Background",
+        "Stages of the Quest",
+        "Possible Resolutions",
+        "Conclusion"
+    ]
+    
+    # Initialize an empty list to store the results
+    results = [""] * len(substrings)  # Initialize results with empty strings for each substring
+
+    # Extract the text segments between the substrings
+    for i in range(len(substrings) - 1):
+        start = quest_text.find(substrings[i]) + len(substrings[i])
+        end = quest_text.find(substrings[i + 1])
+        if start < len(substrings[i]) or end == -1:  # Check if start is valid and end is found
+            continue  # Skip to next iteration if not found
+        results[i] = quest_text[start:end].strip()
+
+    # Extract the text after the last substring
+    start = quest_text.find(substrings[-1]) + len(substrings[-1])
+    if start >= len(substrings[-1]):  # Check if start is valid
+        results[-1] = quest_text[start:].strip()
+    
+    return results
+
+
+# The old pipeline as the quest tile used to run it
+def legacy_parse(quest_text):
+    parts = extract_quest_details(replace_bold_italic(quest_text))
+    return [
+        insert_newlines_before_numbers(part).strip(' :#-') if i in (3, 4) else part.strip(' :#-"')
+        for i, part in enumerate(parts)
+    ]
+
+
+# Feeds the quest in small chunks the way the OpenAI stream delivers it, re-rendering when a section completes
+def streamed_parse(quest_text, chunk_size=12):
+    parser = QuestSectionParser()
+    for i in range(0, len(quest_text), chunk_size):
+        if parser.feed(quest_text[i:i + chunk_size]):
+            parser.record()
+    parser.finish()
+    return parser.record()
+
+
+def time_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = load_corpus()
+
+    print(f"{'quest':>6} {'legacy us':>10} {'parser us':>10} {'stream us':>10} {'legacy found':>13} {'parser found':>13}")
+    for i, quest_text in enumerate(corpus):
+        legacy_seconds = time_call(lambda: legacy_parse(quest_text), repeats)
+        parser_seconds = time_call(lambda: parse_quest(quest_text), repeats)
+        stream_seconds = time_call(lambda: streamed_parse(quest_text), max(1, repeats // 10))
+        legacy_found = sum(1 for part in legacy_parse(quest_text) if part)
+        parser_found = sum(1 for part in parse_quest(quest_text).parts if part and part != "Untitled Quest")
+        print(f"{i:>6} {legacy_seconds * 1e6:>10.1f} {parser_seconds * 1e6:>10.1f} {stream_seconds * 1e6:>10.1f} "
+              f"{legacy_found:>10}/{len(QUEST_SECTIONS)} {parser_found:>10}/{len(QUEST_SECTIONS)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+import time
+
+# Microbenchmark for tile_renderer: how settlement render time grows with the number of NPCs
+#   python benchmarks/bench_render.py [max NPC count]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import NPCRecord, TownRecord
+from tile_renderer import clear_tile_caches, render_npc_tile, render_settlement, render_town_tile
+
+RACES = ["Dragonborn", "Dwarf", "Elf", "Gnome", "Half-Elf", "Half-Orc", "Halfling", "Human", "Tiefling"]
+CLASSES = ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
+
+
+def make_npc(i):
+    return NPCRecord(
+        name=f"Citizen {i}",
+        race=random.choice(RACES),
+        character_class=random.choice(CLASSES),
+        level=random.randint(1, 20),
+        alignment="True Neutral",
+        size="Medium",
+        speed=30,
+        traits=("Darkvision", "Fey Ancestry"),
+        languages="Common, Elvish",
+        magic_items=(("bag-of-holding", "Bag of Holding"),),
+        ability_scores=bytes(random.randint(8, 18) for _ in range(6)),
+        armor_class=random.randint(10, 18),
+        hit_points=random.randint(6, 200),
+        passive_perception=random.randint(8, 14),
+        attack_modifier=random.randint(-1, 11),
+        spell_attack_modifier=random.randint(-1, 11),
+        spell_save=random.randint(7, 19),
+    )
+
+
+# Function to time fn over enough repeats to get a stable number, returns seconds per call
+def time_call(fn, min_seconds=0.2):
+    repeats = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        repeats += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / repeats
+
+
+def main():
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    random.seed(0)
+    town = TownRecord("Oak's Keep", "Town", 1200, 0, "A quiet town.", "Founded long ago.", "https://example.invalid/town.png")
+
+    print(f"{'NPCs':>8} {'cold ms':>10} {'warm ms':>10} {'us/NPC cold':>12} {'KB':>8}")
+    count = 10
+    while count <= max_count:
+        npcs = [make_npc(i) for i in range(count)]
+
+        def cold():
+            clear_tile_caches()
+            return render_settlement(render_town_tile(town), [render_npc_tile(npc) for npc in npcs])
+
+        def warm():
+            return render_settlement(render_town_tile(town), [render_npc_tile(npc) for npc in npcs])
+
+        cold_seconds = time_call(cold)
+        warm()
+        warm_seconds = time_call(warm)
+        size_kb = len(warm()) / 1024
+        print(f"{count:>8} {cold_seconds * 1000:>10.2f} {warm_seconds * 1000:>10.2f} {cold_seconds / count * 1e6:>12.1f} {size_kb:>8.0f}")
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
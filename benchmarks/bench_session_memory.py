@@ -0,0 +1,138 @@
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Memory held by one website session: the old layout (rendered tiles plus raw and parsed quests)
+# against the records the session keeps now, the size of the binary session snapshot, and what a full citizen roster
+# would add to every session if it were kept there instead of only its key (the app shares rosters, see get_roster)
+# NPCs are built by the generator from the bundled SRD snapshot, so nothing touches the network
+#   python benchmarks/bench_session_memory.py [sessions] [quests per session]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["INSPIRAITION_OFFLINE"] = "1"
+os.environ["INSPIRAITION_NAME_SOURCE"] = "local"
+
+import generator
+from quest_parser import parse_quest, quest_title
+from records import NPCRecord, NPCTable, StoredQuest, TownRecord, session_to_bytes
+from tile_renderer import clear_tile_caches, render_npc_tile, render_town_tile
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quest_corpus.jsonl")
+
+SETTLEMENT_SIZE = "Metropolis"
+
+
+def load_corpus():
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        return [json.loads(line)["quest_text"] for line in f if line.strip()]
+
+
+def make_town(i):
+    return TownRecord(
+        name=f"Oak's Keep {i}",
+        size=SETTLEMENT_SIZE,
+        population=random.randint(30000, 150000),
+        unique_characters=20,
+        description=" ".join(["The mist rolls in off the river every morning and the markets are loud."] * 4),
+        history=" ".join(["Dwarven bridge builders founded the town two centuries ago."] * 3),
+        image_url=f"https://example.invalid/town-{i}.png",
+        notable_locations=("The Old Stone Bridge", "Lamplighters' Guildhall"),
+    )
+
+
+def make_characters():
+    character_seeds, level_range = generator.generate_characters(SETTLEMENT_SIZE)
+    characters, _ = generator.build_characters(character_seeds, level_range, max_workers=1)
+    return characters
+
+
+# Function to build the records of a session the way the app does after generating it
+# Names are copied so every session owns its strings, like freshly generated ones
+def make_records(i, characters):
+    npcs = [NPCRecord.from_character_info(dict(c, name=c["name"].encode().decode())) for c in characters]
+    return make_town(i), npcs
+
+
+# What a session used to hold: town and NPC tiles as HTML and every quest as raw text, parsed record and title
+# The tiles are copies of the cached ones so no two sessions share a string, like separate renders
+def old_session(i, characters, quest_texts):
+    town, npcs = make_records(i, characters)
+    quests = []
+    for quest_text in quest_texts:
+        quest = parse_quest(quest_text.encode().decode())
+        quests.append({"quest_text": quest_text.encode().decode(), "quest": quest, "title": quest_title(quest)})
+    return {
+        "town_tile": render_town_tile(town).encode().decode(),
+        "character_tiles": [render_npc_tile(npc).encode().decode() for npc in npcs],
+        "character_data": [npc.prompt_entry() for npc in npcs],
+        "quests": quests,
+        "tab_titles": [quest["title"] for quest in quests],
+    }
+
+
+# What a session holds now: the town record, an NPCTable, the compressed quest texts and the key of its roster
+def new_session(i, characters, quest_texts):
+    town, npcs = make_records(i, characters)
+    quests = [StoredQuest.from_text(quest_text) for quest_text in quest_texts]
+    return {
+        "town": town,
+        "npcs": NPCTable(npcs),
+        "quests": quests,
+        "tab_titles": [quest_title(parse_quest(quest_text)) for quest_text in quest_texts],
+        "roster_key": (town.size, town.population, town.unique_characters, random.randrange(2 ** 32)),
+    }
+
+
+# Function to measure the bytes allocated by build() for every session and kept alive afterwards
+def measure(build, inputs):
+    clear_tile_caches()
+    # Render once outside the measurement, the tile caches are shared by all sessions
+    for i, characters, _ in inputs:
+        town, npcs = make_records(i, characters)
+        render_town_tile(town)
+        for npc in npcs:
+            render_npc_tile(npc)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    sessions = [build(*session_inputs) for session_inputs in inputs]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / len(sessions), sessions
+
+
+def main():
+    session_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    quest_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    random.seed(0)
+    corpus = load_corpus()
+    inputs = [(i, make_characters(), random.sample(corpus, quest_count)) for i in range(session_count)]
+
+    old_bytes, _ = measure(old_session, inputs)
+    new_bytes, sessions = measure(new_session, inputs)
+    snapshot = session_to_bytes(sessions[0]["town"], sessions[0]["npcs"], sessions[0]["quests"], sessions[0]["tab_titles"])
+
+    npc_count = sum(len(characters) for _, characters, _ in inputs) / session_count
+    print(f"{session_count} sessions ({SETTLEMENT_SIZE}), {npc_count:.1f} NPCs and {quest_count} quests each")
+    print(f"old layout  {old_bytes / 1024:8.1f} KB per session")
+    print(f"records     {new_bytes / 1024:8.1f} KB per session ({old_bytes / new_bytes:.1f}x smaller)")
+    print(f"snapshot    {len(snapshot) / 1024:8.1f} KB")
+
+    # A small roster first, so loading the SRD catalog and the name models isn't counted
+    generator.generate_settlement_roster(SETTLEMENT_SIZE, 100, 20, seed=1)
+    tracemalloc.start()
+    start = time.perf_counter()
+    roster = generator.generate_settlement_roster(SETTLEMENT_SIZE, 150_000, 20, seed=0)
+    seconds = time.perf_counter() - start
+    roster_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"roster      {roster_bytes / 1024:8.1f} KB for {len(roster):,} citizens ({roster_bytes / max(1, len(roster)):.0f} bytes each), "
+          f"built in {seconds:.2f}s, shared by every session with the same key")
+    print(f"records with the roster in the session {(new_bytes + roster_bytes) / 1024:8.1f} KB per session "
+          f"({(new_bytes + roster_bytes) / new_bytes:.0f}x the records with its key)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+# stat_engine against the per-NPC functions in generator.py: first a seeded check that a batch gets the same
+# stats the scalar functions give for the same races, classes, levels and rolls, then NPCs per second of both
+#   python benchmarks/bench_stat_engine.py --count 20000 --seed 0
+# Exits with status 1 if any NPC differs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["INSPIRAITION_OFFLINE"] = "1"
+
+import generator
+import stat_engine
+
+# "Unknown" isn't in either table, so the default rows get checked too
+RACE_NAMES = stat_engine.RACES + ["Unknown"]
+CLASS_NAMES = stat_engine.CLASSES + ["Unknown"]
+
+
+# Function to get the stats the scalar functions give for one NPC of the batch, from its final ability scores
+def scalar_stats(character_class, level, ability_scores):
+    attack_modifier, spell_attack_modifier, spell_save = generator.calculate_combat_modifiers(character_class, level, ability_scores)
+    return {
+        "ability_scores": ability_scores,
+        "passive_perception": generator.calculate_passive_perception(ability_scores["Wisdom"]),
+        "armor_class": generator.calculate_armor_class(character_class, ability_scores["Dexterity"]),
+        "hit_points": generator.calculate_hit_points(character_class, level, ability_scores["Constitution"]),
+        "attack_modifier": attack_modifier,
+        "spell_attack_modifier": spell_attack_modifier,
+        "spell_save": spell_save,
+    }
+
+
+# Function to compare a seeded batch with the scalar functions, returns a list of (row, what differs)
+def check_batch(count, seed):
+    rng = np.random.default_rng(seed)
+    races = stat_engine.race_codes(RACE_NAMES)[rng.integers(0, len(RACE_NAMES), size=count)]
+    classes = stat_engine.class_codes(CLASS_NAMES)[rng.integers(0, len(CLASS_NAMES), size=count)]
+    levels = rng.integers(1, 21, size=count, dtype=np.int16)
+
+    # The same steps as stat_engine.generate_stats, keeping the scores from before the racial bonuses
+    rolled = stat_engine.generate_ability_scores(classes, rng)
+    bonused = stat_engine.apply_racial_bonuses(races, rolled.copy(), rng)
+    batch = stat_engine.StatBatch(races, classes, levels, bonused)
+
+    mismatches = []
+    for i in range(count):
+        race, character_class, level = RACE_NAMES[races[i]], CLASS_NAMES[classes[i]], int(levels[i])
+        before = {ability: int(rolled[i, j]) for j, ability in enumerate(stat_engine.ABILITIES)}
+        after = batch.row(i)["ability_scores"]
+
+        if race == "Half-Elf":
+            # The scalar version draws its two extra +1s from random, so check the shape: +1 Charisma and +1 to two others
+            bonuses = [after[ability] - before[ability] for ability in stat_engine.ABILITIES if ability != "Charisma"]
+            matches = after["Charisma"] - before["Charisma"] == 1 and sorted(bonuses) == [0, 0, 0, 1, 1]
+        else:
+            expected = dict(before)
+            generator.apply_racial_bonuses(race, expected)
+            matches = after == expected
+        if not matches:
+            mismatches.append((i, f"{race} ability scores {before} became {after}"))
+            continue
+
+        row = batch.row(i)
+        for field, value in scalar_stats(character_class, level, after).items():
+            if row[field] != value:
+                mismatches.append((i, f"{race} {character_class} {level} {field} {row[field]}, expected {value}"))
+    return mismatches
+
+
+# Function to check that every class puts its highest roll where generator.generate_ability_scores puts it
+def check_primary_abilities(samples, seed):
+    random.seed(seed)
+    mismatches = []
+    for code, character_class in enumerate(CLASS_NAMES):
+        # Abilities that held the highest score in every sample, ties can add others but never remove the primary
+        always_highest = set(stat_engine.ABILITIES)
+        for _ in range(samples):
+            scores = generator.generate_ability_scores(character_class)
+            always_highest &= {ability for ability, score in scores.items() if score == max(scores.values())}
+        primary = stat_engine.ABILITIES[stat_engine.CLASS_PRIMARY[code]]
+        if primary not in always_highest:
+            mismatches.append((character_class, f"primary ability {primary}, scalar puts the highest roll in {sorted(always_highest)}"))
+    return mismatches
+
+
+# Function to generate count NPCs one at a time with the scalar functions, the way assign_race_class_level does
+def scalar_population(count, level_range):
+    stats = []
+    for _ in range(count):
+        race, character_class = random.choice(stat_engine.RACES), random.choice(stat_engine.CLASSES)
+        level = random.randint(*level_range)
+        ability_scores = generator.generate_ability_scores(character_class)
+        generator.apply_racial_bonuses(race, ability_scores)
+        stats.append(scalar_stats(character_class, level, ability_scores))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check stat_engine against the scalar stat functions and time both.")
+    parser.add_argument("--count", type=int, default=20_000, help="NPCs in the checked batch")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the checked batch")
+    parser.add_argument("--timing-count", type=int, default=100_000, help="NPCs generated for the timing")
+    args = parser.parse_args()
+
+    mismatches = check_batch(args.count, args.seed) + check_primary_abilities(200, args.seed)
+    for where, what in mismatches[:20]:
+        print(f"mismatch at {where}: {what}")
+    print(f"checked {args.count} NPCs (seed {args.seed}) and {len(CLASS_NAMES)} class primaries: {len(mismatches)} mismatches")
+
+    random.seed(args.seed)
+    scalar_count = max(1, args.timing_count // 10)
+    start = time.perf_counter()
+    scalar_population(scalar_count, (1, 20))
+    scalar_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    stat_engine.generate_population(args.timing_count, (1, 20), np.random.default_rng(args.seed))
+    batch_seconds = time.perf_counter() - start
+    print(f"scalar: {scalar_count / scalar_seconds:>12,.0f} NPCs/s ({scalar_count} NPCs)")
+    print(f"batch:  {args.timing_count / batch_seconds:>12,.0f} NPCs/s ({args.timing_count} NPCs)")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Local stand-ins for the D&D 5e API, randomuser.me and OpenAI, all served by one HTTP server:
+#   /srd/api/...           D&D 5e API, answered from the bundled SRD snapshot (data/srd_snapshot.json)
+#   /randomuser/api/       randomuser.me, answered from fixtures/randomuser.json
+#   /openai/v1/...         chat completions (plain, JSON schema and streamed) and image generations
+#   /images/<name>.png     the "DALL-E" images the image stub hands out
+# Every service gets its own latency and error rate, see ServiceConfig
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+SRD_SNAPSHOT_PATH = os.path.join(REPO_DIR, "data", "srd_snapshot.json")
+RANDOMUSER_FIXTURE_PATH = os.path.join(BENCHMARK_DIR, "fixtures", "randomuser.json")
+QUEST_CORPUS_PATH = os.path.join(BENCHMARK_DIR, "quest_corpus.jsonl")
+
+SERVICES = ("srd", "randomuser", "openai", "images")
+
+TOWN_LORE = {
+    "description": "A river town of slate roofs and smoky chimneys, where the mist off the water never quite lifts. The market by the old stone bridge is loud from dawn and the lamplighters' guild keeps the lanterns burning all night.",
+    "history": "The town was founded two centuries ago by dwarven bridge builders who stayed once the bridge was done. It grew rich on river tolls. Every spring the townsfolk still race paper boats under the bridge in the builders' honour.",
+    "notable_locations": ["The Old Stone Bridge", "Lamplighters' Guildhall", "The Drowned Lantern tavern"],
+}
+TOWN_TEXT = "A quiet town of crooked streets and crowded markets, wrapped in river mist most mornings."
+
+
+class ServiceConfig:
+    # latency_ms is the mean delay of every response, jitter_ms is added on top uniformly at random
+    # error_rate is the chance of answering 500 (or 429 with Retry-After for OpenAI)
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self):
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+
+# Function to build a small PNG without Pillow, a vertical gradient so the image store has something to resize
+def gradient_png(width=256, height=448):
+    rows = b"".join(
+        b"\x00" + bytes((40 + 120 * y // height, 90, 160 - 100 * y // height)) * width
+        for y in range(height)
+    )
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 6)) + chunk(b"IEND", b"")
+
+
+class StubServices:
+    def __init__(self, configs=None, stream_chunk_chars=24, stream_chunk_ms=5.0):
+        self.configs = {service: ServiceConfig() for service in SERVICES}
+        self.configs.update(configs or {})
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_ms = stream_chunk_ms
+        self._lock = threading.Lock()
+        self.calls = {service: 0 for service in SERVICES}
+        self.errors = {service: 0 for service in SERVICES}
+
+        with open(SRD_SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            self.srd = json.load(f)
+        self.magic_items = {item["index"]: item for item in self.srd["magic_items"]}
+        with open(RANDOMUSER_FIXTURE_PATH, "r", encoding="utf-8") as f:
+            self.randomusers = json.load(f)["results"]
+        with open(QUEST_CORPUS_PATH, "r", encoding="utf-8") as f:
+            self.quests = [json.loads(line)["quest_text"] for line in f if line.strip()]
+        self._next_quest = 0
+        self.image = gradient_png()
+
+    def count(self, service, error=False):
+        with self._lock:
+            self.calls[service] += 1
+            if error:
+                self.errors[service] += 1
+
+    def reset_counts(self):
+        with self._lock:
+            for service in SERVICES:
+                self.calls[service] = 0
+                self.errors[service] = 0
+
+    def counts(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors)}
+
+    def next_quest(self):
+        with self._lock:
+            quest = self.quests[self._next_quest % len(self.quests)]
+            self._next_quest += 1
+        return quest
+
+    # Function to answer a D&D 5e API path, returns None for unknown resources
+    def srd_response(self, path):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["races"]:
+            return {"count": len(self.srd["races"]), "results": self.srd["races"]}
+        if parts == ["classes"]:
+            return {"count": len(self.srd["classes"]), "results": self.srd["classes"]}
+        if parts == ["magic-items"]:
+            results = [{"index": item["index"], "name": item["name"], "url": item["url"]} for item in self.srd["magic_items"]]
+            return {"count": len(results), "results": results}
+        if len(parts) == 2 and parts[0] == "races":
+            return self.srd["race_details"].get(parts[1])
+        if len(parts) == 2 and parts[0] == "magic-items":
+            item = self.magic_items.get(parts[1])
+            if item is None:
+                return None
+            # Same shape as the real API, minus the description text
+            return {
+                "index": item["index"],
+                "name": item["name"],
+                "equipment_category": {"index": item["category"].lower().replace(" ", "-"), "name": item["category"]},
+                "rarity": {"name": item["rarity"]},
+                "variants": [],
+                "variant": False,
+                "url": item["url"],
+            }
+        return None
+
+    def randomuser_response(self, count):
+        results = [dict(self.randomusers[i % len(self.randomusers)]) for i in range(count)]
+        return {"results": results, "info": {"seed": "stub", "results": count, "page": 1, "version": "1.4"}}
+
+    # Function to pick the text a chat request gets, based on what the generator asked for
+    def chat_content(self, body):
+        if body.get("response_format"):
+            return json.dumps(TOWN_LORE)
+        system = body["messages"][0]["content"] if body.get("messages") else ""
+        if "Quest Title" in system:
+            return self.next_quest()
+        return TOWN_TEXT
+
+
+def _usage(body, content):
+    prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def services(self):
+        return self.server.services
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Function to apply the latency and maybe inject an error, returns True when the request was failed
+    def _simulate(self, service):
+        config = self.services.configs[service]
+        time.sleep(config.delay())
+        failed = random.random() < config.error_rate
+        self.services.count(service, failed)
+        if failed:
+            if service == "openai":
+                self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}}, [("Retry-After", "0.2")])
+            else:
+                self._send_json(500, {"error": "Injected failure"})
+        return failed
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/srd/api"):
+            if self._simulate("srd"):
+                return
+            payload = self.services.srd_response(url.path[len("/srd/api"):])
+            if payload is None:
+                self._send_json(404, {"error": "Not found"})
+            else:
+                self._send_json(200, payload)
+        elif url.path.startswith("/randomuser/api"):
+            if self._simulate("randomuser"):
+                return
+            count = int(parse_qs(url.query).get("results", ["1"])[0])
+            self._send_json(200, self.services.randomuser_response(count))
+        elif url.path.startswith("/images/"):
+            if self._simulate("images"):
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(self.services.image)))
+            self.end_headers()
+            self.wfile.write(self.services.image)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if url.path == "/openai/v1/chat/completions":
+            if self._simulate("openai"):
+                return
+            content = self.services.chat_content(body)
+            if body.get("stream"):
+                self._stream_chat(body, content)
+            else:
+                self._send_json(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o-mini"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content, "refusal": None}, "logprobs": None, "finish_reason": "stop"}],
+                    "usage": _usage(body, content),
+                })
+        elif url.path == "/openai/v1/images/generations":
+            if self._simulate("openai"):
+                return
+            host = self.headers.get("Host")
+            self._send_json(200, {"created": int(time.time()), "data": [{"url": f"http://{host}/images/town-{random.getrandbits(48):012x}.png", "revised_prompt": None}]})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    # Server-sent events the way the OpenAI API streams, the usage chunk last when include_usage is set
+    def _stream_chat(self, body, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "gpt-4o-mini")}
+        size = self.services.stream_chunk_chars
+        for start in range(0, len(content), size):
+            time.sleep(self.services.stream_chunk_ms / 1000)
+            send(json.dumps(dict(base, choices=[{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}])))
+        send(json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send(json.dumps(dict(base, choices=[], usage=_usage(body, content))))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubServer:
+    def __init__(self, services=None, host="127.0.0.1", port=0):
+        self.services = services or StubServices()
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.services = self.services
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Environment variables that point the generator at this server, set them before importing generator
+    def environ(self):
+        return {
+            "INSPIRAITION_SRD_API_URL": f"{self.base_url}/srd/api",
+            "INSPIRAITION_RANDOMUSER_URL": f"{self.base_url}/randomuser/api/",
+            "OPENAI_BASE_URL": f"{self.base_url}/openai/v1",
+            "OPENAI_API_KEY": "sk-stub",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    server = StubServer(port=int(os.environ.get("STUB_PORT", 8765))).start()
+    for name, value in server.environ().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,405 @@
+import argparse
+import base64
+import html
+import io
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from functools import partial
+
+from PIL import Image
+
+import image_store
+from pdf_writer import PAGE_HEIGHT, PAGE_WIDTH, PdfImage, PdfPage, PdfWriter, pdf_string, text_width
+from quest_parser import parse_quest
+from records import ABILITIES, NPCRecord, TownRecord, calculate_modifier, session_from_bytes
+from tile_renderer import TILE_STYLES, format_bonus, render_npc_tile, render_quest_tile, render_town_tile
+
+# Exports whole campaigns (settlements with their NPCs and quests) to PDF or standalone HTML, e.g.
+#   python campaign_export.py towns.jsonl --output campaign.pdf --workers 4
+#   python campaign_export.py towns.jsonl "Oak's Keep.inspiraition" --output campaign.html
+# Input is batch_generate.py JSONL output and session snapshots saved from the website
+# Settlements are rendered in a process pool and written out in order as they finish, with only a few in flight,
+# so memory stays flat however big the campaign is. Town art comes from the local image store (see image_store.py)
+
+# Width of the stored image variant that goes into exports
+EXPORT_IMAGE_WIDTH = 768
+JPEG_QUALITY = 85
+
+MARGIN = 54
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+BLACK = (0, 0, 0)
+RED = (0.655, 0.2, 0.208)  # #A73335, the tiles' accent color
+LINE_SPACING = 1.25
+# Room kept below a section heading for the first lines of the section
+HEADING_KEEP = 60
+# Where keep_together's dry runs start, high enough that they never need a second page
+_TRIAL_TOP = 1e9
+
+EXPORT_CSS = """
+<style>
+body { max-width: 1100px; margin: 0 auto; padding: 20px; }
+.export-settlement { margin-bottom: 40px; }
+.export-npcs { display: flex; flex-wrap: wrap; gap: 10px; justify-content: center; margin-bottom: 20px; }
+.export-npcs .character-tile { min-width: 40%; max-width: 40%; margin-right: 0; }
+@media print { .export-settlement { page-break-before: always; } .character-tile, .quest-tile { page-break-inside: avoid; } }
+</style>
+"""
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_BREAK_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+# Function to turn the sanitized HTML of quest sections back into plain text
+def html_to_text(markup):
+    return html.unescape(_TAG_RE.sub("", _BREAK_RE.sub("\n", markup))).strip()
+
+
+# Function to turn a settlement dict (generator.generate_settlement, one line of batch_generate.py output) into records
+def settlement_records(settlement):
+    town = TownRecord(
+        name=settlement["name"],
+        size=settlement["size"],
+        population=settlement["population"],
+        unique_characters=settlement["unique_characters"],
+        description=settlement.get("description", ""),
+        history=settlement.get("history", ""),
+        notable_locations=tuple(settlement.get("notable_locations", ())),
+        image_url=settlement.get("image_url") or "",
+        image_id=settlement.get("image_id") or "",
+    )
+    npcs = tuple(NPCRecord.from_character_info(character_info) for character_info in settlement.get("npcs", []))
+    quests = tuple(parse_quest(quest["quest_text"]) for quest in settlement.get("quests", []))
+    return town, npcs, quests
+
+
+# Function to read (town, npcs, quests) records from JSONL files and session snapshots, one settlement at a time
+def read_settlements(paths):
+    for path in paths:
+        if path.endswith(".inspiraition"):
+            with open(path, "rb") as f:
+                town, npcs, quests, _ = session_from_bytes(f.read())
+            if town is not None:
+                yield town, tuple(npcs), tuple(parse_quest(quest.text) for quest in quests)
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                settlement = json.loads(line)
+                # Failed settlements from batch_generate.py only carry the error
+                if "error" not in settlement:
+                    yield settlement_records(settlement)
+
+
+# Function to find the locally stored copy of a town's image, downloading it into the store first if allowed
+def town_image_file(town, fetch_images):
+    image_id = town.image_id
+    if not image_id and fetch_images and (town.image_url or "").startswith("http"):
+        image_id = image_store.store_image(town.image_url)
+    if image_id and image_store.has_image(image_id):
+        return image_store.variant_file(image_id, EXPORT_IMAGE_WIDTH)
+    return None
+
+
+# Function to render one settlement as an HTML section
+# The tiles are rendered with the uncached functions, exports would only churn the website's tile caches
+def render_settlement_html(records, images=True, fetch_images=False):
+    town, npcs, quests = records
+    image_file = town_image_file(town, fetch_images) if images else None
+    if image_file is not None:
+        with open(image_file, "rb") as f:
+            town = replace(town, image_id="", image_url="data:image/webp;base64," + base64.b64encode(f.read()).decode("ascii"))
+    else:
+        town = replace(town, image_id="")
+    pieces = ['<section class="export-settlement">', render_town_tile.__wrapped__(town), '<div class="export-npcs">']
+    pieces += [render_npc_tile.__wrapped__(npc) for npc in npcs]
+    pieces.append("</div>")
+    pieces += [render_quest_tile.__wrapped__(quest) for quest in quests]
+    pieces.append("</section>\n")
+    return "".join(pieces)
+
+
+# Lays text, rules and images out top to bottom on US Letter pages, starting a new page whenever one is full
+class PageLayout:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.pages = []
+        self.ops = []
+        self.images = {}
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def new_page(self):
+        if self.ops and not self.dry_run:
+            self.pages.append(PdfPage(b"\n".join(self.ops), self.images))
+        self.ops = []
+        self.images = {}
+        self.y = PAGE_HEIGHT - MARGIN
+
+    # Function to make sure the next height points fit on the page, a page that is still empty is never skipped
+    def ensure(self, height):
+        if self.y - height < MARGIN and self.ops:
+            self.new_page()
+
+    def space(self, points):
+        self.y -= points
+
+    def _draw_text(self, x, text, font, size, color):
+        self.ops.append(b"BT /%s %g Tf %g %g %g rg %g %g Td " % (font.encode("ascii"), size, *color, x, self.y) + pdf_string(text) + b" Tj ET")
+
+    # Function to write wrapped text, label (in bold) starts the first line
+    def text(self, text, font="F1", size=10, color=BLACK, label=None):
+        leading = size * LINE_SPACING
+        label_width = text_width(label, "F2", size) if label else 0
+        for i, paragraph in enumerate(str(text).split("\n") or [""]):
+            first = label is not None and i == 0
+            for line, offset in self._wrap(paragraph, font, size, label_width if first else 0):
+                self.ensure(leading)
+                self.y -= leading
+                if first:
+                    self._draw_text(MARGIN, label, "F2", size, color)
+                    first = False
+                if line:
+                    self._draw_text(MARGIN + offset, line, font, size, color)
+
+    def _wrap(self, text, font, size, first_offset):
+        lines = []
+        line = ""
+        offset = first_offset
+        for word in text.split():
+            candidate = f"{line} {word}" if line else word
+            if line and offset + text_width(candidate, font, size) > CONTENT_WIDTH:
+                lines.append((line, offset))
+                line, offset = word, 0
+            else:
+                line = candidate
+        lines.append((line, offset))
+        return lines
+
+    def rule(self, thickness=2, color=RED):
+        self.ensure(thickness + 6)
+        self.y -= 3 + thickness
+        self.ops.append(b"%g %g %g rg %g %g %g %g re f" % (*color, MARGIN, self.y, CONTENT_WIDTH, thickness))
+        self.y -= 3
+
+    # Function to draw a row of cells spread evenly over the content width
+    def row(self, cells, font="F1", size=9, color=RED):
+        leading = size * LINE_SPACING
+        self.ensure(leading)
+        self.y -= leading
+        cell_width = CONTENT_WIDTH / len(cells)
+        for i, cell in enumerate(cells):
+            x = MARGIN + i * cell_width + (cell_width - text_width(cell, font, size)) / 2
+            self._draw_text(x, cell, font, size, color)
+
+    def image(self, image, max_height=300):
+        scale = min(CONTENT_WIDTH / image.width, max_height / image.height)
+        width, height = image.width * scale, image.height * scale
+        self.ensure(height + 6)
+        self.y -= height
+        name = f"Im{len(self.images) + 1}"
+        self.images[name] = image
+        self.ops.append(b"q %g 0 0 %g %g %g cm /%s Do Q" % (width, height, MARGIN + (CONTENT_WIDTH - width) / 2, self.y, name.encode("ascii")))
+        self.y -= 6
+
+    # Function to draw something that should stay on one page: measured on a dry run first, then drawn
+    def keep_together(self, draw, *args):
+        trial = PageLayout(dry_run=True)
+        trial.y = _TRIAL_TOP
+        draw(trial, *args)
+        self.ensure(_TRIAL_TOP - trial.y)
+        draw(self, *args)
+
+    def finish(self):
+        self.new_page()
+        return self.pages
+
+
+def load_pdf_image(path):
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=JPEG_QUALITY)
+        return PdfImage(buffer.getvalue(), image.width, image.height)
+
+
+def draw_town(layout, town, image):
+    layout.text(town.name, "F4", 24, RED)
+    layout.text(f"{town.size}, Population of {town.population}, containing {town.unique_characters} NPCs", "F3", 10)
+    layout.rule(3)
+    if image is not None:
+        layout.space(4)
+        layout.image(image)
+    if town.description:
+        layout.text(town.description, label="Description: ")
+        layout.space(6)
+    if town.history:
+        layout.text(town.history, label="History: ")
+        layout.space(6)
+    if town.notable_locations:
+        layout.text(", ".join(town.notable_locations), label="Notable Locations: ")
+
+
+# Same sections as the NPC tile
+def draw_npc(layout, npc):
+    layout.text(npc.name, "F4", 16, RED)
+    layout.text(f"{npc.race} {npc.character_class}, {npc.alignment}", "F3", 9)
+    layout.rule()
+    layout.text(npc.armor_class, size=9, color=RED, label="Armor Class ")
+    layout.text(npc.hit_points, size=9, color=RED, label="Hit Points ")
+    layout.text(f"{npc.speed} ft.", size=9, color=RED, label="Speed ")
+    layout.rule()
+    layout.row([ability[:3].upper() for ability in ABILITIES], "F2")
+    layout.row([f"{score} ({calculate_modifier(score)})" for score in npc.ability_scores])
+    layout.rule()
+    layout.text(", ".join(npc.traits), size=9, label="Traits ")
+    layout.text(npc.passive_perception, size=9, label="Passive Perception ")
+    layout.text(npc.languages, size=9, label="Languages ")
+    layout.text(npc.level, size=9, label="Level ")
+    layout.rule()
+    layout.text("Actions", "F4", 13, RED)
+    layout.rule(1)
+    layout.text(", ".join(name for _, name in npc.magic_items) or "None", size=9, label="Magic Items: ")
+    layout.text(
+        f"{format_bonus(npc.attack_modifier)}    Spell Attack Modifier: {format_bonus(npc.spell_attack_modifier)}    Spell Save: {npc.spell_save}",
+        size=9, label="Attack Modifier: ",
+    )
+    layout.space(14)
+
+
+def draw_quest(layout, quest):
+    layout.text(f"Quest: {html_to_text(quest.title)}", "F4", 18, RED)
+    layout.text(f"Quest Giver: {html_to_text(quest.giver)}", "F3", 10)
+    for heading, section in (("Quest Background", quest.background), ("Quest Stages", quest.stages),
+                             ("Possible Resolutions", quest.resolutions), ("Conclusion", quest.conclusion)):
+        layout.space(8)
+        layout.ensure(HEADING_KEEP)
+        layout.text(heading, "F4", 14, RED)
+        layout.rule(3)
+        layout.text(html_to_text(section))
+    layout.space(14)
+
+
+# Function to lay one settlement out as PDF pages: the town, its NPC stat blocks and its quests, each on new pages
+def render_settlement_pdf(records, images=True, fetch_images=False):
+    town, npcs, quests = records
+    image_file = town_image_file(town, fetch_images) if images else None
+    layout = PageLayout()
+    draw_town(layout, town, load_pdf_image(image_file) if image_file else None)
+    if npcs:
+        layout.new_page()
+        for npc in npcs:
+            layout.keep_together(draw_npc, npc)
+    for quest in quests:
+        layout.new_page()
+        draw_quest(layout, quest)
+    return layout.finish()
+
+
+class HtmlExportWriter:
+    def __init__(self, file, title="Campaign"):
+        self.file = file
+        self.pages = None
+        self.file.write(
+            f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>{TILE_STYLES}{EXPORT_CSS}</head><body>\n'.encode("utf-8")
+        )
+
+    def add(self, section):
+        self.file.write(section.encode("utf-8"))
+
+    def close(self):
+        self.file.write(b"</body></html>\n")
+
+
+class PdfExportWriter:
+    def __init__(self, file, title="Campaign"):
+        self.writer = PdfWriter(file, title)
+
+    @property
+    def pages(self):
+        return len(self.writer.page_ids)
+
+    def add(self, pages):
+        for page in pages:
+            self.writer.add_page(page)
+
+    def close(self):
+        self.writer.close()
+
+
+RENDERERS = {"pdf": (render_settlement_pdf, PdfExportWriter), "html": (render_settlement_html, HtmlExportWriter)}
+
+
+# Function to export settlements ((town, npcs, quests) records, e.g. from read_settlements) to a binary file
+# With workers > 1 settlements are rendered in that many processes, at most two per worker are in flight and
+# they are written in input order. Returns counts, the output size and the time taken
+def export(settlements, file, output_format="pdf", workers=1, images=True, fetch_images=False, title="Campaign", on_progress=None):
+    render, writer_class = RENDERERS[output_format]
+    render = partial(render, images=images, fetch_images=fetch_images)
+    writer = writer_class(file, title)
+    counts = {"settlements": 0, "npcs": 0, "quests": 0}
+    start = time.perf_counter()
+
+    def write(rendered):
+        writer.add(rendered)
+        counts["settlements"] += 1
+        if on_progress is not None:
+            on_progress(counts["settlements"])
+
+    def counted(settlements):
+        for records in settlements:
+            counts["npcs"] += len(records[1])
+            counts["quests"] += len(records[2])
+            yield records
+
+    if workers <= 1:
+        for records in counted(settlements):
+            write(render(records))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            running = deque()
+            for records in counted(settlements):
+                running.append(executor.submit(render, records))
+                if len(running) >= 2 * workers:
+                    write(running.popleft().result())
+            while running:
+                write(running.popleft().result())
+
+    writer.close()
+    return dict(counts, pages=writer.pages, bytes=file.tell(), seconds=round(time.perf_counter() - start, 3))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export settlements, NPCs and quests to PDF or standalone HTML.")
+    parser.add_argument("inputs", nargs="+", help="batch_generate.py JSONL files and .inspiraition session snapshots")
+    parser.add_argument("--output", required=True, help="output file (.pdf or .html)")
+    parser.add_argument("--format", choices=sorted(RENDERERS), help="output format, guessed from --output by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--title", default="Campaign", help="document title")
+    parser.add_argument("--no-images", action="store_true", help="leave the town art out")
+    parser.add_argument("--offline", action="store_true", help="only use images already in the local store, never download")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_format = args.format or ("html" if args.output.endswith((".html", ".htm")) else "pdf")
+    with open(args.output, "wb") as f:
+        stats = export(
+            read_settlements(args.inputs), f, output_format, args.workers, images=not args.no_images,
+            fetch_images=not args.offline, title=args.title,
+            on_progress=lambda done: print(f"\r{done} settlements", end="", file=sys.stderr),
+        )
+    pages = f"{stats['pages']} pages, " if stats["pages"] is not None else ""
+    print(f"\nExported {stats['settlements']} settlements, {stats['npcs']} NPCs and {stats['quests']} quests "
+          f"({pages}{stats['bytes'] / 1024:.0f} KB) in {stats['seconds']:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
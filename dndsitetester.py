@@ -1,465 +1,293 @@
 import streamlit as st
-import requests
-import random
 import openai
 import streamlit.components.v1 as components
-import re
-import math
+import io
 import os
+import queue
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import campaign_export
+import http_client
+import image_store
+import openai_client
+import tracing
+from quest_stream import QUEST_SECTIONS, QuestSectionParser
+from llm_cache import FRESH
+from records import NPCRecord, NPCTable, StoredQuest, TownRecord, session_from_bytes, session_to_bytes
+from quest_parser import parse_quest
+from quest_parser import quest_title as quest_title_text
+from roster import ALIGNMENTS
+from tile_renderer import render_npc_detail, render_npc_tile, render_quest_tile, render_roster_page, render_settlement, render_settlement_view, render_town_tile, render_waterfall
+from generator import (
+    settlement_sizes,
+    set_error_handler,
+    generate_settlement,
+    generate_settlement_roster,
+    generate_quest_stream,
+    roster_character_info,
+)
+from warm_pool import WARM_POOL_SIZE, WarmPool
 
 # from dotenv import load_dotenv, dotenv_values
 # load_dotenv()
 # Set your OpenAI API key
 openai.api_key = st.secrets["OPENAI_API_KEY"]
 
-# Base URL for the D&D 5e API
-api_base_url = "https://www.dnd5eapi.co/api"
-
-# Define ranges for settlement sizes
-settlement_sizes = {
-    "Thorp": (5, 7, (12, 20), (1, 3)),
-    "Village": (8, 14, (80, 200), (1, 5)),
-    "Town": (10, 16, (400, 2000), (1, 8)),
-    "City": (14, 18, (5000, 25000), (1, 15)),
-    "Metropolis": (14, 20, (30000, 150000), (1, 20))
-}
-
-# Function to fetch races from D&D API
-def get_race():
-    response = requests.get(f"{api_base_url}/races")
-    if response.status_code == 200:
-        races = response.json()
-        return races['results']
-    else:
-        st.error("Failed to fetch races.")
-        return []
-
-# Function to fetch classes from D&D API
-def get_class():
-    response = requests.get(f"{api_base_url}/classes")
-    if response.status_code == 200:
-        classes = response.json()
-        return classes['results']
-    else:
-        st.error("Failed to fetch classes.")
-        return []
-    
-def assign_languages(race):
-    if race in ["Elf", "Half-Elf"]:
-        return "Elvish"
-    elif race == "Dragonborn":
-        return "Draconic"
-    elif race == "Half-Orc":
-        return "Orc"
-    elif race == "Dwarf":
-        return "Dwarvish"
-    elif race == "Gnome":
-        return "Gnomish"
-    elif race == "Halfling":
-        return "Halfling"
-    elif race == "Tiefling":
-        return "Infernal"
-    elif race == "Human":
-        return random.choice(["Elvish", "Draconic", "Orc", "Dwarvish", "Gnomish", "Halfling", "Infernal"])
-    else:
-        return "Common"
-
-# Function to fetch all magic items from D&D API
-@st.cache_resource  # Cache the response to avoid making multiple requests
-def get_magic_items():
-    response = requests.get(f"{api_base_url}/magic-items")
-    if response.status_code == 200:
-        items = response.json()
-        return items['results']
-    else:
-        st.error("Failed to fetch magic items.")
-        return []
-
-# Function to generate random names from randomuser.me API
-def generate_names(number_of_names):
-    response = requests.get(f"https://randomuser.me/api/?results={number_of_names}&nat=us")
-    if response.status_code == 200:
-        users = response.json()['results']
-        names = [f"{user['name']['first']} {user['name']['last']}" for user in users]
-        return names
-    else:
-        st.error("Failed to generate names.")
-        return []
-
-# Function to generate a random name
-def generate_random_name():
-    first_names = ["Oak", "River", "Stone", "Wind", "Bright", "Shadow", "Golden", "Silver", "Wolf", "Dragon", "Ogre", "Stag", "Bear", "Eagle", "Raven", "Lion", "Tiger", "Fox", "Hawk", "Snake", "Badger", "Boar", "Deer", "Elk", "Falcon", "Horse", "Moose", "Owl", "Beholder", "Rat", "Shark", "Sparrow", "Swan", "Whale", "Wolf", "Bat", "Bee", "Hare", "Hawk", "Jaguar", "Koala", "Leopard", "Lizard", "Scorpion", "Spider"]
-    return random.choice(first_names)
-
-# Function to generate a random settlement name based on different conventions
-def generate_settlement_name(custom_name):
-    if custom_name:
-        return custom_name
-
-    convention = random.choice([1, 2])
-    X = generate_random_name()
-
-    if convention == 1:
-        Y = random.choice(["Creek", "Divide", "Hill", "Burgh", "Hub", "Keep", "Fell", "Shire", "Haven", "Crossing", "Watch", "Gate", "Moor", "Field", "Glen", "Dale", "Wood", "Wick", "Wold"])
-        return f"{X}'s {Y}"
-    elif convention == 2:
-        Y = random.choice(["polis", "ville", "vale", "ton", "stead", "ford", "burg", "borough", "ville", "field", "shire", "wood", "wick", "wold", "dale", "glen", "moor", "gate", "watch", "cross", "haven", "keep", "hub", "burgh", "divide", "creek"])
-        return f"{X}-{Y}"
-    else:
-        words = ["Oak", "River", "Stone", "Wind", "Bright", "Shadow", "Golden", "Silver", "Wolf", "Dragon", "Ogre", "Stag", "Bear", "Eagle", "Raven", "Lion", "Tiger", "Fox", "Hawk", "Snake", "Badger", "Boar", "Deer", "Elk", "Falcon", "Horse", "Moose", "Owl", "Beholder", "Rat", "Shark", "Sparrow", "Swan", "Whale", "Wolf", "Bat", "Bee", "Hare", "Hawk", "Jaguar", "Koala", "Leopard", "Lizard", "Scorpion", "Spider"]
-        return f"{random.choice(words)} {random.choice(words)}"
-
-# Function to generate a random population based on settlement size
-def generate_population(settlement_size):
-    min_pop, max_pop = settlement_size[2]
-    if max_pop <= 200:
-        return random.randint(min_pop, max_pop)
-    elif max_pop <= 2000:
-        return random.randint(min_pop // 10, max_pop // 10) * 10
-    else:
-        return random.randint(min_pop // 100, max_pop // 100) * 100
-
-# Function to assign race, class, level, and magic items to a character
-def assign_race_class_level(character_name, level_range):
-    race = random.choice(get_race())
-    character_class = random.choice(get_class())
-    level = random.randint(*level_range)
-    magic_items = get_magic_items_based_on_level(level)
-    magic_items_list = ', '.join(
-        [f"<a href='https://dnd5e.wikidot.com/wondrous-items:{item['name'].replace(' ', '-').lower()}' style='color:#A73335;'>{item['name']}</a>" 
-        for item in magic_items]) if magic_items else "None"
-
-    # Fetch race details
-    race_details = get_race_details(race['index'])
-    size = race_details['size']
-    speed = race_details['speed']
-    traits = [trait['name'] for trait in race_details['traits']]
-
-    alignment = generate_alignment()
-
-    ability_scores = generate_ability_scores(character_class['name'])
-    apply_racial_bonuses(race['name'], ability_scores)
-
-    languages = f"Common, {assign_languages(race['name'])}"
-
-    return {
-        "name": character_name,
-        "race": race['name'],
-        "class": character_class['name'],
-        "level": level,
-        "magic_items": magic_items_list,
-        "size": size,
-        "speed": speed,
-        "traits": traits,
-        "alignment": alignment,
-        "ability_scores": ability_scores,
-        "passive_perception": calculate_passive_perception(ability_scores['Wisdom']),
-        "armor_class": calculate_armor_class(character_class['name'], ability_scores['Dexterity']),
-        "hit_points": calculate_hit_points(character_class['name'], level, ability_scores['Constitution']),
-        "languages": languages
-    }
-
-# Function to fetch race details from D&D API
-def get_race_details(race_index):
-    response = requests.get(f"{api_base_url}/races/{race_index}")
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Failed to fetch race details.")
-        return {}
-
-# Function to get magic items based on character level
-def get_magic_items_based_on_level(level):
-    items = get_magic_items()
-    if not items:
-        return []
-
-    if 3 <= level <= 5:
-        count = random.randint(0, 1)
-    elif 6 <= level <= 10:
-        count = random.randint(1, 2)
-    elif 11 <= level <= 15:
-        count = random.randint(1, 3)
-    elif 16 <= level <= 18:
-        count = random.randint(3, 5)
-    elif 19 <= level <= 20:
-        count = random.randint(4, 8)
-    else:
-        count = 0
-
-    return random.sample(items, min(count, len(items)))
-
-# Function to generate characters based on settlement size
-def generate_characters(settlement_size):
-    min_names, max_names, _, level_range = settlement_sizes[settlement_size]
-    number_of_names = random.randint(min_names, max_names)
-    return generate_names(number_of_names), level_range
-
-# Function to generate a random alignment
-def generate_alignment():
-    X = random.choice(["Lawful", "Neutral", "Chaotic"])
-    Y = random.choice(["Good", "Neutral", "Evil"])
-    if X == "Neutral" and Y == "Neutral":
-        return "True Neutral"
-    else:
-        return f"{X} {Y}"
-
-# Function to generate ability scores based on the character's class
-def generate_ability_scores(character_class):
-    def roll_dice():
-        rolls = sorted([random.randint(1, 6) for _ in range(4)])
-        return sum(rolls[1:])  # sum of the highest 3 rolls
-
-    # Generate 6 roll values
-    asi_array = [roll_dice() for _ in range(6)]
-    asi_array.sort(reverse=True)  # Sort in descending order for easy assignment
-
-    # Mapping for highest ability score by class
-    class_mapping = {
-        "Cleric": "Wisdom",
-        "Druid": "Wisdom",
-        "Ranger": "Wisdom",
-        "Bard": "Charisma",
-        "Paladin": "Charisma",
-        "Sorcerer": "Charisma",
-        "Warlock": "Charisma",
-        "Barbarian": "Strength",
-        "Fighter": "Strength",
-        "Monk": "Dexterity",
-        "Rogue": "Dexterity",
-        "Wizard": "Intelligence",
-        "Artificer": "Intelligence"
-    }
-
-    # Get the primary ability for the class
-    primary_ability = class_mapping.get(character_class, "Strength")
-
-    # Create a dictionary to hold ability scores
-    ability_scores = {
-        "Strength": 0,
-        "Dexterity": 0,
-        "Constitution": 0,
-        "Intelligence": 0,
-        "Wisdom": 0,
-        "Charisma": 0
-    }
-
-    # Assign the highest roll to the primary ability
-    ability_scores[primary_ability] = asi_array[0]
-
-    # Assign the remaining 5 values to the other abilities randomly
-    remaining_abilities = [key for key in ability_scores if key != primary_ability]
-    random.shuffle(remaining_abilities)
-    for i, ability in enumerate(remaining_abilities):
-        ability_scores[ability] = asi_array[i + 1]
-
-    return ability_scores
-
-# Function to apply racial bonuses to ability scores
-def apply_racial_bonuses(race, ability_scores):
-    if race == "Human":
-        for key in ability_scores:
-            ability_scores[key] += 1
-    elif race == "Half-Elf":
-        ability_scores["Charisma"] += 1
-        random_keys = random.sample([key for key in ability_scores if key != "Charisma"], 2)
-        for key in random_keys:
-            ability_scores[key] += 1
-    elif race == "Elf":
-        ability_scores["Dexterity"] += 2
-    elif race == "Half-Orc":
-        ability_scores["Strength"] += 2
-        ability_scores["Constitution"] += 1
-    elif race == "Dragonborn":
-        ability_scores["Strength"] += 2
-        ability_scores["Charisma"] += 1
-    elif race == "Dwarf":
-        ability_scores["Constitution"] += 2
-    elif race == "Gnome":
-        ability_scores["Intelligence"] += 2
-    elif race == "Halfling":
-        ability_scores["Dexterity"] += 2
-    elif race == "Tiefling":
-        ability_scores["Charisma"] += 2
-
-
-# Function to calculate the ability modifier
-def calculate_modifier(score):
-    modifier = (score - 10) // 2
-    sign = '+' if modifier > 0 else ''
-    return f"{sign}{modifier}"
-
-def calculate_modifier_value(score):
-    return (score - 10) // 2
-
-# Function to calculate passive perception
-def calculate_passive_perception(wisdom_score):
-    return 10 + (wisdom_score - 10) // 2
-
-# Function to calculate armor class
-def calculate_armor_class(character_class, dexterity_score):
-    dex_mod = (dexterity_score - 10) // 2
-    if character_class in ["Wizard", "Monk", "Sorcerer"]:
-        return 10 + dex_mod
-    elif character_class in ["Artificer", "Bard", "Druid", "Rogue", "Warlock"]:
-        return min(14, 12 + dex_mod)
-    elif character_class in ["Barbarian", "Cleric", "Ranger"]:
-        return min(16, 14 + dex_mod)
-    else:
-        return 18
-
-# Function to calculate hit points
-def calculate_hit_points(character_class, level, constitution_score):
-    con_mod = (constitution_score - 10) // 2
-    if character_class in ["Sorcerer", "Wizard"]:
-        return 6 + (level - 1) * 4 + (level * con_mod)
-    elif character_class in ["Artificer", "Bard", "Cleric", "Druid", "Monk", "Rogue", "Warlock"]:
-        return 8 + (level - 1) * 5 + (level * con_mod)
-    elif character_class in ["Fighter", "Paladin", "Ranger"]:
-        return 10 + (level - 1) * 6 + (level * con_mod)
-    elif character_class == "Barbarian":
-        return 12 + (level - 1) * 7 + (level * con_mod)
+# Show errors from the generators on the page
+set_error_handler(st.error)
+
+# Stored town art is shown from Streamlit's static folder, stop right away if INSPIRAITION_IMAGE_DIR moved it elsewhere
+image_store.check_served()
+
+# Show the town tile and NPCs while the settlement is still being generated, "0" waits for the whole settlement
+PROGRESSIVE_RENDERING = os.environ.get("INSPIRAITION_PROGRESSIVE_RENDERING", "1") == "1"
+# Least time between two redraws of the settlement in progress, every redraw re-sends the whole view
+PROGRESSIVE_REDRAW_SECONDS = 0.25
+# Events that change the town tile are drawn at once, NPCs are batched up to PROGRESSIVE_REDRAW_SECONDS
+PROGRESSIVE_IMMEDIATE_EVENTS = {"settlement", "lore", "image", "image_store"}
+PENDING_TEXT = "<em>The chroniclers are still writing...</em>"
+# Citizen rosters kept built for the whole server, sessions only keep the parameters and seed of theirs
+ROSTER_CACHE_SIZE = int(os.environ.get("INSPIRAITION_ROSTER_CACHE_SIZE", 16))
+
+# Function to get the Streamlit session of the calling thread, worker threads get it through add_script_run_ctx
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+# Function to check whether a browser session is still connected, OpenAI calls of closed sessions are cancelled
+def session_is_active(session_id):
+    return runtime.exists() and runtime.get_instance().is_active_session(session_id)
+
+# OpenAI calls are queued fairly between sessions, see openai_client
+openai_client.set_session_hooks(current_session_id, session_is_active)
+
+# Prometheus /metrics endpoint, only started when INSPIRAITION_METRICS_PORT is set
+tracing.start_metrics_server()
+
+# Debug panel with a waterfall of the last generation and p50/p95 latency per span
+def performance_panel():
+    last_trace = st.session_state.get("last_trace")
+    if last_trace is not None:
+        st.caption(f"Last run: {last_trace.name}, {last_trace.total_seconds:.2f}s")
+        components.html(render_waterfall(last_trace.rows()), height=min(600, 20 * len(last_trace.spans) + 20), scrolling=True)
+    summary = tracing.metrics.summary()
+    if summary:
+        st.dataframe([{"span": name, **values} for name, values in summary.items()], hide_index=True)
+
+# One warm pool for the whole server, shared by every session, None when INSPIRAITION_WARM_POOL_SIZE is 0
+@st.cache_resource
+def get_warm_pool():
+    if WARM_POOL_SIZE <= 0:
+        return None
+    pool = WarmPool(list(settlement_sizes.keys()))
+    pool.start()
+    return pool
+
+# Function to get a settlement's citizen roster, which is fully determined by its parameters and seed
+# A roster is hundreds of KB, so it is built once per key and shared instead of being kept in every session
+@st.cache_resource(max_entries=ROSTER_CACHE_SIZE, show_spinner="Counting the citizens...")
+def get_roster(settlement_size, population, unique_characters, seed):
+    return generate_settlement_roster(settlement_size, population, unique_characters, seed)
+
+# Function to get the roster key of a town: its size, population and NPC count, and the seed of its citizens
+def roster_key(town, seed):
+    return (town.size, town.population, town.unique_characters, seed)
+
+# Fragment showing the town tile and the NPC carousel, it has no widgets of its own so it only
+# reruns with the whole page, i.e. when a new settlement is generated
+# The session only keeps records, the tiles come from tile_renderer's caches (or are rendered again if evicted)
+@st.fragment
+def settlement_view():
+    town = st.session_state.town
+    if town is not None:
+        npc_tiles = tuple(render_npc_tile(npc) for npc in st.session_state.npcs)
+        components.html(render_settlement_view(render_town_tile(town), npc_tiles), height=920, scrolling=True)
+
+# Function to generate a settlement in a worker thread and draw it into placeholder while it comes together:
+# the town tile as soon as its description exists, every NPC as soon as it is built and the image last
+# Returns the settlement from generator.generate_settlement and the seconds until the first tile was drawn
+def generate_progressively(settlement_size, custom_name, placeholder, cache_policy=None):
+    events = queue.Queue()
+    ctx = get_script_run_ctx()
+    attach_ctx = lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    start = time.perf_counter()
+    town, npc_tiles, first_tile, last_draw, dirty = None, [], None, 0.0, False
+
+    with ThreadPoolExecutor(max_workers=1, initializer=attach_ctx) as executor:
+        future = executor.submit(
+            tracing.run_in_context(generate_settlement), settlement_size, custom_name,
+            cache_policy=cache_policy, initializer=attach_ctx, on_progress=lambda event, value: events.put((event, value)),
+        )
+        while not (future.done() and events.empty()):
+            try:
+                event, value = events.get(timeout=0.1)
+            except queue.Empty:
+                event = None
+            if event == "settlement":
+                town = TownRecord(
+                    name=value["name"],
+                    size=value["size"],
+                    population=value["population"],
+                    unique_characters=value["unique_characters"],
+                    description=PENDING_TEXT,
+                    history=PENDING_TEXT,
+                    image_url="",
+                    image_pending=True,
+                )
+            elif event == "npc":
+                npc_tiles.append(render_npc_tile(NPCRecord.from_character_info(value)))
+            elif event == "lore" and town is not None:
+                town = replace(town, description=value["description"], history=value["history"], notable_locations=tuple(value.get("notable_locations", ())))
+            elif event == "image" and town is not None:
+                town = replace(town, image_url=value or "", image_pending=False)
+            elif event == "image_store" and town is not None and value:
+                town = replace(town, image_id=value)
+            dirty = dirty or event is not None
+
+            now = time.perf_counter()
+            if town is None or not dirty or (event not in PROGRESSIVE_IMMEDIATE_EVENTS and now - last_draw < PROGRESSIVE_REDRAW_SECONDS):
+                continue
+            with placeholder:
+                components.html(render_settlement(render_town_tile(town), npc_tiles), height=920, scrolling=True)
+            last_draw, dirty = now, False
+            # The first tile with content, the bare town name and population don't count
+            if first_tile is None and (npc_tiles or town.description is not PENDING_TEXT):
+                first_tile = now - start
+                tracing.record_span("render.first_tile", start, now)
+        settlement = future.result()
+    return settlement, first_tile
+
+# Function to make a quest title unique among the existing ones, the selector looks quests up by title
+def unique_quest_title(title, existing_titles):
+    candidate = title
+    number = 2
+    while candidate in existing_titles:
+        candidate = f"{title} ({number})"
+        number += 1
+    return candidate
+
+# Fragment with the quest buttons, selector and the selected quest tile
+@st.fragment
+def quest_panel():
+    # Display the option to generate quests after a settlement has been generated
+    st.subheader("Quests")
+    # A settlement whose NPCs all failed to build has no one to give a quest
+    # Generating uses the response cache, so the same prompt gives the same quest again; regenerating skips it
+    generate_column, regenerate_column = st.columns(2)
+    generate_clicked = generate_column.button("Generate new quest", disabled=not st.session_state.npcs)
+    regenerate_clicked = regenerate_column.button("Regenerate quest (skip the cache)", disabled=not st.session_state.npcs)
+    if generate_clicked or regenerate_clicked:
+        # Stream the quest in and show each section as soon as the next header arrives
+        quest_placeholder = st.empty()
+        parser = QuestSectionParser()
+        writing = None
+        with tracing.trace("quest") as quest_trace:
+            character_data = st.session_state.npcs.prompt_entries()
+            cache_policy = FRESH if regenerate_clicked else None
+            for chunk in generate_quest_stream(st.session_state.town.name, character_data, cache_policy=cache_policy):
+                completed = parser.feed(chunk)
+                if completed or parser.current != writing:
+                    writing = parser.current
+                    with quest_placeholder.container():
+                        if writing is not None:
+                            st.caption(f"Writing {QUEST_SECTIONS[writing]}...")
+                        components.html(render_quest_tile(parser.record()), height=1100, scrolling=True)
+            parser.finish()
+        st.session_state.last_trace = quest_trace
+        quest_placeholder.empty()
+
+        quest = parse_quest(parser.text)
+        quest_title = unique_quest_title(quest_title_text(quest), st.session_state.tab_titles)
+        st.session_state.quests.append(StoredQuest.from_text(parser.text))
+        st.session_state.tab_titles.append(quest_title)
+        st.session_state.selected_tab = quest_title  # Automatically select the new quest
+
+    # Display the quests in tabs
+    if st.session_state.quests:
+        selected_tab = st.selectbox("Select a quest to view", st.session_state.tab_titles, index=st.session_state.tab_titles.index(st.session_state.selected_tab) if st.session_state.selected_tab else 0)
+        if st.button("Delete current quest"):
+            if st.session_state.selected_tab:
+                index_to_delete = st.session_state.tab_titles.index(st.session_state.selected_tab)
+                del st.session_state.quests[index_to_delete]
+                del st.session_state.tab_titles[index_to_delete]
+                if st.session_state.tab_titles:
+                    st.session_state.selected_tab = st.session_state.tab_titles[-1]  # Set to the most recent quest
+                else:
+                    st.session_state.selected_tab = None
+        if selected_tab in st.session_state.tab_titles:
+            quest = st.session_state.quests[st.session_state.tab_titles.index(selected_tab)]
+            components.html(render_quest_tile(parse_quest(quest.text)), height=1100, scrolling=True)
+
+# Sidebar controls to export the current settlement with its NPCs and quests as a PDF or a standalone HTML page
+def session_export_controls():
+    town = st.session_state.town
+    if town is None:
+        return
+    output_format = st.radio("Export as", ["PDF", "HTML"], horizontal=True)
+    if st.button("Prepare export"):
+        buffer = io.BytesIO()
+        quests = tuple(parse_quest(quest.text) for quest in st.session_state.quests)
+        with tracing.span("export", format=output_format):
+            campaign_export.export([(town, tuple(st.session_state.npcs), quests)], buffer, output_format.lower(), title=town.name)
+        mime = "application/pdf" if output_format == "PDF" else "text/html"
+        st.download_button(f"Download {output_format}", buffer.getvalue(), file_name=f"{town.name}.{output_format.lower()}", mime=mime)
+
+# Fragment browsing the settlement's citizens a page at a time, filtering, paging and opening an entry only rerun it
+# Only the entries on the page are rendered, and an entry's SRD details are looked up when it is opened
+@st.fragment
+def roster_panel():
+    roster = get_roster(*st.session_state.roster_key)
+    if not len(roster):
+        return
+    st.subheader(f"Citizens ({len(roster):,})")
+    race_column, class_column, alignment_column = st.columns(3)
+    races = race_column.multiselect("Race", roster.races())
+    classes = class_column.multiselect("Class", roster.classes())
+    alignments = alignment_column.multiselect("Alignment", ALIGNMENTS)
+    levels = roster.levels()
+    if len(levels) > 1:
+        low, high = st.slider("Level", levels[0], levels[-1], (levels[0], levels[-1]))
+        levels = range(low, high + 1) if (low, high) != (levels[0], levels[-1]) else ()
     else:
-        return 10 + (level - 1) * 5 + (level * con_mod)  # Default case
-
-# Function to generate a town description using OpenAI API
-def generate_town_description(town_name, town_type, town_population, unique_characters):
-    system_message = "You are to generate a description of 3-5 sentences of a fantasy town in Dnd 5e, and you should talk about the vibe of the town, the weather, the surrounding environment and any locations of note. In each request from here on, You will receive the town name, population size and number of unique characters. Generate the relevant information with each prompt, but do not list any characters by specific name."
-    prompt = f"Town Name: {town_name}, Town Type: {town_type}, Town Population: {town_population}, Unique Characters: {unique_characters}"
-    
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=1
-    )
-    return response.choices[0].message.content
-
-def generate_town_history(town_name, description):
-    system_message = "You are to generate a history of a fantasy town in Dnd 5e, and in 3 sentences you should talk about how old the town is, what person/group founded it and why, and any fun and interesting facts about the town. In each request from here on, You will receive the town name, and a description of the settlement."
-    prompt = f"Town Name: {town_name}, Description: {description}"
-    
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=1
-    )
-    return response.choices[0].message.content
-
-def generate_quest(town_name, character_data):
-    system_message = "You will receive a input prompt in the format of \"Town Name:T Characters:[N|A|C], [N|A|C], [N|A|C]...\" where T is the name of the settlement in which the quest MUST mainly be located, and then for all unique characters in the location N is the name of a character, A is that character's moral alignment, and C is the character's class. The output MUST be Blocked out in the following sections: Quest Title, Quest Giver, Quest Background, Stages of the Quest, Possible Resolutions, and Conclusion. Do NOT use characters like # or - to separate sections. There will be many 'characters' sent in this format, and you must generate a quest given all of these characters. Each quest should be detailed and in-depth, and the name of the quest should be word play. There will be a designated quest giver that will tell the Heroes of a problem, situation or event that is happening. You will list out the stages of the quest, listing what the quest giver wants the heroes to do, whether that be to collect something, clear out a location of monsters, convince someone of something, solve a mystery, catch a person or monster, track down a faction or secret society, steal an item or artifact, solve a murder, plan and execute a heist or unravel a political plot. These quests should be relevant to the Class and alignment of the character that is the quest-giver, and should be given out in or around the core location. For instance a wizard or sorcerer may have a quest that is more magic-aligned, a druid is nature-aligned, a rouge is sneaky-aligned, etc. The quest should have multiple stages of discovery, combat, skill checks or others that are needed to advance. In most quests, there should include some sort of revelation or twist that allows the heroes to resolve the quest in more than one way. The quest should only include named characters that are listed in the input, list out the stages of the quest in 1, 2, 3... format and then list all possible resolutions based on the player character's decisions, including rewards in either magic items and/or gold pieces, defining what the magic items do. The Possible Resolutions section should be similarly enumerated."
-    
-    random.shuffle(character_data)
-
-    all_characters = ""
-
-    for i in range(len(character_data)):
-        all_characters += character_data[i]
-        if i != len(character_data) - 1:
-            all_characters += ", "
-    
-    prompt = f"Town Name:{town_name}: Characters: {all_characters}"
-
-    print(prompt)
-
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=1
-    )
-    return response.choices[0].message.content
-
-def generate_town_image(town_name, town_type, description):
-    townPrompt = f"A fantasy town called {town_name}, which is a {town_type}. {description} Show the town from a bird's eye view with elements like buildings, roads, and natural surroundings. You CANNOT generate text or boxes in the image generation, ONLY the town itself image only without typography. It should not contain any text, labels, borders, measurements nor design elements of any kind.. Do NOT add any details to this prompt, this is for testing purposes only."
-    
-    response = openai.images.generate(
-        model = "dall-e-3",
-        prompt = townPrompt,
-        size = "1024x1792",
-        quality = "standard",
-        n = 1,
-    )
-    
-    image_url = response.data[0].url
-    return image_url
-
-
-def insert_newlines_before_numbers(text):
-    # Define the regex pattern to match numbers followed by a dot (e.g., "1.", "2.", ...)
-    pattern = r'(\d+\.)'
-    
-    def replace_match(match):
-        if match.group(1) == '1.':
-            return match.group(1)
-        else:
-            return f'<br>{match.group(1)}'
-    
-    # Replace the pattern using the replace_match function
-    modified_text = re.sub(pattern, replace_match, text)
-    
-    return modified_text
-
-def insert_newlines_before_hyphens(text):
-    # Replace each hyphen with a new-line character followed by the hyphen
-    modified_text = text.replace("-", "<br>-")
-    
-    return modified_text
-
-def replace_bold_italic(text: str) -> str:
-    # Define the regex pattern to match text between "**"
-    pattern = r'\*\*(.*?)\*\*'
-    
-    def replace_match(match):
-        inner_text = match.group(1)
-        if len(inner_text) < 50:
-            return f'<span style="font-weight:bold;font-style:italic;">{inner_text}</span>'
-        else:
-            return inner_text
-    
-    # Replace matching patterns using the replace_match function
-    modified_text = re.sub(pattern, replace_match, text)
-    
-    # Remove any remaining "**"
-    modified_text = modified_text.replace('**', '')
-    
-    return modified_text
-
-def extract_quest_details(quest_text):
-    # Define the substrings to search for
-    substrings = [
-        "Quest Title",
-        "Quest Giver",
-        "Quest Background",
-        "Stages of the Quest",
-        "Possible Resolutions",
-        "Conclusion"
-    ]
-    
-    # Initialize an empty list to store the results
-    results = [""] * len(substrings)  # Initialize results with empty strings for each substring
-
-    # Extract the text segments between the substrings
-    for i in range(len(substrings) - 1):
-        start = quest_text.find(substrings[i]) + len(substrings[i])
-        end = quest_text.find(substrings[i + 1])
-        if start < len(substrings[i]) or end == -1:  # Check if start is valid and end is found
-            continue  # Skip to next iteration if not found
-        results[i] = quest_text[start:end].strip()
-
-    # Extract the text after the last substring
-    start = quest_text.find(substrings[-1]) + len(substrings[-1])
-    if start >= len(substrings[-1]):  # Check if start is valid
-        results[-1] = quest_text[start:].strip()
-    
-    return results
+        levels = ()
+
+    rows = roster.find(races, classes, levels, alignments)
+    pages = roster.page_count(rows)
+    page = st.number_input(f"Page (of {pages:,}, {len(rows):,} citizens)", min_value=1, max_value=pages, value=1)
+    entries = roster.page(rows, min(page, pages) - 1)
+    components.html(render_roster_page(entries), height=420, scrolling=True)
+
+    opened = st.selectbox("Open a citizen", entries, index=None, format_func=lambda entry: entry.name)
+    if opened is not None:
+        npc = NPCRecord.from_character_info(roster_character_info(roster, opened.row))
+        components.html(render_npc_detail(render_npc_tile(npc)), height=620, scrolling=True)
+
+# Sidebar controls to save the session as a small binary snapshot and to load one back
+def session_snapshot_controls():
+    if st.session_state.town is not None:
+        snapshot = session_to_bytes(st.session_state.town, st.session_state.npcs, st.session_state.quests, st.session_state.tab_titles)
+        st.download_button("Save session", snapshot, file_name=f"{st.session_state.town.name}.inspiraition", mime="application/octet-stream")
+    uploaded = st.file_uploader("Load session", type=["inspiraition"])
+    if uploaded is not None and uploaded.file_id != st.session_state.get("loaded_snapshot"):
+        try:
+            town, npcs, quests, quest_titles = session_from_bytes(uploaded.getvalue())
+        except ValueError as e:
+            st.error(f"Could not load the session: {e}")
+            return
+        st.session_state.loaded_snapshot = uploaded.file_id
+        st.session_state.town = town
+        st.session_state.npcs = npcs
+        st.session_state.quests = quests
+        st.session_state.tab_titles = quest_titles
+        # Snapshots don't hold the roster, the loaded town gets citizens seeded by the snapshot, the same ones every time it's loaded
+        st.session_state.roster_key = roster_key(town, zlib.crc32(uploaded.getvalue())) if town is not None else None
+        st.session_state.selected_tab = quest_titles[-1] if quest_titles else None
 
 def main():
     st.title("Inspiration AI - D&D Edition")
@@ -471,330 +299,101 @@ def main():
     custom_settlement_name = st.text_input("Custom Settlement Name")
     settlement_size = st.selectbox("Select Settlement Size", list(settlement_sizes.keys()))
 
-    settlement_name_copy = custom_settlement_name
-
     loading_placeholder = st.empty()
 
     # Initialize session state if it doesn't exist
-    if 'town_tile' not in st.session_state:
-        st.session_state.town_tile = ""
-    if 'character_tiles' not in st.session_state:
-        st.session_state.character_tiles = ""
+    if 'town' not in st.session_state:
+        st.session_state.town = None
+    if 'npcs' not in st.session_state:
+        st.session_state.npcs = NPCTable()
     if 'quests' not in st.session_state:
         st.session_state.quests = []
     if 'tab_titles' not in st.session_state:
         st.session_state.tab_titles = []
     if 'selected_tab' not in st.session_state:
         st.session_state.selected_tab = None
-
-    if st.button(f"Generate {settlement_size}"):
+    if 'roster_key' not in st.session_state:
+        st.session_state.roster_key = None
+
+    # Generating uses the response cache, so the same custom name and size bring back the same lore and art;
+    # regenerating skips the cache (and the warm pool) for new ones, the results are still stored
+    generate_column, regenerate_column = st.columns(2)
+    generate_clicked = generate_column.button(f"Generate {settlement_size}")
+    regenerate_clicked = regenerate_column.button(f"Regenerate {settlement_size} (skip the cache)")
+    if generate_clicked or regenerate_clicked:
+        cache_policy = FRESH if regenerate_clicked else None
         # Remove quests before generating a new settlement
         st.session_state.quests = []
         st.session_state.tab_titles = []
         st.session_state.selected_tab = None
         
-        with loading_placeholder:
-            st.spinner("Generating...")
-            settlement_name = generate_settlement_name(custom_settlement_name)
-            settlement_name_copy = settlement_name
-            population = generate_population(settlement_sizes[settlement_size])
-            character_names, level_range = generate_characters(settlement_size)
-            unique_characters = len(character_names)
-
-            town_description = generate_town_description(settlement_name, settlement_size, population, unique_characters)
-            town_history = generate_town_history(settlement_name, town_description)
-            town_image_url = generate_town_image(settlement_name, settlement_size, town_description)
+        with tracing.trace("generate", size=settlement_size) as generate_trace:
+            # Settlements without a custom name can come ready-made from the warm pool
+            warm_pool = get_warm_pool()
+            settlement = warm_pool.take(settlement_size) if warm_pool and not custom_settlement_name and not regenerate_clicked else None
+            if settlement is None and PROGRESSIVE_RENDERING:
+                settlement, first_tile = generate_progressively(settlement_size, custom_settlement_name, loading_placeholder, cache_policy)
+                generated = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in settlement["timings"].items())
+                first_tile_text = f"first tile {first_tile:.2f}s, " if first_tile is not None else ""
+                caption = f"Generated in {generated} ({first_tile_text}total {settlement['total_seconds']:.2f}s)"
+            elif settlement is None:
+                with loading_placeholder, st.spinner("Generating..."):
+                    ctx = get_script_run_ctx()
+                    attach_ctx = lambda: add_script_run_ctx(threading.current_thread(), ctx)
+                    settlement = generate_settlement(settlement_size, custom_settlement_name, cache_policy=cache_policy, initializer=attach_ctx)
+                generated = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in settlement["timings"].items())
+                caption = f"Generated in {generated} (total {settlement['total_seconds']:.2f}s)"
+            else:
+                caption = "Served from the warm pool"
+
+            # Rendering here fills tile_renderer's caches, so the settlement view below is served from them
+            with tracing.span("render.tiles"):
+                town = TownRecord(
+                    name=settlement["name"],
+                    size=settlement["size"],
+                    population=settlement["population"],
+                    unique_characters=settlement["unique_characters"],
+                    description=settlement["description"],
+                    history=settlement["history"],
+                    notable_locations=tuple(settlement["notable_locations"]),
+                    image_url=settlement["image_url"],
+                    image_id=settlement["image_id"] or ""
+                )
+                npcs = tuple(NPCRecord.from_character_info(character_info) for character_info in settlement["npcs"])
+                render_town_tile(town)
+                for npc in npcs:
+                    render_npc_tile(npc)
+        st.session_state.last_trace = generate_trace
 
         loading_placeholder.empty()
-        
-        st.session_state.town_tile = f"""
-        <div class="town-tile" style="margin: 0 auto; text-align: left; position: relative; display: flex; height: auto;">
-            <div class="town-info" style="display: flex; align-items: stretch; height: 100%;">
-                <img src="{town_image_url}" alt="Town Image" style="border-radius:7.5px; float: left; margin-right: 15px; width: 40%; max-height: 100%;">
-                <div contenteditable="true" style="width: 55%; font-family:Arial,Helvetica,sans-serif;font-size:11px; overflow: auto;">
-                    <div class="name" style="text-align: left;">{settlement_name}</div>
-                    <div class="description" style="text-align: left;">{settlement_size}, Population of {population}, containing {unique_characters} NPCs</div>
-                    <div class="gradient"></div>
-                    <p><strong>Description:</strong> {town_description}</p>
-                    <p><strong>History: </strong>{town_history}</p>
-                </div>
-            </div>
-        </div>
-        """
-
-        character_tiles = ""
-        character_data = []
-        for name in character_names:
-            character_info = assign_race_class_level(name, level_range)
-            ability_scores = character_info['ability_scores']
-            character_data.append(f"[{character_info['name']}|{character_info['alignment']}|{character_info['class']}]")
-            class_spell_modifier_mapping = {
-                "Wizard": "Intelligence",
-                "Rogue": "Intelligence",
-                "Fighter": "Intelligence",
-                "Artificer": "Intelligence",
-                "Cleric": "Wisdom",
-                "Monk": "Wisdom",
-                "Druid": "Wisdom",
-                "Ranger": "Wisdom",
-                "Warlock": "Charisma",
-                "Bard": "Charisma",
-                "Barbarian": "Charisma",
-                "Paladin": "Charisma",
-                "Sorcerer": "Charisma"
-            }
-            attack_modifier_value = math.ceil((character_info['level']) / 4) + 1 + max(
-                calculate_modifier_value(ability_scores['Strength']),
-                calculate_modifier_value(ability_scores['Dexterity'])
-            )
-            attack_modifier = f"{'+' if attack_modifier_value >= 0 else ''}{attack_modifier_value}"
-
-            # Use the helper function to get the class spell modifier
-            spell_change = calculate_modifier_value(ability_scores[class_spell_modifier_mapping.get(character_info['class'], 'Intelligence')])
-
-            # Calculate Spell Attack Modifier and Spell Save Modifier
-            spell_attack_modifier_value = math.ceil((character_info['level']) / 4) + 1 + spell_change
-            spell_attack_modifier = f"{'+' if spell_attack_modifier_value >= 0 else ''}{spell_attack_modifier_value}"
-
-            spell_save_modifier_value = spell_attack_modifier_value + 8
-            #spell_save_modifier = f"{'+' if spell_save_modifier_value >= 0 else ''}{spell_save_modifier_value}"
-            tile = f"""
-            <div class="character-tile">
-                <div contenteditable="true"  style="width:85%; height:auto; font-family:Arial,Helvetica,sans-serif;font-size:11px;">
-                <div class="name">{character_info['name']}</div>
-                <div class="description">{character_info['race']} {character_info['class']}, {character_info['alignment']}</div>
-
-                <div class="gradient"></div>
-
-                <div class="red">
-                    <div ><span class="bold red">Armor Class</span><span> {character_info['armor_class']} </span></div>
-                    <div><span class="bold red">Hit Points</span><span> {character_info['hit_points']} </span></div>
-                    <div><span class="bold red">Speed</span><span> {character_info['speed']} ft.</span></div>
-                </div>
-
-                <div class="gradient"></div>
-
-                <table>
-                    <tr><th>STR    </th><th>DEX   </th><th>CON    </th><th>INT   </th><th>WIS   </th><th>CHA   </th></tr>
-                    <tr><td>{ability_scores['Strength']} ({calculate_modifier(ability_scores['Strength'])})</td><td>{ability_scores['Dexterity']} ({calculate_modifier(ability_scores['Dexterity'])})</td><td>{ability_scores['Constitution']} ({calculate_modifier(ability_scores['Constitution'])})</td><td>{ability_scores['Intelligence']} ({calculate_modifier(ability_scores['Intelligence'])})</td><td>{ability_scores['Wisdom']} ({calculate_modifier(ability_scores['Wisdom'])})</td><td>{ability_scores['Charisma']} ({calculate_modifier(ability_scores['Charisma'])})</td></tr>
-                </table>
-                    
-                <div class="gradient"></div>
-                    
-                <div><span class="bold">Traits</span><span> {', '.join(character_info['traits'])}</span></div>
-                <div><span class="bold">Passive Perception</span><span> {character_info['passive_perception']}</span></div>
-                <div><span class="bold">Languages</span><span> {character_info['languages']}</span></div>
-                <div><span class="bold">Level </span><span> {character_info['level']}</span></div> 
-                    
-                <div class="gradient"></div>
-
-                <div class="actions red">Actions</div>
-                    
-                <div class="hr"></div>
-                
-                <div><span class="bold">Magic Items: </span><span> {character_info['magic_items']}</span></div>
-                <div><span class="bold">Attack Modifier:</span> {attack_modifier} &emsp; <span class="bold">Spell Attack Modifier:</span> {spell_attack_modifier} &emsp; <span class="bold">Spell Save:</span> {spell_save_modifier_value}</div>
-                </div>
-            </div>
-            """
-
-            #<div class="attack"><span class="attackname">Greatclub.</span><span class="description"> Melee Weapon Attack:</span><span>+6 to hit, reach 5 ft., one target.</span><span class="description">Hit:</span><span>13 (2d8+4) bludgeoning damage.</span></div>    
-            #<div class="attack"><span class="attackname">Javelin.</span><span class="description"> Melee or Ranged Weapon Attack:</span><span>+6 to hit, reach 5 ft. or 30ft./120, one target.</span><span class="description">Hit:</span><span>11 (2d6+4) piercing damage.</span></div>    
-                
-
-            character_tiles += tile
-
-        st.session_state.character_tiles = character_tiles
-        st.session_state.character_data = character_data
-
-    # Display the town and character tiles
-    if st.session_state.town_tile:
-        custom_css = """
-        <style>
-        .gradient {
-            background: linear-gradient(10deg, #A73335, #f0f0f0);
-            height:5px;
-            margin:7px 0px;
-        }
-        .name {
-            font-size:225%;
-            font-family:Georgia, serif;
-            font-variant:small-caps;
-            font-weight:bold;
-            color:#A73335;
-        }
-        .description {
-            font-style:italic;    
-        }
-        .bold {
-            font-weight:bold;
-        }
-        .red {
-            color:#A73335;
-        }
-        table {
-            width:100%;
-            border:0px;
-            border-collapse:collapse;
-            color:#A73335;
-        }
-        th, td {
-            width:50px;
-            text-align:center;
-        }
-        .actions {
-            font-size:175%;
-            font-variant:small-caps;
-            margin:17px 0px 0px 0px;
-        }
-        .hr {
-            background: #A73335;
-            height:2px;
-        }
-        .attack {
-            margin:5px 0px;
-        }
-        .attackname {
-            font-weight:bold;
-            font-style:italic;
-        }
-        .town-tile {
-            width: 85%;
-            background-color: #f0f0f0;
-            border: 1px solid #ddd;
-            border-radius: 7.5px;
-            padding: 20px;
-            margin-bottom: 20px;
-            margin-left: auto;
-            margin-right: auto;
-        }
-        .character-tiles-container-wrapper {
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        .character-tiles-container {
-            display: flex;
-            overflow-x: auto;
-            white-space: nowrap;
-            scroll-snap-type: x mandatory;
-            width: 80%;
-            padding: 10px;
-        }
-        .character-tile {
-            background-color: #f0f0f0;
-            border: 1px solid #ddd;
-            border-radius: 7.5px;  /* Increased bevel on corners by 50% */
-            margin-right: 10px;
-            padding: 20px;
-            min-width: 95%;
-            max-width: 95%;
-            flex: 0 0 auto;
-            scroll-snap-align: start;
-            white-space: normal;
-        }
-        .scroll-button {
-            background-color: #007bff;
-            border: none;
-            color: white;
-            padding: 10px;
-            text-align: center;
-            text-decoration: none;
-            display: inline-block;
-            font-size: 16px;
-            margin: 4px 2px;
-            cursor: pointer;
-            border-radius: 5px;
-        }
-        .scroll-button:disabled {
-            background-color: #cccccc;
-            cursor: not-allowed;
-        }
-        .character-tiles-container::-webkit-scrollbar {
-            display: none;
-        }
-        </style>
-        <script>
-        function scrollTilesContainer(direction) {
-            const container = document.querySelector('.character-tiles-container');
-            const tileWidth = container.querySelector('.character-tile').clientWidth + 10;  // Tile width + margin-right
-            container.scrollBy({ left: direction * tileWidth, behavior: 'smooth' });
-        }
-        window.onload = function() {
-            const container = document.querySelector('.character-tiles-container');
-            const largestTile = Array.from(container.querySelectorAll('.character-tile')).reduce((maxHeight, tile) => {
-                return Math.max(maxHeight, tile.clientHeight);
-            }, 0);
-            container.style.height = largestTile + 'px';
-        };
-        </script>
-        """
-
-        character_tiles_html = f"""
-        {custom_css}
-        {st.session_state.town_tile}
-        <div class="character-tiles-container-wrapper">
-            <button class="scroll-button" onclick="scrollTilesContainer(-1)">&lt;</button>
-            <div class="character-tiles-container">
-                {st.session_state.character_tiles}
-            </div>
-            <button class="scroll-button" onclick="scrollTilesContainer(1)">&gt;</button>
-        </div>
-        """
-
-        components.html(character_tiles_html, height=920, scrolling=True)
-
-        # Display the option to generate quests after a settlement has been generated
-        st.subheader("Quests")
-        if st.button("Generate new quest"):
-            quest = replace_bold_italic(generate_quest(settlement_name_copy, st.session_state.character_data))
-            quest_title = (quest.split("Quest Title:")[1].split("Quest Giver:")[0].strip()).strip(' :#-')
-            st.session_state.quests.append({
-                "quest_text": quest,
-                "quest_parts": extract_quest_details(quest),
-                "title": quest_title
-            })
-            st.session_state.tab_titles.append(quest_title)
-            st.session_state.selected_tab = quest_title  # Automatically select the new quest
-
-    # Display the quests in tabs
-    if st.session_state.quests:
-        selected_tab = st.selectbox("Select a quest to view", st.session_state.tab_titles, index=st.session_state.tab_titles.index(st.session_state.selected_tab) if st.session_state.selected_tab else 0)
-        if st.button("Delete current quest"):
-            if st.session_state.selected_tab:
-                index_to_delete = st.session_state.tab_titles.index(st.session_state.selected_tab)
-                del st.session_state.quests[index_to_delete]
-                del st.session_state.tab_titles[index_to_delete]
-                if st.session_state.tab_titles:
-                    st.session_state.selected_tab = st.session_state.tab_titles[-1]  # Set to the most recent quest
-                else:
-                    st.session_state.selected_tab = None
-        for quest in st.session_state.quests:
-            if quest["title"] == selected_tab:
-                quest_parts = quest["quest_parts"]
-                quest_tile = f"""
-                <div class="quest-tile" style="margin: 0 auto; text-align: left; width: 85%; background-color: #ffffff; border: 1px solid #ddd; border-radius: 7.5px; padding: 20px; margin-bottom: 20px;">
-                    <div contenteditable="true"  style="width:100%; font-family:Arial,Helvetica,sans-serif;font-size:11px;">
-                    <h2 class="name" style = "font-size:225%; font-family:Georgia, serif; font-variant:small-caps; font-weight:bold; color:#A73335;">Quest: {quest_parts[0].strip(' :#-"')}</h2>
-                    <div style = "font-style:italic;">Quest Giver: {quest_parts[1].strip(' :#-')}</div>
-                    <br>
-                    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Quest Background</div>
-                    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
-                    <p>{quest_parts[2].strip(' :#-')}</p>
-                    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Quest Stages</div>
-                    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
-                    <p>{insert_newlines_before_numbers(quest_parts[3]).strip(' :#-')}</p>
-                    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Possible Resolutions</div>
-                    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
-                    <p>{insert_newlines_before_numbers(quest_parts[4]).strip(' :#-')}</p>
-                    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Conclusion</div>
-                    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
-                    <p>{quest_parts[5].strip(' :#-')}</p>
-                    </div>
-                    
-                </div>
-                """
-                components.html(quest_tile, height=1100, scrolling=True)
+        st.caption(caption)
+
+        st.session_state.town = town
+        if settlement["failed_npcs"]:
+            st.warning(f"{settlement['failed_npcs']} NPC(s) could not be generated and were skipped.")
+
+        st.session_state.npcs = NPCTable(npcs)
+        # The roster itself is only built when the citizens panel first asks for it
+        st.session_state.roster_key = roster_key(town, random.randrange(2 ** 32))
+
+    with st.sidebar.expander("Session"):
+        session_snapshot_controls()
+        session_export_controls()
+    with st.sidebar.expander("OpenAI queue"):
+        st.json(openai_client.get_stats())
+    with st.sidebar.expander("Upstream requests"):
+        st.json(http_client.get_coalescing_stats())
+    if st.sidebar.checkbox("Show performance panel"):
+        with st.sidebar:
+            performance_panel()
+
+    # The settlement view and the quest panel are fragments, so clicking a quest button only reruns
+    # (and only re-sends) the quest panel instead of the whole settlement
+    settlement_view()
+    if st.session_state.roster_key is not None:
+        roster_panel()
+    if st.session_state.town is not None:
+        quest_panel()
 
 if __name__ == "__main__":
 
@@ -0,0 +1,717 @@
+import logging
+import random
+import openai
+import math
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import http_client
+import openai_client
+import tracing
+from stage_scheduler import Stage, run_stages
+from image_store import store_image
+from quest_parser import parse_quest, quest_title
+from llm_cache import CACHE_ONLY, DEFAULT_POLICY, FRESH, CacheMiss, cache_key, cached_call, get_llm_cache
+from srd_catalog import get_catalog
+from name_engine import RACE_LANGUAGES, generate_names_for_races
+from roster import ROSTER_MAX_SIZE, generate_roster
+from prompt_builder import build_quest_prompt, record_usage
+
+# Everything needed to generate settlements, NPCs and quests without the Streamlit page,
+# shared by the website (dndsitetester.py) and the batch generator (batch_generate.py)
+
+# Where NPC names come from: "local" for the built-in name engine or "randomuser" for randomuser.me
+NAME_SOURCE = os.environ.get("INSPIRAITION_NAME_SOURCE", "local")
+
+# randomuser.me endpoint for NAME_SOURCE="randomuser"
+RANDOMUSER_URL = os.environ.get("INSPIRAITION_RANDOMUSER_URL", "https://randomuser.me/api/")
+
+# Maximum number of NPCs built at the same time
+NPC_BUILD_WORKERS = 8
+
+# How the town description and history are written: "combined" asks for both in one structured call
+# (falling back to two calls if the answer is malformed), "separate" always makes the two calls
+TOWN_LORE_MODE = os.environ.get("INSPIRAITION_TOWN_LORE_MODE", "combined")
+
+# Failures the generators recover from (a skipped NPC, a lore fallback) are logged, the website shows their outcome
+logger = logging.getLogger(__name__)
+
+# Where errors from the generators are reported, the website swaps in st.error
+_error_handler = print
+
+def set_error_handler(handler):
+    global _error_handler
+    _error_handler = handler
+
+def report_error(message):
+    _error_handler(message)
+
+# Define ranges for settlement sizes
+settlement_sizes = {
+    "Thorp": (5, 7, (12, 20), (1, 3)),
+    "Village": (8, 14, (80, 200), (1, 5)),
+    "Town": (10, 16, (400, 2000), (1, 8)),
+    "City": (14, 18, (5000, 25000), (1, 15)),
+    "Metropolis": (14, 20, (30000, 150000), (1, 20))
+}
+
+# Function to fetch races from the SRD catalog
+def get_race():
+    races = get_catalog().races()
+    if not races:
+        report_error("Failed to fetch races.")
+    return races
+
+# Function to fetch classes from the SRD catalog
+def get_class():
+    classes = get_catalog().classes()
+    if not classes:
+        report_error("Failed to fetch classes.")
+    return classes
+    
+def assign_languages(race, rng=random):
+    if race == "Human":
+        return rng.choice(["Elvish", "Draconic", "Orc", "Dwarvish", "Gnomish", "Halfling", "Infernal"])
+    # Same table the name engine uses, so an NPC's name matches their native language
+    return RACE_LANGUAGES.get(race, "Common")
+
+# Function to fetch all magic items from the SRD catalog
+def get_magic_items():
+    items = get_catalog().magic_items()
+    if not items:
+        report_error("Failed to fetch magic items.")
+    return items
+
+# Function to generate random names from randomuser.me API
+def generate_names(number_of_names):
+    try:
+        response = http_client.get(RANDOMUSER_URL, params={"results": number_of_names, "nat": "us"})
+    except requests.RequestException:
+        report_error("Failed to generate names.")
+        return []
+    if response.status_code == 200:
+        users = response.json()['results']
+        names = [f"{user['name']['first']} {user['name']['last']}" for user in users]
+        return names
+    else:
+        report_error("Failed to generate names.")
+        return []
+
+# Function to generate a random name
+def generate_random_name():
+    first_names = ["Oak", "River", "Stone", "Wind", "Bright", "Shadow", "Golden", "Silver", "Wolf", "Dragon", "Ogre", "Stag", "Bear", "Eagle", "Raven", "Lion", "Tiger", "Fox", "Hawk", "Snake", "Badger", "Boar", "Deer", "Elk", "Falcon", "Horse", "Moose", "Owl", "Beholder", "Rat", "Shark", "Sparrow", "Swan", "Whale", "Wolf", "Bat", "Bee", "Hare", "Hawk", "Jaguar", "Koala", "Leopard", "Lizard", "Scorpion", "Spider"]
+    return random.choice(first_names)
+
+# Function to generate a random settlement name based on different conventions
+def generate_settlement_name(custom_name):
+    if custom_name:
+        return custom_name
+
+    convention = random.choice([1, 2])
+    X = generate_random_name()
+
+    if convention == 1:
+        Y = random.choice(["Creek", "Divide", "Hill", "Burgh", "Hub", "Keep", "Fell", "Shire", "Haven", "Crossing", "Watch", "Gate", "Moor", "Field", "Glen", "Dale", "Wood", "Wick", "Wold"])
+        return f"{X}'s {Y}"
+    elif convention == 2:
+        Y = random.choice(["polis", "ville", "vale", "ton", "stead", "ford", "burg", "borough", "ville", "field", "shire", "wood", "wick", "wold", "dale", "glen", "moor", "gate", "watch", "cross", "haven", "keep", "hub", "burgh", "divide", "creek"])
+        return f"{X}-{Y}"
+    else:
+        words = ["Oak", "River", "Stone", "Wind", "Bright", "Shadow", "Golden", "Silver", "Wolf", "Dragon", "Ogre", "Stag", "Bear", "Eagle", "Raven", "Lion", "Tiger", "Fox", "Hawk", "Snake", "Badger", "Boar", "Deer", "Elk", "Falcon", "Horse", "Moose", "Owl", "Beholder", "Rat", "Shark", "Sparrow", "Swan", "Whale", "Wolf", "Bat", "Bee", "Hare", "Hawk", "Jaguar", "Koala", "Leopard", "Lizard", "Scorpion", "Spider"]
+        return f"{random.choice(words)} {random.choice(words)}"
+
+# Function to generate a random population based on settlement size
+def generate_population(settlement_size):
+    min_pop, max_pop = settlement_size[2]
+    if max_pop <= 200:
+        return random.randint(min_pop, max_pop)
+    elif max_pop <= 2000:
+        return random.randint(min_pop // 10, max_pop // 10) * 10
+    else:
+        return random.randint(min_pop // 100, max_pop // 100) * 100
+
+# Function to assign race, class, level, and magic items to a character
+def assign_race_class_level(character_name, level_range, race=None):
+    if race is None:
+        race = random.choice(get_race())
+    character_class = random.choice(get_class())
+    level = random.randint(*level_range)
+    magic_items = get_magic_items_based_on_level(level)
+    magic_items_list = magic_item_links(magic_items)
+
+    # Fetch race details
+    race_details = get_race_details(race['index'])
+    size = race_details['size']
+    speed = race_details['speed']
+    traits = [trait['name'] for trait in race_details['traits']]
+
+    alignment = generate_alignment()
+
+    ability_scores = generate_ability_scores(character_class['name'])
+    apply_racial_bonuses(race['name'], ability_scores)
+
+    languages = f"Common, {assign_languages(race['name'])}"
+
+    attack_modifier, spell_attack_modifier, spell_save = calculate_combat_modifiers(character_class['name'], level, ability_scores)
+
+    return {
+        "name": character_name,
+        "race": race['name'],
+        "class": character_class['name'],
+        "level": level,
+        "magic_items": magic_items_list,
+        # The same items as (SRD index, name) pairs, what records.NPCRecord keeps
+        "magic_item_refs": [(item.index, item.name) for item in magic_items],
+        "size": size,
+        "speed": speed,
+        "traits": traits,
+        "alignment": alignment,
+        "ability_scores": ability_scores,
+        "passive_perception": calculate_passive_perception(ability_scores['Wisdom']),
+        "armor_class": calculate_armor_class(character_class['name'], ability_scores['Dexterity']),
+        "hit_points": calculate_hit_points(character_class['name'], level, ability_scores['Constitution']),
+        "languages": languages,
+        "attack_modifier": attack_modifier,
+        "spell_attack_modifier": spell_attack_modifier,
+        "spell_save": spell_save
+    }
+
+# Function to build every character of a settlement in parallel
+# character_seeds is a list of (name, race) pairs from generate_characters
+# Results keep the order of character_seeds, characters that failed to build are left out and counted
+# initializer runs once in every worker thread (the website uses it to attach the Streamlit script context)
+# on_character is called with every character that was built, as soon as it is done and in the worker thread
+def build_characters(character_seeds, level_range, max_workers=NPC_BUILD_WORKERS, initializer=None, on_character=None):
+    if not character_seeds:
+        return [], 0
+
+    def build(character_seed):
+        name, race = character_seed
+        try:
+            with tracing.span("npc.build"):
+                character_info = assign_race_class_level(name, level_range, race)
+        except Exception as e:
+            logger.warning("Failed to build character %s: %r", name, e)
+            return None
+        if on_character is not None:
+            on_character(character_info)
+        return character_info
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(character_seeds)), initializer=initializer) as executor:
+        results = list(executor.map(tracing.run_in_context(build), character_seeds))
+
+    characters = [character_info for character_info in results if character_info is not None]
+    return characters, len(results) - len(characters)
+
+# Function to turn magic items into the comma separated links the NPC tiles show
+def magic_item_links(magic_items):
+    if not magic_items:
+        return "None"
+    return ', '.join([f"<a href='{item.link}' style='color:#A73335;'>{item.name}</a>" for item in magic_items])
+
+# Function to fetch race details from the SRD catalog
+def get_race_details(race_index):
+    race_details = get_catalog().race_details(race_index)
+    if not race_details:
+        report_error("Failed to fetch race details.")
+    return race_details
+
+# Function to get magic items based on character level, higher levels get more and rarer items
+# Returns srd_catalog.MagicItem objects from the catalog's rarity index, no network access needed
+def get_magic_items_based_on_level(level, rng=random):
+    item_index = get_catalog().magic_item_index()
+    if not len(item_index):
+        report_error("Failed to fetch magic items.")
+        return []
+
+    if 3 <= level <= 5:
+        count = rng.randint(0, 1)
+    elif 6 <= level <= 10:
+        count = rng.randint(1, 2)
+    elif 11 <= level <= 15:
+        count = rng.randint(1, 3)
+    elif 16 <= level <= 18:
+        count = rng.randint(3, 5)
+    elif 19 <= level <= 20:
+        count = rng.randint(4, 8)
+    else:
+        count = 0
+
+    return item_index.sample(level, count, rng)
+
+# Function to generate the citizen roster of a settlement: everyone but the named NPCs, up to ROSTER_MAX_SIZE
+# Races and classes come from the SRD catalog, levels from the settlement size like the named NPCs
+def generate_settlement_roster(settlement_size, population, unique_characters, seed=None):
+    level_range = settlement_sizes[settlement_size][3]
+    race_names = [race['name'] for race in get_race()]
+    class_names = [character_class['name'] for character_class in get_class()]
+    size = min(max(0, population - unique_characters), ROSTER_MAX_SIZE) if race_names and class_names else 0
+    with tracing.span("roster.generate", size=size):
+        return generate_roster(size, level_range, race_names, class_names, seed)
+
+# Function to fill in the full character info of a roster entry when it is opened, in the shape
+# assign_race_class_level returns: the stats come from the roster, the SRD details are looked up now
+# Languages and magic items are drawn from a generator seeded per entry, so an entry always opens the same
+def roster_character_info(roster, row):
+    entry = roster.entry(row)
+    rng = random.Random(f"{roster.seed}:{row}")
+    race_indexes = {race['name']: race['index'] for race in get_race()}
+    race_details = get_race_details(race_indexes.get(entry.race, entry.race.lower())) or {}
+    magic_items = get_magic_items_based_on_level(entry.level, rng)
+    return {
+        "name": entry.name,
+        "race": entry.race,
+        "class": entry.character_class,
+        "level": entry.level,
+        "magic_items": magic_item_links(magic_items),
+        "magic_item_refs": [(item.index, item.name) for item in magic_items],
+        "size": race_details.get('size', "Medium"),
+        "speed": race_details.get('speed', 30),
+        "traits": [trait['name'] for trait in race_details.get('traits', [])],
+        "alignment": entry.alignment,
+        "languages": f"Common, {assign_languages(entry.race, rng)}",
+        **roster.stats.row(row),
+    }
+
+# Function to generate characters based on settlement size
+# Returns (name, race) pairs, the race is picked first so the name can match it
+def generate_characters(settlement_size):
+    min_names, max_names, _, level_range = settlement_sizes[settlement_size]
+    number_of_names = random.randint(min_names, max_names)
+    races = get_race()
+    if not races:
+        return [], level_range
+    character_races = [random.choice(races) for _ in range(number_of_names)]
+    if NAME_SOURCE == "randomuser":
+        character_names = generate_names(number_of_names)
+    else:
+        character_names = generate_names_for_races([race['name'] for race in character_races])
+    return list(zip(character_names, character_races)), level_range
+
+# Function to generate a random alignment
+def generate_alignment():
+    X = random.choice(["Lawful", "Neutral", "Chaotic"])
+    Y = random.choice(["Good", "Neutral", "Evil"])
+    if X == "Neutral" and Y == "Neutral":
+        return "True Neutral"
+    else:
+        return f"{X} {Y}"
+
+# Function to generate ability scores based on the character's class
+def generate_ability_scores(character_class):
+    def roll_dice():
+        rolls = sorted([random.randint(1, 6) for _ in range(4)])
+        return sum(rolls[1:])  # sum of the highest 3 rolls
+
+    # Generate 6 roll values
+    asi_array = [roll_dice() for _ in range(6)]
+    asi_array.sort(reverse=True)  # Sort in descending order for easy assignment
+
+    # Mapping for highest ability score by class
+    class_mapping = {
+        "Cleric": "Wisdom",
+        "Druid": "Wisdom",
+        "Ranger": "Wisdom",
+        "Bard": "Charisma",
+        "Paladin": "Charisma",
+        "Sorcerer": "Charisma",
+        "Warlock": "Charisma",
+        "Barbarian": "Strength",
+        "Fighter": "Strength",
+        "Monk": "Dexterity",
+        "Rogue": "Dexterity",
+        "Wizard": "Intelligence",
+        "Artificer": "Intelligence"
+    }
+
+    # Get the primary ability for the class
+    primary_ability = class_mapping.get(character_class, "Strength")
+
+    # Create a dictionary to hold ability scores
+    ability_scores = {
+        "Strength": 0,
+        "Dexterity": 0,
+        "Constitution": 0,
+        "Intelligence": 0,
+        "Wisdom": 0,
+        "Charisma": 0
+    }
+
+    # Assign the highest roll to the primary ability
+    ability_scores[primary_ability] = asi_array[0]
+
+    # Assign the remaining 5 values to the other abilities randomly
+    remaining_abilities = [key for key in ability_scores if key != primary_ability]
+    random.shuffle(remaining_abilities)
+    for i, ability in enumerate(remaining_abilities):
+        ability_scores[ability] = asi_array[i + 1]
+
+    return ability_scores
+
+# Function to apply racial bonuses to ability scores
+def apply_racial_bonuses(race, ability_scores):
+    if race == "Human":
+        for key in ability_scores:
+            ability_scores[key] += 1
+    elif race == "Half-Elf":
+        ability_scores["Charisma"] += 1
+        random_keys = random.sample([key for key in ability_scores if key != "Charisma"], 2)
+        for key in random_keys:
+            ability_scores[key] += 1
+    elif race == "Elf":
+        ability_scores["Dexterity"] += 2
+    elif race == "Half-Orc":
+        ability_scores["Strength"] += 2
+        ability_scores["Constitution"] += 1
+    elif race == "Dragonborn":
+        ability_scores["Strength"] += 2
+        ability_scores["Charisma"] += 1
+    elif race == "Dwarf":
+        ability_scores["Constitution"] += 2
+    elif race == "Gnome":
+        ability_scores["Intelligence"] += 2
+    elif race == "Halfling":
+        ability_scores["Dexterity"] += 2
+    elif race == "Tiefling":
+        ability_scores["Charisma"] += 2
+
+
+def calculate_modifier_value(score):
+    return (score - 10) // 2
+
+# Function to calculate passive perception
+def calculate_passive_perception(wisdom_score):
+    return 10 + (wisdom_score - 10) // 2
+
+# Function to calculate armor class
+def calculate_armor_class(character_class, dexterity_score):
+    dex_mod = (dexterity_score - 10) // 2
+    if character_class in ["Wizard", "Monk", "Sorcerer"]:
+        return 10 + dex_mod
+    elif character_class in ["Artificer", "Bard", "Druid", "Rogue", "Warlock"]:
+        return min(14, 12 + dex_mod)
+    elif character_class in ["Barbarian", "Cleric", "Ranger"]:
+        return min(16, 14 + dex_mod)
+    else:
+        return 18
+
+# Function to calculate hit points
+def calculate_hit_points(character_class, level, constitution_score):
+    con_mod = (constitution_score - 10) // 2
+    if character_class in ["Sorcerer", "Wizard"]:
+        return 6 + (level - 1) * 4 + (level * con_mod)
+    elif character_class in ["Artificer", "Bard", "Cleric", "Druid", "Monk", "Rogue", "Warlock"]:
+        return 8 + (level - 1) * 5 + (level * con_mod)
+    elif character_class in ["Fighter", "Paladin", "Ranger"]:
+        return 10 + (level - 1) * 6 + (level * con_mod)
+    elif character_class == "Barbarian":
+        return 12 + (level - 1) * 7 + (level * con_mod)
+    else:
+        return 10 + (level - 1) * 5 + (level * con_mod)  # Default case
+
+# Ability each class casts spells with
+class_spell_modifier_mapping = {
+    "Wizard": "Intelligence",
+    "Rogue": "Intelligence",
+    "Fighter": "Intelligence",
+    "Artificer": "Intelligence",
+    "Cleric": "Wisdom",
+    "Monk": "Wisdom",
+    "Druid": "Wisdom",
+    "Ranger": "Wisdom",
+    "Warlock": "Charisma",
+    "Bard": "Charisma",
+    "Barbarian": "Charisma",
+    "Paladin": "Charisma",
+    "Sorcerer": "Charisma"
+}
+
+# Function to calculate the attack modifier, spell attack modifier and spell save DC
+def calculate_combat_modifiers(character_class, level, ability_scores):
+    proficiency = math.ceil(level / 4) + 1
+    attack_modifier = proficiency + max(
+        calculate_modifier_value(ability_scores['Strength']),
+        calculate_modifier_value(ability_scores['Dexterity'])
+    )
+    spell_change = calculate_modifier_value(ability_scores[class_spell_modifier_mapping.get(character_class, 'Intelligence')])
+    spell_attack_modifier = proficiency + spell_change
+    return attack_modifier, spell_attack_modifier, spell_attack_modifier + 8
+
+# OpenAI image URLs stop working after about an hour, so cached image URLs expire a little sooner
+IMAGE_URL_TTL = 50 * 60
+
+# Function to run a chat completion through the response cache, returns the message text
+# seed is only sent to OpenAI when given, cache_policy is one of the llm_cache policies (None for the default)
+# purpose is the name the token usage of the call is logged under
+def chat_completion(messages, model="gpt-4o-mini", temperature=1, seed=None, cache_policy=None, purpose="chat"):
+    request = {"model": model, "messages": messages, "temperature": temperature, "seed": seed}
+
+    def compute():
+        extra = {"seed": seed} if seed is not None else {}
+        start = time.perf_counter()
+        response = openai_client.chat(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            **extra
+        )
+        record_usage(purpose, model, response.usage, time.perf_counter() - start)
+        return response.choices[0].message.content
+
+    return cached_call("chat", request, compute, policy=cache_policy)
+
+# Function to generate a town description using OpenAI API
+def generate_town_description(town_name, town_type, town_population, unique_characters, cache_policy=None):
+    system_message = "You are to generate a description of 3-5 sentences of a fantasy town in Dnd 5e, and you should talk about the vibe of the town, the weather, the surrounding environment and any locations of note. In each request from here on, You will receive the town name, population size and number of unique characters. Generate the relevant information with each prompt, but do not list any characters by specific name."
+    prompt = f"Town Name: {town_name}, Town Type: {town_type}, Town Population: {town_population}, Unique Characters: {unique_characters}"
+    
+    return chat_completion(
+        [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=1,
+        cache_policy=cache_policy,
+        purpose="description"
+    )
+
+def generate_town_history(town_name, description, cache_policy=None):
+    system_message = "You are to generate a history of a fantasy town in Dnd 5e, and in 3 sentences you should talk about how old the town is, what person/group founded it and why, and any fun and interesting facts about the town. In each request from here on, You will receive the town name, and a description of the settlement."
+    prompt = f"Town Name: {town_name}, Description: {description}"
+    
+    return chat_completion(
+        [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=1,
+        cache_policy=cache_policy,
+        purpose="history"
+    )
+
+TOWN_LORE_SYSTEM_MESSAGE = "You are to write about a fantasy town in Dnd 5e. You will receive the town name, town type, population size and number of unique characters. Answer with a description of 3-5 sentences that talks about the vibe of the town, the weather, the surrounding environment and any locations of note, a history of 3 sentences that talks about how old the town is, what person/group founded it and why, and any fun and interesting facts about the town, and a short list of notable locations in the town (names only, may be empty). Do not list any characters by specific name."
+
+# JSON schema the combined call is constrained to, strict mode needs every field listed as required
+TOWN_LORE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "town_lore",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "description": {"type": "string"},
+                "history": {"type": "string"},
+                "notable_locations": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["description", "history", "notable_locations"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Function to check a combined town lore answer, raises ValueError when it isn't usable
+def parse_town_lore(content):
+    lore = json.loads(content)
+    if not isinstance(lore, dict):
+        raise ValueError("Town lore is not an object")
+    for field in ("description", "history"):
+        if not isinstance(lore.get(field), str) or not lore[field].strip():
+            raise ValueError(f"Town lore has no {field}")
+    locations = lore.get("notable_locations") or []
+    if not isinstance(locations, list) or not all(isinstance(location, str) for location in locations):
+        raise ValueError("Town lore has malformed notable locations")
+    return {
+        "description": lore["description"].strip(),
+        "history": lore["history"].strip(),
+        "notable_locations": [location.strip() for location in locations if location.strip()]
+    }
+
+# Function to write the town description, history and notable locations in one structured call
+# Answers that fail parse_town_lore are never cached, they raise ValueError instead
+def generate_town_lore_combined(town_name, town_type, town_population, unique_characters, cache_policy=None):
+    messages = [
+        {"role": "system", "content": TOWN_LORE_SYSTEM_MESSAGE},
+        {"role": "user", "content": f"Town Name: {town_name}, Town Type: {town_type}, Town Population: {town_population}, Unique Characters: {unique_characters}"}
+    ]
+    request = {"model": "gpt-4o-mini", "messages": messages, "temperature": 1, "seed": None, "response_format": TOWN_LORE_FORMAT}
+
+    def compute():
+        start = time.perf_counter()
+        response = openai_client.chat(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=1,
+            response_format=TOWN_LORE_FORMAT
+        )
+        record_usage("town_lore", "gpt-4o-mini", response.usage, time.perf_counter() - start)
+        message = response.choices[0].message
+        if getattr(message, "refusal", None):
+            raise ValueError(f"Town lore refused: {message.refusal}")
+        parse_town_lore(message.content)
+        return message.content
+
+    return parse_town_lore(cached_call("chat", request, compute, policy=cache_policy))
+
+# Function to get the description, history and notable locations of a town
+# Returns {"description", "history", "notable_locations"}, one OpenAI round trip in "combined" mode
+def generate_town_lore(town_name, town_type, town_population, unique_characters, cache_policy=None):
+    if TOWN_LORE_MODE == "combined":
+        try:
+            return generate_town_lore_combined(town_name, town_type, town_population, unique_characters, cache_policy)
+        except (ValueError, openai.BadRequestError) as e:
+            logger.warning("Combined town lore failed, falling back to two calls: %r", e)
+    description = generate_town_description(town_name, town_type, town_population, unique_characters, cache_policy)
+    history = generate_town_history(town_name, description, cache_policy)
+    return {"description": description, "history": history, "notable_locations": []}
+
+# Function to build the chat messages for a quest request, see prompt_builder
+# quest_giver is the [N|A|C] entry suggested as the quest giver, a random character when not given
+# (and none at all when the settlement has no characters)
+def build_quest_messages(town_name, character_data, quest_giver=None):
+    if quest_giver is None and character_data:
+        quest_giver = random.choice(character_data)
+    return build_quest_prompt(town_name, character_data, quest_giver)
+
+def generate_quest(town_name, character_data, cache_policy=None, quest_giver=None):
+    return chat_completion(build_quest_messages(town_name, character_data, quest_giver), temperature=1, cache_policy=cache_policy, purpose="quest")
+
+# Function to generate a quest token by token, yields pieces of text as they arrive
+# A cached quest is yielded in one piece, a streamed one is stored once it is complete
+def generate_quest_stream(town_name, character_data, cache_policy=None, quest_giver=None):
+    messages = build_quest_messages(town_name, character_data, quest_giver)
+    request = {"model": "gpt-4o-mini", "messages": messages, "temperature": 1, "seed": None}
+    policy = cache_policy or DEFAULT_POLICY
+    cache = get_llm_cache()
+    key = cache_key("chat", request)
+
+    if policy != FRESH:
+        quest = cache.get(key)
+        if quest is not None:
+            yield quest
+            return
+        if policy == CACHE_ONLY:
+            raise CacheMiss("No cached chat response")
+
+    start = time.perf_counter()
+    stream = openai_client.chat_stream(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=1,
+        # The last chunk then carries the token usage of the whole request
+        stream_options={"include_usage": True}
+    )
+    pieces = []
+    first_token_seconds = None
+    usage = None
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            pieces.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    record_usage("quest", "gpt-4o-mini", usage, time.perf_counter() - start, first_token_seconds)
+    cache.put(key, "chat", "".join(pieces))
+
+# Function to generate the town image, returns its URL
+# With with_created_at=True it returns (url, created_at), a cached URL can be most of IMAGE_URL_TTL old already
+def generate_town_image(town_name, town_type, description, cache_policy=None, with_created_at=False):
+    townPrompt = f"A fantasy town called {town_name}, which is a {town_type}. {description} Show the town from a bird's eye view with elements like buildings, roads, and natural surroundings. You CANNOT generate text or boxes in the image generation, ONLY the town itself image only without typography. It should not contain any text, labels, borders, measurements nor design elements of any kind.. Do NOT add any details to this prompt, this is for testing purposes only."
+    
+    request = {"model": "dall-e-3", "prompt": townPrompt, "size": "1024x1792", "quality": "standard"}
+
+    def compute():
+        response = openai_client.image(
+            model = "dall-e-3",
+            prompt = townPrompt,
+            size = "1024x1792",
+            quality = "standard",
+            n = 1,
+        )
+        return response.data[0].url
+
+    return cached_call("image", request, compute, policy=cache_policy, ttl=IMAGE_URL_TTL, with_created_at=with_created_at)
+
+
+# Function to generate a quest and split it into its sections
+def generate_quest_record(town_name, character_data, cache_policy=None, quest_giver=None):
+    quest_text = generate_quest(town_name, list(character_data), cache_policy=cache_policy, quest_giver=quest_giver)
+    quest = parse_quest(quest_text)
+    return {
+        "quest_text": quest_text,
+        "title": quest_title(quest),
+        "giver": quest.giver,
+        "background": quest.background,
+        "stages": quest.stages,
+        "resolutions": quest.resolutions,
+        "conclusion": quest.conclusion
+    }
+
+# Function to generate a whole settlement without the website, returns a JSON friendly dict
+# With use_llm=False the description, history, image and quests are skipped and no OpenAI calls are made
+# initializer runs in every worker thread, like in build_characters
+# on_progress, if given, is called with (event, value) while the settlement is being built, from worker threads:
+#   "settlement"   {"name", "size", "population", "unique_characters"}, before anything else
+#   "npc"          the character info of every NPC as soon as it is built
+#   "lore"         {"description", "history", "notable_locations"} once the town text exists
+#   "image"        the DALL-E URL, "image_store" the id of the stored copy (None if it couldn't be stored)
+def generate_settlement(settlement_size, custom_name="", use_llm=True, quest_count=0, cache_policy=None, initializer=None, on_progress=None):
+    settlement_name = generate_settlement_name(custom_name)
+    population = generate_population(settlement_sizes[settlement_size])
+    character_seeds, level_range = generate_characters(settlement_size)
+    unique_characters = len(character_seeds)
+
+    on_character = on_complete = None
+    if on_progress is not None:
+        on_progress("settlement", {"name": settlement_name, "size": settlement_size, "population": population, "unique_characters": unique_characters})
+        on_character = lambda character_info: on_progress("npc", character_info)
+
+        def on_complete(stage, result):
+            if stage == "image":
+                on_progress(stage, result[0])
+            elif stage != "npcs":
+                on_progress(stage, result)
+
+    stages = [Stage("npcs", lambda: build_characters(character_seeds, level_range, initializer=initializer, on_character=on_character))]
+    if use_llm:
+        stages += [
+            Stage("lore", lambda: generate_town_lore(settlement_name, settlement_size, population, unique_characters, cache_policy)),
+            Stage("image", lambda lore: generate_town_image(settlement_name, settlement_size, lore["description"], cache_policy, with_created_at=True), deps=["lore"]),
+            Stage("image_store", lambda image: store_image(image[0]), deps=["image"]),
+        ]
+    generation = run_stages(stages, initializer=initializer, on_complete=on_complete)
+    characters, failed_characters = generation.results["npcs"]
+
+    quests = []
+    if use_llm and characters:
+        character_data = [f"[{c['name']}|{c['alignment']}|{c['class']}]" for c in characters]
+        # Different suggested quest givers so quests of one settlement don't share a prompt (and cache entry)
+        quest_givers = random.sample(character_data, min(quest_count, len(character_data)))
+        quests = [
+            generate_quest_record(settlement_name, character_data, cache_policy, quest_givers[i % len(quest_givers)])
+            for i in range(quest_count)
+        ]
+
+    lore = generation.results.get("lore", {})
+    image_url, image_created_at = generation.results.get("image", (None, None))
+    return {
+        "name": settlement_name,
+        "size": settlement_size,
+        "population": population,
+        "unique_characters": unique_characters,
+        "description": lore.get("description", ""),
+        "history": lore.get("history", ""),
+        "notable_locations": lore.get("notable_locations", []),
+        "image_url": image_url,
+        "image_created_at": image_created_at,
+        "image_id": generation.results.get("image_store"),
+        "npcs": characters,
+        "failed_npcs": failed_characters,
+        "quests": quests,
+        "timings": {name: round(generation.duration(name), 3) for name in generation.timings},
+        "total_seconds": round(generation.total_seconds, 3),
+    }
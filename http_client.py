@@ -0,0 +1,248 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+# Connection and read timeouts in seconds, so one slow upstream can't hang the script forever
+CONNECT_TIMEOUT = float(os.environ.get("INSPIRAITION_HTTP_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("INSPIRAITION_HTTP_READ_TIMEOUT", 10))
+
+# Keep-alive pool settings, at most MAX_CONNECTIONS_PER_HOST open sockets to any single host
+MAX_HOSTS = 10
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("INSPIRAITION_HTTP_MAX_CONNECTIONS", 8))
+
+# Retry settings, the n-th retry waits a random time up to BACKOFF_BASE * 2**n (capped at BACKOFF_MAX)
+MAX_RETRIES = int(os.environ.get("INSPIRAITION_HTTP_RETRIES", 3))
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Coalesced fetches (get_json with coalesce=True): results are shared for this many seconds, 0 only shares in-flight requests
+COALESCE_TTL = float(os.environ.get("INSPIRAITION_HTTP_COALESCE_TTL", 30))
+# Most shared results kept at once, the oldest go first
+COALESCE_MAX_ENTRIES = 512
+
+
+class EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "total_seconds", "max_seconds", "coalesced", "cache_hits")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # Calls that never reached the upstream: joined another caller's request, or served from the shared results
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "avg_ms": round(1000 * self.total_seconds / self.requests, 1) if self.requests else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 1),
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+# Coalesced fetches in progress and recently finished ones, by (url, params)
+_flights = {}
+_recent = OrderedDict()
+_flights_lock = threading.Lock()
+
+
+# Function to get the shared session, every request made through it reuses pooled connections
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # pool_block makes callers wait for a free connection instead of opening extra ones
+                adapter = HTTPAdapter(pool_connections=MAX_HOSTS, pool_maxsize=MAX_CONNECTIONS_PER_HOST, pool_block=True, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+# Function to turn a URL into the endpoint name its stats are recorded under
+def endpoint_name(url):
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+def _endpoint_stats(endpoint):
+    stats = _stats.get(endpoint)
+    if stats is None:
+        stats = _stats[endpoint] = EndpointStats()
+    return stats
+
+
+def _record(endpoint, seconds, error, retried):
+    with _stats_lock:
+        stats = _endpoint_stats(endpoint)
+        stats.requests += 1
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        if error:
+            stats.errors += 1
+        if retried:
+            stats.retries += 1
+
+
+# Function to work out how long to wait before the next attempt
+def backoff_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+    # "Full jitter" so a burst of failing callers doesn't retry in lockstep
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+# Function to GET a URL with timeouts and retries, returns the final response
+# Raises requests.RequestException if the host could not be reached after all retries
+def get(url, params=None, timeout=None, retries=MAX_RETRIES):
+    endpoint = endpoint_name(url)
+    with tracing.span("http.get", host=urlsplit(url).netloc):
+        return _get(url, endpoint, params, timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), retries)
+
+
+def _get(url, endpoint, params, timeout, retries):
+    session = get_session()
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(endpoint, time.perf_counter() - start, True, attempt > 0)
+            if attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        failed = response.status_code >= 400
+        _record(endpoint, time.perf_counter() - start, failed, attempt > 0)
+        if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+            time.sleep(backoff_delay(attempt, response))
+            continue
+        return response
+
+
+# Function to GET a URL and decode the JSON body, raises on any HTTP error
+# With coalesce=True concurrent callers asking for the same URL and params share one request, and its result
+# is shared for COALESCE_TTL seconds afterwards. Only for idempotent resources (not e.g. random names),
+# and the returned JSON is shared between callers, so it must not be modified
+def get_json(url, params=None, timeout=None, coalesce=False):
+    if not coalesce:
+        return _get_json(url, params, timeout)
+
+    key = (url, tuple(sorted((params or {}).items())))
+    with _flights_lock:
+        cached = _recent.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            _record_saved(endpoint_name(url), "cache_hits")
+            return cached[1]
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        _record_saved(endpoint_name(url), "coalesced")
+        with tracing.span("http.coalesced", host=urlsplit(url).netloc):
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _get_json(url, params, timeout)
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+            if flight.error is None and COALESCE_TTL > 0:
+                _recent[key] = (time.monotonic() + COALESCE_TTL, flight.result)
+                _recent.move_to_end(key)
+                while len(_recent) > COALESCE_MAX_ENTRIES:
+                    _recent.popitem(last=False)
+        flight.done.set()
+    return flight.result
+
+
+def _get_json(url, params, timeout):
+    response = get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+# One coalesced request, the callers that join it wait on done and then read result or error
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _record_saved(endpoint, field):
+    with _stats_lock:
+        stats = _endpoint_stats(endpoint)
+        setattr(stats, field, getattr(stats, field) + 1)
+
+
+# Function to get a snapshot of latency and error counts per endpoint
+def get_stats():
+    with _stats_lock:
+        return {endpoint: stats.as_dict() for endpoint, stats in _stats.items()}
+
+
+# Function to get how many calls coalescing saved in total, over all endpoints
+def get_coalescing_stats():
+    with _stats_lock:
+        upstream = sum(stats.requests for stats in _stats.values())
+        coalesced = sum(stats.coalesced for stats in _stats.values())
+        cache_hits = sum(stats.cache_hits for stats in _stats.values())
+    with _flights_lock:
+        in_flight, shared = len(_flights), len(_recent)
+    return {
+        "upstream_requests": upstream,
+        "coalesced": coalesced,
+        "cache_hits": cache_hits,
+        "saved": coalesced + cache_hits,
+        "in_flight": in_flight,
+        "shared_results": shared,
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# Function to drop every shared result, the next coalesced call for each resource goes upstream again
+def clear_shared_results():
+    with _flights_lock:
+        _recent.clear()
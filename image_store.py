@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import re
+import threading
+
+import requests
+from PIL import Image
+
+import http_client
+import tracing
+
+# Generated town art is kept here; Streamlit serves the static/ folder at app/static/ (see .streamlit/config.toml)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL_PREFIX = "app/static"
+IMAGE_DIR = os.environ.get("INSPIRAITION_IMAGE_DIR", os.path.join(STATIC_DIR, "town_images"))
+
+
+# Function to get the URL Streamlit serves a directory under, None if it is outside static/ and not served at all
+def static_url(directory):
+    try:
+        relative = os.path.relpath(os.path.abspath(directory), STATIC_DIR)
+    except ValueError:  # another drive on Windows
+        return None
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return None
+    return STATIC_URL_PREFIX if relative == os.curdir else "/".join([STATIC_URL_PREFIX] + relative.split(os.sep))
+
+
+# None when INSPIRAITION_IMAGE_DIR is outside static/: images can still be stored and exported (benchmarks,
+# campaign_export.py), but the website can't show them, see check_served
+IMAGE_URL_PREFIX = static_url(IMAGE_DIR)
+
+# Widths of the WebP variants written for every image, the browser picks one through srcset
+VARIANT_WIDTHS = (160, 384, 768, 1024)
+PLACEHOLDER_WIDTH = 16
+WEBP_QUALITY = 80
+
+# Least recently used images are deleted once the store grows past this many bytes
+MAX_BYTES = int(os.environ.get("INSPIRAITION_IMAGE_STORE_MAX_BYTES", 200 * 1024 * 1024))
+
+# DALL-E images are large, give the download more time than the API calls
+DOWNLOAD_TIMEOUT = (3.05, 60)
+
+# Ids are the first 32 hex digits of the image's sha256, anything else (e.g. from an edited snapshot) is not an image
+_IMAGE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_URL_INDEX = "url_index.json"
+
+
+def _variant_path(image_id, width):
+    return os.path.join(IMAGE_DIR, f"{image_id}_{width}.webp")
+
+
+def _placeholder_path(image_id):
+    return os.path.join(IMAGE_DIR, f"{image_id}_placeholder.txt")
+
+
+def _load_url_index():
+    try:
+        with open(os.path.join(IMAGE_DIR, _URL_INDEX), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_url_index(index):
+    path = os.path.join(IMAGE_DIR, _URL_INDEX)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def is_image_id(image_id):
+    return isinstance(image_id, str) and _IMAGE_ID_RE.fullmatch(image_id) is not None
+
+
+def has_image(image_id):
+    return is_image_id(image_id) and all(os.path.exists(_variant_path(image_id, width)) for width in VARIANT_WIDTHS)
+
+
+# Function to mark an image as recently used so eviction keeps it
+def touch(image_id):
+    for width in VARIANT_WIDTHS:
+        try:
+            os.utime(_variant_path(image_id, width))
+        except OSError:
+            pass
+
+
+# Function to write the WebP variants and the inline placeholder for one image
+def _write_variants(image_id, data):
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        for width in VARIANT_WIDTHS:
+            height = round(image.height * width / image.width)
+            variant = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+            variant.save(_variant_path(image_id, width), "WEBP", quality=WEBP_QUALITY, method=4)
+
+        height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+        buffer = io.BytesIO()
+        image.resize((PLACEHOLDER_WIDTH, height), Image.BILINEAR).save(buffer, "WEBP", quality=30)
+    with open(_placeholder_path(image_id), "w", encoding="utf-8") as f:
+        f.write("data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii"))
+
+
+# Function to store image bytes, returns the image id (a hash of the bytes)
+def store_image_bytes(data):
+    image_id = hashlib.sha256(data).hexdigest()[:32]
+    with _lock:
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        if not has_image(image_id):
+            _write_variants(image_id, data)
+        touch(image_id)
+        evict()
+    return image_id
+
+
+# Function to download an image once and keep it locally, returns the image id or None if it couldn't be fetched
+# The same URL (e.g. a replayed, cached DALL-E response) is only ever downloaded once
+def store_image(url):
+    if not url:
+        return None
+    with tracing.span("image_store.store"):
+        return _store_image(url)
+
+
+def _store_image(url):
+    url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    with _lock:
+        image_id = _load_url_index().get(url_key)
+    if image_id and has_image(image_id):
+        touch(image_id)
+        return image_id
+
+    try:
+        response = http_client.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        image_id = store_image_bytes(response.content)
+    except (requests.RequestException, OSError) as e:
+        logger.warning("Failed to store image %s: %r", url, e)
+        return None
+
+    with _lock:
+        index = _load_url_index()
+        index[url_key] = image_id
+        _save_url_index(index)
+    return image_id
+
+
+# Function to delete the least recently used images until the store fits MAX_BYTES
+def evict():
+    images = {}
+    for entry in os.scandir(IMAGE_DIR):
+        if entry.name == _URL_INDEX or not entry.is_file():
+            continue
+        image_id = entry.name.split("_", 1)[0]
+        stat = entry.stat()
+        size, last_used = images.get(image_id, (0, 0))
+        images[image_id] = (size + stat.st_size, max(last_used, stat.st_mtime))
+
+    total = sum(size for size, _ in images.values())
+    for image_id, (size, _) in sorted(images.items(), key=lambda item: item[1][1]):
+        if total <= MAX_BYTES:
+            break
+        for width in VARIANT_WIDTHS:
+            _remove(_variant_path(image_id, width))
+        _remove(_placeholder_path(image_id))
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def placeholder(image_id):
+    if not is_image_id(image_id):
+        return ""
+    try:
+        with open(_placeholder_path(image_id), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+# Function to make sure the website can serve stored images, raises RuntimeError if IMAGE_DIR is outside static/
+def check_served():
+    if IMAGE_URL_PREFIX is None:
+        raise RuntimeError(
+            f"INSPIRAITION_IMAGE_DIR ({IMAGE_DIR}) is outside {STATIC_DIR}, Streamlit would not serve the town images"
+        )
+
+
+def variant_url(image_id, width):
+    check_served()
+    return f"{IMAGE_URL_PREFIX}/{image_id}_{width}.webp"
+
+
+def variant_file(image_id, width=VARIANT_WIDTHS[-1]):
+    return _variant_path(image_id, width)
+
+
+# Function to build an <img> tag that shows the blurred placeholder straight away and lazily loads the right size
+def image_tag(image_id, alt, style, sizes="40vw"):
+    srcset = ", ".join(f"{variant_url(image_id, width)} {width}w" for width in VARIANT_WIDTHS)
+    return (
+        f'<img src="{variant_url(image_id, VARIANT_WIDTHS[1])}" srcset="{srcset}" sizes="{sizes}" '
+        f'loading="lazy" decoding="async" alt="{html.escape(alt)}" '
+        f'style="{style} background-image: url({placeholder(image_id)}); background-size: cover;">'
+    )
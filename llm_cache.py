@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import tracing
+
+# SQLite file holding cached OpenAI responses
+CACHE_DB_PATH = os.environ.get(
+    "INSPIRAITION_LLM_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "inspiraition", "llm_cache.sqlite3")
+)
+
+# Least recently used responses are evicted once the cache grows past either limit
+MAX_BYTES = int(os.environ.get("INSPIRAITION_LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+MAX_ENTRIES = int(os.environ.get("INSPIRAITION_LLM_CACHE_MAX_ENTRIES", 100_000))
+# Writes between two full eviction passes, which also drop expired responses and recount the table
+# (other processes, e.g. batch_generate.py workers, write to the same file)
+EVICT_EVERY = 256
+
+# Cache policies:
+#   "fresh"        always call the API, store the result for later replays
+#   "prefer_cache" use a cached response when there is one, otherwise call the API and store it
+#   "cache_only"   never call the API, raise CacheMiss when there is no cached response
+FRESH = "fresh"
+PREFER_CACHE = "prefer_cache"
+CACHE_ONLY = "cache_only"
+POLICIES = (FRESH, PREFER_CACHE, CACHE_ONLY)
+DEFAULT_POLICY = os.environ.get("INSPIRAITION_LLM_CACHE_POLICY", PREFER_CACHE)
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+# Function to build the cache key for a request, anything that changes the response has to be in request
+def cache_key(kind, request):
+    payload = json.dumps({"kind": kind, "request": request}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=CACHE_DB_PATH, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # Size of the cache as seen by this process, kept up to date by put() so it doesn't scan the table every write
+        self._entries = 0
+        self._bytes = 0
+        self._writes_since_evict = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._entries, self._bytes = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    # SQLite connections can't be shared between threads, so every thread gets its own
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    # Function to get a response together with the time it was stored, returns (value, created_at) or None
+    def lookup(self, key):
+        db = self._connection()
+        now = time.time()
+        row = db.execute("SELECT value, expires_at, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            self._count("misses")
+            return None
+        db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return row[0], row[2]
+
+    # ttl is in seconds, None keeps the response until it is evicted
+    def put(self, key, kind, value, ttl=None):
+        db = self._connection()
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        size = len(value.encode("utf-8"))
+        replaced = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        db.execute(
+            "INSERT OR REPLACE INTO responses (key, kind, value, size, created_at, last_used, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, value, size, now, now, expires_at)
+        )
+        with self._stats_lock:
+            self.stores += 1
+            if replaced is None:
+                self._entries += 1
+            self._bytes += size - (replaced[0] if replaced else 0)
+            self._writes_since_evict += 1
+            due = self._entries > self.max_entries or self._bytes > self.max_bytes or self._writes_since_evict >= EVICT_EVERY
+        if due:
+            self.evict()
+
+    # Function to drop expired responses, then the least recently used ones until the cache fits its limits
+    def evict(self):
+        db = self._connection()
+        removed = db.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)).rowcount
+        entries, total_bytes = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        freed_entries = freed_bytes = 0
+        if entries > self.max_entries or total_bytes > self.max_bytes:
+            doomed = []
+            for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if entries - freed_entries <= self.max_entries and total_bytes - freed_bytes <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                freed_entries += 1
+                freed_bytes += size
+            db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            removed += len(doomed)
+        with self._stats_lock:
+            self.evictions += removed
+            self._entries = entries - freed_entries
+            self._bytes = total_bytes - freed_bytes
+            self._writes_since_evict = 0
+
+    def stats(self):
+        entries, total_bytes = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total_bytes,
+            }
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+        with self._stats_lock:
+            self._entries = self._bytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Function to get the process wide response cache, created on first use
+def get_llm_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+# Function to look a request up in the cache according to policy, calling compute() when needed
+# compute must return a string, which is stored under the request's key
+# With with_created_at=True it returns (value, created_at), created_at being when the response was made
+def cached_call(kind, request, compute, policy=None, ttl=None, with_created_at=False):
+    policy = policy or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown cache policy: {policy}")
+    cache = get_llm_cache()
+    key = cache_key(kind, request)
+
+    with tracing.span(f"llm.{kind}", policy=policy, cached=False) as current:
+        if policy != FRESH:
+            entry = cache.lookup(key)
+            if entry is not None:
+                current.attrs["cached"] = True
+                return entry if with_created_at else entry[0]
+            if policy == CACHE_ONLY:
+                raise CacheMiss(f"No cached {kind} response")
+
+        created_at = time.time()
+        value = compute()
+        cache.put(key, kind, value, ttl)
+        return (value, created_at) if with_created_at else value
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import random
+import threading
+from bisect import bisect
+
+# Name lists per language used to train the name models
+CORPORA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "name_corpora.json")
+
+# Native language of each race, Humans speak Common natively and pick up one extra language
+RACE_LANGUAGES = {
+    "Elf": "Elvish",
+    "Half-Elf": "Elvish",
+    "Dragonborn": "Draconic",
+    "Half-Orc": "Orc",
+    "Dwarf": "Dwarvish",
+    "Gnome": "Gnomish",
+    "Halfling": "Halfling",
+    "Tiefling": "Infernal",
+}
+
+# Races that are raised between two cultures get their first or family name from either language
+MIXED_RACES = {
+    "Half-Elf": ("Elvish", "Common"),
+    "Half-Orc": ("Orc", "Common"),
+}
+
+# Letters of context the Markov models look at, 2 keeps names pronounceable without copying the corpus
+ORDER = 2
+MIN_LENGTH = 3
+MAX_LENGTH = 12
+
+_START = "^"
+_END = "$"
+
+logger = logging.getLogger(__name__)
+
+
+# Character level Markov model trained on a list of names
+class MarkovNameModel:
+    def __init__(self, names, order=ORDER):
+        self.order = order
+        self.names = set(name.lower() for name in names)
+        counts = {}
+        for name in self.names:
+            padded = _START * order + name + _END
+            for i in range(len(padded) - order):
+                letters = counts.setdefault(padded[i:i + order], {})
+                letters[padded[i + order]] = letters.get(padded[i + order], 0) + 1
+        # Contexts are numbered, the start context is 0. Each one maps to the cumulative probabilities of its next
+        # letters (bisect on rng.random() picks one), the letters, and the number of the context each letter leads to
+        states = {_START * order: 0} if counts else {}
+        for context in counts:
+            states.setdefault(context, len(states))
+        self.transitions = [None] * len(states)
+        for context, letters in counts.items():
+            total = sum(letters.values())
+            cumulative, running = [], 0
+            for count in letters.values():
+                running += count
+                cumulative.append(running / total)
+            cumulative[-1] = 1.0
+            next_states = tuple(-1 if letter == _END else states[context[1:] + letter] for letter in letters)
+            self.transitions[states[context]] = (tuple(cumulative), tuple(letters), next_states)
+
+    def generate(self, rng=random):
+        if not self.transitions:
+            return ""
+        # Local names keep the hot loop cheap when generating thousands of names
+        transitions = self.transitions
+        uniform = rng.random
+        while True:
+            state = 0
+            letters = []
+            while state >= 0 and len(letters) <= MAX_LENGTH:
+                cumulative, next_letters, next_states = transitions[state]
+                i = bisect(cumulative, uniform())
+                letters.append(next_letters[i])
+                state = next_states[i]
+            if state < 0:
+                letters.pop()  # the end marker
+            if MIN_LENGTH <= len(letters) <= MAX_LENGTH:
+                return "".join(letters).capitalize()
+
+
+class NameEngine:
+    def __init__(self, corpora):
+        self.first_models = {}
+        self.family_models = {}
+        for language, lists in corpora.items():
+            self.first_models[language] = MarkovNameModel(lists.get("first", []))
+            if lists.get("family"):
+                self.family_models[language] = MarkovNameModel(lists["family"])
+
+    # Function to pick the languages a race's first and family names come from
+    def _languages(self, race, rng):
+        if race in MIXED_RACES:
+            first, family = MIXED_RACES[race]
+            return (first, family) if rng.random() < 0.5 else (family, first)
+        language = RACE_LANGUAGES.get(race, "Common")
+        return language, language
+
+    def name_for_race(self, race, rng=random):
+        first_language, family_language = self._languages(race, rng)
+        first = self.first_models.get(first_language, self.first_models["Common"]).generate(rng)
+        family_model = self.family_models.get(family_language)
+        # Languages without family names (e.g. Orc) go by a single name
+        if family_model is None:
+            return first
+        return f"{first} {family_model.generate(rng)}"
+
+    # Function to generate one unique name per entry in races, in the same order
+    def names_for_races(self, races, rng=random):
+        names = []
+        seen = set()
+        bynames = 0
+        for race in races:
+            name = self.name_for_race(race, rng)
+            attempts = 1
+            while name in seen and attempts < 20:
+                name = self.name_for_race(race, rng)
+                attempts += 1
+            if name in seen:
+                # The model ran out of fresh combinations, fall back to a byname
+                name = f"{name} the {len(names) + 1}{_ordinal_suffix(len(names) + 1)}"
+                bynames += 1
+            seen.add(name)
+            names.append(name)
+        if bynames:
+            logger.warning("%d of %d names fell back to a byname, the name models ran out of fresh names", bynames, len(names))
+        return names
+
+    # Function to generate count unique names for a single race
+    def generate_names(self, count, race="Human", rng=random):
+        return self.names_for_races([race] * count, rng)
+
+
+def _ordinal_suffix(n):
+    if 10 <= n % 100 <= 20:
+        return "th"
+    return {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Function to get the process wide name engine, the models are trained once on first use
+def get_name_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                with open(CORPORA_PATH, "r", encoding="utf-8") as f:
+                    _engine = NameEngine(json.load(f))
+    return _engine
+
+
+def generate_names_for_races(races, rng=random):
+    return get_name_engine().names_for_races(races, rng)
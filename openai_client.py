@@ -0,0 +1,401 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import openai
+
+import tracing
+from prompt_builder import count_tokens
+
+# Every OpenAI call of the process goes through one asyncio loop running on a background thread.
+# Calls are queued per model and per session: a dispatcher hands out turns round-robin between sessions,
+# as fast as the model's requests-per-minute and tokens-per-minute buckets allow, so one busy session
+# can't starve the others and bursts wait in the queue instead of failing with 429s.
+
+# Requests per minute and tokens per minute for each model (None for no token limit)
+# Override with e.g. INSPIRAITION_OPENAI_LIMITS='{"gpt-4o-mini": [5000, 2000000]}'
+MODEL_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "dall-e-3": (5, None),
+}
+MODEL_LIMITS.update({model: tuple(limits) for model, limits in json.loads(os.environ.get("INSPIRAITION_OPENAI_LIMITS", "{}")).items()})
+DEFAULT_LIMITS = (60, 40_000)
+
+# Most OpenAI requests in flight at once across all models
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("INSPIRAITION_OPENAI_CONCURRENCY", 16))
+
+# Retry settings, Retry-After from the API wins over the jittered exponential backoff
+MAX_RETRIES = int(os.environ.get("INSPIRAITION_OPENAI_RETRIES", 4))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Completion tokens reserved for a chat request before its real usage is known
+COMPLETION_TOKEN_ESTIMATE = 800
+
+# How often a waiting caller checks whether its session is still there
+CANCEL_POLL_SECONDS = 0.25
+
+# Session used for calls made outside a user session (warm pool, batch generator)
+BACKGROUND_SESSION = "background"
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Function to get how long until amount can be taken, requests larger than the bucket only wait for a full one
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    # A negative amount gives tokens back, e.g. when a request used fewer tokens than it reserved
+    def take(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level - min(amount, self.capacity))
+
+
+# Rate limits, fair queue and stats of one model, only ever touched from the event loop thread
+class ModelLimiter:
+    def __init__(self, model, requests_per_minute, tokens_per_minute):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        # session -> deque of (future, tokens), sessions take turns in this order
+        self._queues = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self.in_flight = 0
+        self.granted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def queued(self):
+        return {session: sum(1 for future, _ in waiters if not future.done()) for session, waiters in self._queues.items()}
+
+    # Function to wait for this session's turn and the rate limits, reserves one request and tokens
+    async def acquire(self, session, tokens):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None:
+            self._dispatcher = loop.create_task(self._dispatch())
+        future = loop.create_future()
+        self._queues.setdefault(session, deque()).append((future, tokens))
+        self._wakeup.set()
+        start = time.monotonic()
+        await future
+        waited = time.monotonic() - start
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    # Function to hold every request to this model back, used when the API answers 429
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    # Function to adjust the token bucket once the real usage of a request is known
+    def settle(self, reserved, used):
+        if self.tokens is not None:
+            self.tokens.take(used - reserved, time.monotonic())
+
+    def _next_waiter(self):
+        for session in list(self._queues):
+            waiters = self._queues[session]
+            # Cancelled callers are dropped here instead of searching the queue when they cancel
+            while waiters and waiters[0][0].done():
+                waiters.popleft()
+            if waiters:
+                return session, waiters
+            del self._queues[session]
+        return None, None
+
+    async def _dispatch(self):
+        while True:
+            session, waiters = self._next_waiter()
+            if session is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            future, tokens = waiters[0]
+            now = time.monotonic()
+            delay = max(self.blocked_until - now, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.wait_time(tokens, now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            self.requests.take(1, now)
+            if self.tokens is not None:
+                self.tokens.take(tokens, now)
+            waiters.popleft()
+            # This session goes to the back of the line
+            if waiters:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self.granted += 1
+            future.set_result(None)
+
+    def stats(self):
+        queued = self.queued()
+        return {
+            "queued": sum(queued.values()),
+            "queued_by_session": {session: count for session, count in queued.items() if count},
+            "in_flight": self.in_flight,
+            "requests": self.granted,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "avg_wait_ms": round(1000 * self.total_wait / self.granted, 1) if self.granted else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 1),
+        }
+
+
+# Function to estimate the tokens a chat request will use, prompt tokens plus a completion allowance
+def estimate_tokens(request):
+    prompt_tokens = sum(count_tokens(message["content"], request["model"]) for message in request.get("messages", ()))
+    return prompt_tokens + (request.get("max_tokens") or COMPLETION_TOKEN_ESTIMATE)
+
+
+# Function to work out how long to wait before retrying a failed call
+def retry_delay(attempt, error):
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after_ms = response.headers.get("retry-after-ms")
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after_ms:
+                return min(float(retry_after_ms) / 1000, BACKOFF_MAX)
+            if retry_after:
+                return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _default_session():
+    return None
+
+
+def _default_session_active(session):
+    return True
+
+
+class OpenAIClient:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="openai-client", daemon=True)
+        self._thread.start()
+        self._client = None
+        self._limiters = {}
+        self._semaphore = None
+        self._max_concurrent = max_concurrent
+        self._futures = {}
+        self._futures_lock = threading.Lock()
+        self.session_resolver = _default_session
+        self.session_active = _default_session_active
+
+    def _limiter(self, model):
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = ModelLimiter(model, *MODEL_LIMITS.get(model, DEFAULT_LIMITS))
+        return limiter
+
+    # Runs on the loop thread, the API client and semaphore have to be created there
+    async def _call(self, kind, request, on_chunk=None):
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(api_key=openai.api_key, max_retries=0) if openai.api_key else openai.AsyncOpenAI(max_retries=0)
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        limiter = self._limiter(request["model"])
+        reserved = estimate_tokens(request) if kind != "image" else 0
+        session = request.pop("_session")
+
+        for attempt in range(MAX_RETRIES + 1):
+            await limiter.acquire(session, reserved)
+            delivered = False
+            try:
+                async with self._semaphore:
+                    limiter.in_flight += 1
+                    try:
+                        if kind == "image":
+                            return await self._client.images.generate(**request)
+                        if kind == "chat":
+                            response = await self._client.chat.completions.create(**request)
+                            if response.usage is not None:
+                                limiter.settle(reserved, response.usage.total_tokens)
+                            return response
+                        stream = await self._client.chat.completions.create(stream=True, **request)
+                        async for chunk in stream:
+                            delivered = True
+                            if chunk.usage is not None:
+                                limiter.settle(reserved, chunk.usage.total_tokens)
+                            on_chunk(chunk)
+                        return None
+                    finally:
+                        limiter.in_flight -= 1
+            except RETRYABLE_ERRORS as e:
+                # A stream that already sent text can't be retried without repeating it
+                if attempt == MAX_RETRIES or delivered:
+                    limiter.errors += 1
+                    raise
+                delay = retry_delay(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    limiter.rate_limited += 1
+                    limiter.block(delay)
+                limiter.retries += 1
+                await asyncio.sleep(delay)
+            except openai.OpenAIError:
+                limiter.errors += 1
+                raise
+
+    def _submit(self, kind, request, on_chunk=None):
+        session = self.session_resolver() or BACKGROUND_SESSION
+        request = dict(request, _session=session)
+        future = asyncio.run_coroutine_threadsafe(self._call(kind, request, on_chunk), self._loop)
+        with self._futures_lock:
+            self._futures.setdefault(session, set()).add(future)
+        future.add_done_callback(lambda f: self._forget(session, f))
+        return session, future
+
+    def _forget(self, session, future):
+        with self._futures_lock:
+            futures = self._futures.get(session)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._futures[session]
+
+    # Function to wait for a call, giving up if the caller's session goes away in the meantime
+    def _wait(self, session, future, get):
+        while True:
+            try:
+                return get(CANCEL_POLL_SECONDS)
+            except (concurrent.futures.TimeoutError, queue.Empty):
+                if session != BACKGROUND_SESSION and not self.session_active(session):
+                    self.cancel_session(session)
+                    raise RequestCancelled(f"Session {session} went away")
+            except concurrent.futures.CancelledError:
+                raise RequestCancelled(f"Request of session {session} was cancelled")
+
+    # Function to make a chat completion, takes the arguments of openai.chat.completions.create
+    def chat(self, **request):
+        with tracing.span("openai.chat", model=request["model"]):
+            session, future = self._submit("chat", request)
+            return self._wait(session, future, lambda timeout: future.result(timeout))
+
+    # Function to stream a chat completion, yields the chunks as they arrive
+    def chat_stream(self, **request):
+        chunks = queue.Queue()
+        done = object()
+        start = time.perf_counter()
+        first_chunk = None
+        error = None
+        session, future = self._submit("chat_stream", request, chunks.put)
+        future.add_done_callback(lambda f: chunks.put(done))
+        try:
+            while True:
+                chunk = self._wait(session, future, lambda timeout: chunks.get(timeout=timeout))
+                if chunk is done:
+                    break
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+                yield chunk
+            # Raises whatever ended the stream early
+            self._wait(session, future, lambda timeout: future.result(timeout))
+        except GeneratorExit:
+            # The caller stopped reading, that isn't an error
+            raise
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            future.cancel()
+            # The stream's span is recorded at the end, a span kept open across yields would leak into the caller
+            tracing.record_span(
+                "openai.chat_stream", start, time.perf_counter(), error, model=request["model"],
+                first_chunk_ms=round(1000 * (first_chunk - start), 1) if first_chunk else None
+            )
+
+    # Function to generate an image, takes the arguments of openai.images.generate
+    def image(self, **request):
+        with tracing.span("openai.image", model=request["model"]):
+            session, future = self._submit("image", request)
+            return self._wait(session, future, lambda timeout: future.result(timeout))
+
+    # Function to cancel every queued and running call of a session
+    def cancel_session(self, session):
+        with self._futures_lock:
+            futures = list(self._futures.get(session, ()))
+        for future in futures:
+            future.cancel()
+        return len(futures)
+
+    # Function to get queue depth, wait times and error counts per model
+    def get_stats(self):
+        async def collect():
+            return {model: limiter.stats() for model, limiter in self._limiters.items()}
+        return asyncio.run_coroutine_threadsafe(collect(), self._loop).result()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Function to get the process wide client, created on first use
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAIClient()
+    return _client
+
+
+# Function to tell the client which session the calling thread belongs to and whether a session is still open
+# The website passes Streamlit's session lookups, everything else runs as BACKGROUND_SESSION
+def set_session_hooks(resolver, active):
+    client = get_client()
+    client.session_resolver = resolver
+    client.session_active = active
+
+
+def chat(**request):
+    return get_client().chat(**request)
+
+
+def chat_stream(**request):
+    return get_client().chat_stream(**request)
+
+
+def image(**request):
+    return get_client().image(**request)
+
+
+def cancel_session(session):
+    return get_client().cancel_session(session)
+
+
+def get_stats():
+    return get_client().get_stats()
@@ -0,0 +1,128 @@
+import zlib
+from dataclasses import dataclass, field
+
+# Minimal PDF 1.4 writer that streams pages straight to a file: every object is written as soon as it is added,
+# only the byte offsets of the objects and the ids of the pages are kept until close() writes the page tree
+# Text uses the standard Type 1 fonts every PDF viewer has built in (so nothing is embedded), images are JPEGs
+
+PAGE_WIDTH = 612   # US Letter in points
+PAGE_HEIGHT = 792
+
+# Font resource names used in content streams
+FONTS = {
+    "F1": "Helvetica",
+    "F2": "Helvetica-Bold",
+    "F3": "Helvetica-Oblique",
+    "F4": "Times-Bold",
+}
+
+# Helvetica advance widths (thousandths of the font size) for the printable ASCII characters, from the AFM file
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+# Bold and Times-Bold glyphs are a little wider, measuring them as Helvetica scaled by this keeps lines inside the margin
+_BOLD_SCALE = 1.08
+
+
+# Function to measure text in points, close enough to wrap lines for any of FONTS
+def text_width(text, font, size):
+    width = sum(_HELVETICA_WIDTHS[ord(char) - 32] if 32 <= ord(char) < 127 else 556 for char in text)
+    if font in ("F2", "F4"):
+        width *= _BOLD_SCALE
+    return width * size / 1000
+
+
+# Function to turn text into a PDF string literal, the fonts use WinAnsiEncoding (cp1252)
+def pdf_string(text):
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+# One image drawn on a page: JPEG data and its size in pixels
+@dataclass(frozen=True, slots=True)
+class PdfImage:
+    jpeg: bytes
+    width: int
+    height: int
+
+
+# One finished page: its content stream and the images it draws, by the resource name the stream uses
+@dataclass(slots=True)
+class PdfPage:
+    content: bytes
+    images: dict = field(default_factory=dict)
+
+
+class PdfWriter:
+    def __init__(self, file, title=None, compress=True):
+        self.file = file
+        self.compress = compress
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 1
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # The catalog and page tree ids are reserved up front, the page tree is only written by close()
+        self.catalog_id = self._reserve()
+        self.pages_id = self._reserve()
+        self._write_object(self.catalog_id, f"<< /Type /Catalog /Pages {self.pages_id} 0 R >>".encode("ascii"))
+        self.info_id = self._add_object(b"<< /Title " + pdf_string(title) + b" >>") if title else None
+        fonts = {}
+        for name, base_font in FONTS.items():
+            fonts[name] = self._add_object(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /Encoding /WinAnsiEncoding >>".encode("ascii"))
+        self.font_resources = " ".join(f"/{name} {object_id} 0 R" for name, object_id in fonts.items())
+
+    def _reserve(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(f"{object_id} 0 obj\n".encode("ascii") + body)
+        if stream is not None:
+            self.file.write(b"\nstream\n" + stream + b"\nendstream")
+        self.file.write(b"\nendobj\n")
+
+    def _add_object(self, body, stream=None):
+        object_id = self._reserve()
+        self._write_object(object_id, body, stream)
+        return object_id
+
+    def _add_stream(self, data, extra=""):
+        if self.compress:
+            data = zlib.compress(data, 6)
+            extra += " /Filter /FlateDecode"
+        return self._add_object(f"<< /Length {len(data)}{extra} >>".encode("ascii"), data)
+
+    # Function to write one page, its images and content go to the file right away
+    def add_page(self, page):
+        images = []
+        for name, image in page.images.items():
+            image_id = self._add_object(
+                f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} /ColorSpace /DeviceRGB "
+                f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(image.jpeg)} >>".encode("ascii"),
+                image.jpeg,
+            )
+            images.append(f"/{name} {image_id} 0 R")
+        content_id = self._add_stream(page.content)
+        xobjects = f" /XObject << {' '.join(images)} >>" if images else ""
+        self.page_ids.append(self._add_object(
+            f"<< /Type /Page /Parent {self.pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << {self.font_resources} >>{xobjects} >> /Contents {content_id} 0 R >>".encode("ascii")
+        ))
+
+    # Function to write the page tree, the cross-reference table and the trailer, the file is complete afterwards
+    def close(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(self.pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode("ascii"))
+        xref_offset = self.file.tell()
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id)]
+        info = f" /Info {self.info_id} 0 R" if self.info_id else ""
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root {self.catalog_id} 0 R{info} >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self.file.write("".join(lines).encode("ascii"))
@@ -0,0 +1,149 @@
+import functools
+import logging
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Builds the quest prompt so OpenAI's prompt caching can reuse it between calls.
+# The provider caches the longest previously seen prefix of a request, so everything that never changes
+# (the instructions) comes first, then what only changes per town (the town and its roster), and the one
+# per request part (the suggested quest giver) comes last.
+
+QUEST_SYSTEM_MESSAGE = "You will receive a input prompt in the format of \"Town Name:T Characters:[N|A|C], [N|A|C], [N|A|C]... Suggested Quest Giver:[N|A|C]\" where T is the name of the settlement in which the quest MUST mainly be located, and then for all unique characters in the location N is the name of a character, A is that character's moral alignment, and C is the character's class. Large towns may end the character list with a summary of the remaining townsfolk by class, these have no names and must not be named in the quest. The output MUST be Blocked out in the following sections: Quest Title, Quest Giver, Quest Background, Stages of the Quest, Possible Resolutions, and Conclusion. Do NOT use characters like # or - to separate sections. There will be many 'characters' sent in this format, and you must generate a quest given all of these characters. Each quest should be detailed and in-depth, and the name of the quest should be word play. There will be a designated quest giver that will tell the Heroes of a problem, situation or event that is happening, use the suggested quest giver unless another character fits the quest much better. You will list out the stages of the quest, listing what the quest giver wants the heroes to do, whether that be to collect something, clear out a location of monsters, convince someone of something, solve a mystery, catch a person or monster, track down a faction or secret society, steal an item or artifact, solve a murder, plan and execute a heist or unravel a political plot. These quests should be relevant to the Class and alignment of the character that is the quest-giver, and should be given out in or around the core location. For instance a wizard or sorcerer may have a quest that is more magic-aligned, a druid is nature-aligned, a rouge is sneaky-aligned, etc. The quest should have multiple stages of discovery, combat, skill checks or others that are needed to advance. In most quests, there should include some sort of revelation or twist that allows the heroes to resolve the quest in more than one way. The quest should only include named characters that are listed in the input, list out the stages of the quest in 1, 2, 3... format and then list all possible resolutions based on the player character's decisions, including rewards in either magic items and/or gold pieces, defining what the magic items do. The Possible Resolutions section should be similarly enumerated."
+
+# Most tokens the character roster may take up, characters past the budget are summarized by class
+QUEST_ROSTER_TOKEN_BUDGET = int(os.environ.get("INSPIRAITION_QUEST_ROSTER_TOKENS", 1500))
+
+# Rough size of a token when tiktoken isn't installed
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+# Function to count the tokens of a piece of text, exact with tiktoken and estimated without it
+def count_tokens(text, model="gpt-4o-mini"):
+    if tiktoken is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(_encoding(model).encode(text))
+
+
+# Function to fit [N|A|C] roster entries into a token budget
+# Returns the roster text and how many entries were summarized instead of listed
+def fit_roster(entries, budget=QUEST_ROSTER_TOKEN_BUDGET, model="gpt-4o-mini", keep=()):
+    keep = set(keep)
+    # Entries in keep are always listed, the rest in order until the budget runs out (+1 token for each ", ")
+    used = sum(count_tokens(entry, model) + 1 for entry in entries if entry in keep)
+    listed = []
+    summarized = []
+    for entry in entries:
+        if entry in keep:
+            listed.append(entry)
+            continue
+        tokens = count_tokens(entry, model) + 1
+        if used + tokens <= budget:
+            listed.append(entry)
+            used += tokens
+        else:
+            summarized.append(entry)
+
+    roster = ", ".join(listed)
+    if summarized:
+        roster += f", and {len(summarized)} more townsfolk ({summarize_classes(summarized)})"
+    return roster, len(summarized)
+
+
+# Function to summarize roster entries by class, e.g. "3 Fighters, 1 Wizard"
+def summarize_classes(entries):
+    counts = {}
+    for entry in entries:
+        character_class = entry.strip("[]").rsplit("|", 1)[-1]
+        counts[character_class] = counts.get(character_class, 0) + 1
+    return ", ".join(
+        f"{count} {character_class}{'s' if count > 1 else ''}"
+        for character_class, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    )
+
+
+# Function to build the chat messages for a quest request
+# The roster keeps its order between calls and quest_giver (picked by the caller) goes last, so repeated
+# quests for the same town share everything but the final line
+def build_quest_prompt(town_name, character_data, quest_giver, budget=QUEST_ROSTER_TOKEN_BUDGET, model="gpt-4o-mini"):
+    roster, _ = fit_roster(list(character_data), budget, model, keep=(quest_giver,) if quest_giver else ())
+    prompt = f"Town Name:{town_name}: Characters: {roster}"
+    # Without a quest giver (a settlement with no characters) the model makes one up
+    if quest_giver:
+        prompt += f"\nSuggested Quest Giver:{quest_giver}"
+    return [
+        {"role": "system", "content": QUEST_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class UsageStats:
+    __slots__ = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+        }
+
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+# Function to add up (and debug log) the token usage of one OpenAI call, usage is the usage object of the response
+def record_usage(purpose, model, usage, seconds=None, first_token_seconds=None):
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    with _usage_lock:
+        stats = _usage.get(purpose)
+        if stats is None:
+            stats = _usage[purpose] = UsageStats()
+        stats.calls += 1
+        stats.prompt_tokens += usage.prompt_tokens
+        stats.cached_tokens += cached_tokens
+        stats.completion_tokens += usage.completion_tokens
+
+    timing = ""
+    if first_token_seconds is not None:
+        timing += f", first token after {first_token_seconds:.2f}s"
+    if seconds is not None:
+        timing += f", {seconds:.2f}s total"
+    logger.debug("%s (%s): %d prompt tokens (%d cached), %d completion tokens%s",
+                 purpose, model, usage.prompt_tokens, cached_tokens, usage.completion_tokens, timing)
+
+
+# Function to get the token totals per purpose
+def get_usage():
+    with _usage_lock:
+        return {purpose: stats.as_dict() for purpose, stats in _usage.items()}
+
+
+def reset_usage():
+    with _usage_lock:
+        _usage.clear()
@@ -0,0 +1,150 @@
+import html
+import re
+
+from records import QuestRecord
+
+# Canonical section names in the order QuestRecord stores them
+QUEST_SECTIONS = [
+    "Quest Title",
+    "Quest Giver",
+    "Quest Background",
+    "Stages of the Quest",
+    "Possible Resolutions",
+    "Conclusion"
+]
+
+# Header spellings the model uses for each section, matched case-insensitively
+_SECTION_ALIASES = {
+    0: ["quest title", "quest name", "title"],
+    1: ["quest giver", "giver"],
+    2: ["quest background", "background"],
+    3: ["stages of the quest", "quest stages", "stages"],
+    4: ["possible resolutions", "resolutions"],
+    5: ["conclusion"],
+}
+_ALIAS_TO_SECTION = {alias: section for section, aliases in _SECTION_ALIASES.items() for alias in aliases}
+
+
+def _alias_pattern(aliases):
+    # Longest first so "quest stages" wins over "stages", any run of whitespace between words
+    return "|".join(r"\s+".join(map(re.escape, alias.split())) for alias in sorted(aliases, key=len, reverse=True))
+
+
+# Headers are found in one pass: a precompiled regex finds every section name in the lowercased text,
+# then each hit is checked against its surroundings with anchored regexes. A header is either
+#   a name on its own line, optionally a markdown heading and/or bold, ending in a colon or the end of the line
+#     "Quest Title: ...", "**Quest Giver:** ...", "### Stages of the Quest", "**CONCLUSION**"
+#   or a full section name followed by a colon in the middle of a line, "... Quest Giver: Bob"
+NAME_RE = re.compile(_alias_pattern(_ALIAS_TO_SECTION))
+# Used when lowercasing changes the length of the text (a few non-ASCII letters do), so offsets stay valid
+_NAME_RE_IGNORECASE = re.compile(NAME_RE.pattern, re.IGNORECASE)
+_LINE_PREFIX_RE = re.compile(r"[ \t]*(?:#{1,6}[ \t]*)?[*_]{0,3}[ \t]*")
+_LINE_SUFFIX_RE = re.compile(r"[ \t]*[*_]{0,3}[ \t]*(?::[ \t]*[*_]{0,3}|(?=[ \t]*$))", re.MULTILINE)
+_INLINE_SUFFIX_RE = re.compile(r"[ \t]*[*_]{0,3}[ \t]*:[ \t]*[*_]{0,3}")
+_CANONICAL = {section.lower() for section in QUEST_SECTIONS}
+
+_BOLD_RE = re.compile(r"\*\*(.*?)\*\*")
+_NUMBER_RE = re.compile(r"(\d+\.)")
+
+# Characters trimmed from the ends of every section, same as the quest tile always did
+_STRIP = " :#-\n\t*_"
+
+
+def _header_span(text, name_start, name_end, name, end):
+    # Header on its own line
+    line_start = text.rfind("\n", 0, name_start) + 1
+    if _LINE_PREFIX_RE.fullmatch(text, line_start, name_start):
+        suffix = _LINE_SUFFIX_RE.match(text, name_end, end)
+        if suffix:
+            return line_start, suffix.end()
+    # Full section name and a colon inside a line
+    if name in _CANONICAL:
+        header_start = name_start
+        while header_start > max(0, name_start - 3) and text[header_start - 1] in "*_":
+            header_start -= 1
+        if header_start == 0 or not (text[header_start - 1].isalnum() or text[header_start - 1] in "*_"):
+            suffix = _INLINE_SUFFIX_RE.match(text, name_end, end)
+            if suffix:
+                return header_start, suffix.end()
+    return None
+
+
+# Function to find the headers in text[start:end], yields (section index, header start, body start)
+# Only the first header of each section counts, like the old extract_quest_details (kept in benchmarks/bench_quest_parser.py)
+def scan_headers(text, start=0, end=None, seen=None):
+    seen = set() if seen is None else seen
+    end = len(text) if end is None else end
+    segment = text[start:end]
+    lowered = segment.lower()
+    if len(lowered) == len(segment):
+        matches = NAME_RE.finditer(lowered)
+    else:
+        matches = _NAME_RE_IGNORECASE.finditer(segment)
+    for match in matches:
+        name_start, name_end = start + match.start(), start + match.end()
+        if name_start > 0 and text[name_start - 1].isalnum():
+            continue
+        name = " ".join(match.group().lower().split())
+        section = _ALIAS_TO_SECTION.get(name)
+        if section is None or section in seen:
+            continue
+        span = _header_span(text, name_start, name_end, name, end)
+        if span is None:
+            continue
+        seen.add(section)
+        yield section, span[0], span[1]
+
+
+# Function to split a quest into its six raw sections, the headers are found in one scan over the text
+def split_quest_sections(quest_text):
+    parts = [""] * len(QUEST_SECTIONS)
+    headers = list(scan_headers(quest_text))
+    for i, (section, _, body_start) in enumerate(headers):
+        body_end = headers[i + 1][1] if i + 1 < len(headers) else len(quest_text)
+        parts[section] = quest_text[body_start:body_end]
+    return parts
+
+
+def _bold_italic(match):
+    inner = match.group(1)
+    if len(inner) < 50:
+        return f'<span style="font-weight:bold;font-style:italic;">{inner}</span>'
+    return inner
+
+
+def _line_break_before_number(match):
+    return match.group(1) if match.group(1) == "1." else f"<br>{match.group(1)}"
+
+
+# Function to turn the raw text of one section into HTML that is safe to drop into a quest tile
+def section_html(section, raw):
+    text = html.escape(raw.strip(_STRIP), quote=False)
+    text = _BOLD_RE.sub(_bold_italic, text).replace("**", "")
+    if section in (3, 4):
+        # Stages and resolutions are numbered lists, put every item after the first on its own line
+        text = _NUMBER_RE.sub(_line_break_before_number, text)
+    return text.strip(_STRIP)
+
+
+# Function to turn a section's raw text into plain text (used for the title and quest giver)
+def section_text(raw):
+    return _BOLD_RE.sub(r"\1", raw).replace("**", "").strip(_STRIP + '"')
+
+
+# Function to turn the raw text of one section into the value QuestRecord keeps for it
+def section_value(section, raw):
+    if section == 0:
+        return html.escape(section_text(raw) or "Untitled Quest", quote=False)
+    if section == 1:
+        return html.escape(section_text(raw), quote=False)
+    return section_html(section, raw)
+
+
+# Function to parse a generated quest into a QuestRecord whose sections are sanitized HTML
+def parse_quest(quest_text):
+    return QuestRecord(*(section_value(section, raw) for section, raw in enumerate(split_quest_sections(quest_text))))
+
+
+# Function to get the plain text title of a parsed quest, e.g. for the quest selector
+def quest_title(quest):
+    return html.unescape(quest.title)
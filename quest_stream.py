@@ -0,0 +1,58 @@
+from quest_parser import QUEST_SECTIONS, scan_headers, section_value
+from records import QuestRecord
+
+
+# Incremental version of quest_parser.split_quest_sections, fed the completion as it streams in
+# parts holds the raw text of every finished section, record() turns what has arrived so far into a QuestRecord
+# Each section is converted once when it completes, so neither feed() nor record() goes over the earlier text again
+class QuestSectionParser:
+    def __init__(self):
+        self.parts = [""] * len(QUEST_SECTIONS)
+        self._values = [section_value(section, "") for section in range(len(QUEST_SECTIONS))]
+        self.text = ""
+        # Index of the section whose body is currently streaming in, None before the first header
+        self.current = None
+        self._seen = set()
+        self._body_start = 0
+        self._scan_from = 0
+
+    def _close_current(self, end):
+        self.parts[self.current] = self.text[self._body_start:end]
+        self._values[self.current] = section_value(self.current, self.parts[self.current])
+        return self.current
+
+    # Function to add a streamed chunk, returns the indexes of the sections it completed
+    def feed(self, chunk):
+        self.text += chunk
+        # Only look at complete lines, a header at the end of the buffer might still be growing
+        # (e.g. "### Stages" that is about to become "### Stages of the Quest")
+        # The newline is searched for in the chunk alone, a quest written on one line isn't searched again every chunk
+        newline = chunk.rfind("\n")
+        if newline < 0:
+            return []
+        scan_to = len(self.text) - len(chunk) + newline + 1
+        completed = []
+        for section, header_start, body_start in scan_headers(self.text, self._scan_from, scan_to, self._seen):
+            if self.current is not None:
+                completed.append(self._close_current(header_start))
+            self.current = section
+            self._body_start = body_start
+        self._scan_from = scan_to
+        return completed
+
+    # Function to close the last section once the stream has ended
+    def finish(self):
+        completed = []
+        for section, header_start, body_start in scan_headers(self.text, self._scan_from, None, self._seen):
+            if self.current is not None:
+                completed.append(self._close_current(header_start))
+            self.current = section
+            self._body_start = body_start
+        if self.current is not None:
+            completed.append(self._close_current(len(self.text)))
+        self.current = None
+        return completed
+
+    # Function to get the finished sections as a QuestRecord for rendering
+    def record(self):
+        return QuestRecord(*self._values)
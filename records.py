@@ -0,0 +1,285 @@
+import json
+import sys
+import zlib
+from array import array
+from dataclasses import astuple, dataclass
+
+# Ability score order used by every record
+ABILITIES = ("Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma")
+
+
+# Function to calculate the ability modifier of a score as it is displayed, e.g. "+2" or "-1"
+def calculate_modifier(score):
+    modifier = (score - 10) // 2
+    sign = '+' if modifier > 0 else ''
+    return f"{sign}{modifier}"
+
+# Trait tuples and magic item pairs repeat across NPCs and sessions, so one copy of each is shared
+# Capped so snapshots uploaded by users can't grow it without bound
+_SHARED_MAX = 10_000
+_shared = {}
+
+
+def _share(value):
+    if len(_shared) >= _SHARED_MAX:
+        return _shared.get(value, value)
+    return _shared.setdefault(value, value)
+
+
+def _traits(traits):
+    return _share(tuple(sys.intern(trait) for trait in traits))
+
+
+def _magic_items(magic_items):
+    return _share(tuple(_share((sys.intern(index), sys.intern(name))) for index, name in magic_items))
+
+
+# Structured records for generated content, the HTML tiles are rendered from these
+# They are frozen so they can be hashed, which is what lets tile_renderer memoize rendered tiles per record
+# Sessions keep only these records (NPCs as an NPCTable), slotted and with the repeated strings interned,
+# and render HTML on demand
+
+@dataclass(frozen=True, slots=True)
+class NPCRecord:
+    name: str
+    race: str
+    character_class: str
+    level: int
+    alignment: str
+    size: str
+    speed: int
+    traits: tuple
+    languages: str
+    # (SRD index, name) pairs, tile_renderer turns them into links
+    magic_items: tuple
+    # In ABILITIES order, one byte per score (indexing and iterating a bytes object gives ints)
+    ability_scores: bytes
+    armor_class: int
+    hit_points: int
+    passive_perception: int
+    attack_modifier: int
+    spell_attack_modifier: int
+    spell_save: int
+
+    # Function to build a record from the dict assign_race_class_level returns
+    @classmethod
+    def from_character_info(cls, character_info):
+        return cls(
+            name=character_info["name"],
+            race=sys.intern(character_info["race"]),
+            character_class=sys.intern(character_info["class"]),
+            level=character_info["level"],
+            alignment=sys.intern(character_info["alignment"]),
+            size=sys.intern(character_info["size"]),
+            speed=character_info["speed"],
+            traits=_traits(character_info["traits"]),
+            languages=sys.intern(character_info["languages"]),
+            magic_items=_magic_items(character_info["magic_item_refs"]),
+            ability_scores=bytes(character_info["ability_scores"][ability] for ability in ABILITIES),
+            armor_class=character_info["armor_class"],
+            hit_points=character_info["hit_points"],
+            passive_perception=character_info["passive_perception"],
+            attack_modifier=character_info["attack_modifier"],
+            spell_attack_modifier=character_info["spell_attack_modifier"],
+            spell_save=character_info["spell_save"],
+        )
+
+    # Function to get this NPC in the [N|A|C] form the quest prompt uses
+    def prompt_entry(self):
+        return f"[{self.name}|{self.alignment}|{self.character_class}]"
+
+
+# The numeric NPCRecord fields, stored together in NPCTable.numbers
+_NUMBER_FIELDS = ("level", "speed", "armor_class", "hit_points", "passive_perception", "attack_modifier", "spell_attack_modifier", "spell_save")
+_NUMBERS_PER_NPC = len(_NUMBER_FIELDS) + len(ABILITIES)
+
+
+# The NPCs of a settlement stored column by column, what a session keeps instead of one object per NPC
+# Text columns are tuples of interned or shared values, the numbers and ability scores go into one array of shorts
+# Indexing or iterating builds NPCRecords on the fly, equal records hash equal so tile_renderer's caches still hit
+class NPCTable:
+    __slots__ = ("names", "races", "classes", "alignments", "sizes", "traits", "languages", "magic_items", "numbers")
+
+    def __init__(self, npcs=()):
+        npcs = tuple(npcs)
+        self.names = tuple(npc.name for npc in npcs)
+        self.races = tuple(npc.race for npc in npcs)
+        self.classes = tuple(npc.character_class for npc in npcs)
+        self.alignments = tuple(npc.alignment for npc in npcs)
+        self.sizes = tuple(npc.size for npc in npcs)
+        self.traits = tuple(npc.traits for npc in npcs)
+        self.languages = tuple(npc.languages for npc in npcs)
+        self.magic_items = tuple(npc.magic_items for npc in npcs)
+        self.numbers = array("h")
+        for npc in npcs:
+            self.numbers.extend(getattr(npc, field) for field in _NUMBER_FIELDS)
+            self.numbers.extend(npc.ability_scores)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        start = i * _NUMBERS_PER_NPC
+        level, speed, armor_class, hit_points, passive_perception, attack_modifier, spell_attack_modifier, spell_save = self.numbers[start:start + len(_NUMBER_FIELDS)]
+        return NPCRecord(
+            name=self.names[i],
+            race=self.races[i],
+            character_class=self.classes[i],
+            level=level,
+            alignment=self.alignments[i],
+            size=self.sizes[i],
+            speed=speed,
+            traits=self.traits[i],
+            languages=self.languages[i],
+            magic_items=self.magic_items[i],
+            ability_scores=bytes(self.numbers[start + len(_NUMBER_FIELDS):start + _NUMBERS_PER_NPC].tolist()),
+            armor_class=armor_class,
+            hit_points=hit_points,
+            passive_perception=passive_perception,
+            attack_modifier=attack_modifier,
+            spell_attack_modifier=spell_attack_modifier,
+            spell_save=spell_save,
+        )
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    # Function to get every NPC in the [N|A|C] form the quest prompt uses
+    def prompt_entries(self):
+        return [f"[{name}|{alignment}|{character_class}]" for name, alignment, character_class in zip(self.names, self.alignments, self.classes)]
+
+
+@dataclass(frozen=True, slots=True)
+class TownRecord:
+    name: str
+    size: str
+    population: int
+    unique_characters: int
+    description: str
+    history: str
+    image_url: str
+    # Id of the locally stored copy of the image (see image_store), empty if it couldn't be downloaded
+    image_id: str = ""
+    # Only filled in when the description and history came from the combined call (see generator.generate_town_lore)
+    notable_locations: tuple = ()
+    # Set while the settlement is still being generated and the image isn't there yet, never stored in snapshots
+    image_pending: bool = False
+
+
+# Sections hold sanitized HTML, see quest_parser.parse_quest
+@dataclass(frozen=True, slots=True)
+class QuestRecord:
+    title: str
+    giver: str
+    background: str
+    stages: str
+    resolutions: str
+    conclusion: str
+
+    @property
+    def parts(self):
+        return [self.title, self.giver, self.background, self.stages, self.resolutions, self.conclusion]
+
+
+# Quest kept in a session: the raw quest text, compressed, parsed into a QuestRecord again whenever it's shown
+# Cheaper to hold than the parsed sections, and parsing only happens for the quest on screen
+@dataclass(frozen=True, slots=True)
+class StoredQuest:
+    compressed_text: bytes
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(zlib.compress(text.encode("utf-8"), 9))
+
+    @property
+    def text(self):
+        return zlib.decompress(self.compressed_text).decode("utf-8")
+
+
+# Binary session snapshots: a format tag followed by the zlib-compressed JSON of the records as plain tuples
+SNAPSHOT_MAGIC = b"IAS1"
+
+
+# Function to pack a session (town, NPCTable and StoredQuests with their tab titles) into a small binary snapshot
+def session_to_bytes(town, npcs, quests, quest_titles):
+    payload = {
+        "town": astuple(town) if town is not None else None,
+        "npcs": [_npc_to_row(npc) for npc in npcs],
+        "quests": [quest.text for quest in quests],
+        "quest_titles": list(quest_titles),
+    }
+    return SNAPSHOT_MAGIC + zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+
+
+# Function to unpack a snapshot from session_to_bytes, returns (town, npcs, quests, quest_titles)
+# Raises ValueError if the data isn't a snapshot of this format
+def session_from_bytes(data):
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise ValueError("Not a session snapshot")
+    try:
+        payload = json.loads(zlib.decompress(data[len(SNAPSHOT_MAGIC):]))
+        town = None
+        if payload["town"] is not None:
+            town = _town_from_row(payload["town"])
+        npcs = NPCTable(_npc_from_row(row) for row in payload["npcs"])
+        quests = [StoredQuest.from_text(text) for text in payload["quests"]]
+        quest_titles = list(payload["quest_titles"])
+    except (zlib.error, KeyError, TypeError, IndexError, AttributeError) as e:
+        raise ValueError(f"Corrupt session snapshot: {e}") from e
+    if len(quests) != len(quest_titles):
+        raise ValueError("Corrupt session snapshot: quest and title counts differ")
+    return town, npcs, quests, quest_titles
+
+
+def _npc_to_row(npc):
+    row = astuple(npc)
+    # JSON has no bytes, the scores go in as a list
+    return row[:10] + (list(npc.ability_scores),) + row[11:]
+
+
+# Function to check that a snapshot value has the type (and for numbers the range) its record field needs
+# Snapshots are uploaded by users, a wrong value would otherwise only fail later, e.g. when the NPCTable packs it
+def _check(value, kind, low=-32768, high=32767):
+    if kind is int:
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(f"Corrupt session snapshot: {value!r} is not a number from {low} to {high}")
+    elif not isinstance(value, kind):
+        raise ValueError(f"Corrupt session snapshot: {value!r} is not a {kind.__name__}")
+    return value
+
+
+def _town_from_row(row):
+    name, size, population, unique_characters, description, history, image_url, image_id, notable_locations = row[:9]
+    for value in (name, size, description, history, image_url, image_id):
+        _check(value, str)
+    _check(population, int, 0, 10 ** 9)
+    _check(unique_characters, int, 0, 10 ** 9)
+    return TownRecord(
+        name, size, population, unique_characters, description, history, image_url, image_id,
+        notable_locations=tuple(_check(location, str) for location in _check(notable_locations, list)),
+    )
+
+
+def _npc_from_row(row):
+    (name, race, character_class, level, alignment, size, speed, traits, languages, magic_items,
+     ability_scores, armor_class, hit_points, passive_perception, attack_modifier, spell_attack_modifier, spell_save) = row
+    for value in (level, speed, armor_class, hit_points, passive_perception, attack_modifier, spell_attack_modifier, spell_save):
+        _check(value, int)
+    for value in (name, race, character_class, alignment, size, languages):
+        _check(value, str)
+    for trait in _check(traits, list):
+        _check(trait, str)
+    for item in _check(magic_items, list):
+        if len(_check(item, list)) != 2:
+            raise ValueError("Corrupt session snapshot: a magic item isn't an (index, name) pair")
+        _check(item[0], str)
+        _check(item[1], str)
+    if len(_check(ability_scores, list)) != len(ABILITIES):
+        raise ValueError("Corrupt session snapshot: wrong number of ability scores")
+    for score in ability_scores:
+        _check(score, int, 0, 255)
+    return NPCRecord(
+        name, sys.intern(race), sys.intern(character_class), level, sys.intern(alignment), sys.intern(size), speed,
+        _traits(traits), sys.intern(languages), _magic_items(magic_items),
+        bytes(ability_scores), armor_class, hit_points, passive_perception, attack_modifier, spell_attack_modifier, spell_save,
+    )
@@ -0,0 +1,168 @@
+import os
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+import stat_engine
+from name_engine import get_name_engine
+
+# The citizens of a settlement beyond its named NPCs: thousands of lightweight entries with stats but no SRD detail
+# Stats come from stat_engine in one vectorized batch, names from the name engine, and everything is kept column by
+# column. Traits, languages and magic items are only filled in when an entry is opened (generator.roster_character_info)
+
+# Most citizens kept per settlement, a Metropolis would otherwise hold up to 150,000
+ROSTER_MAX_SIZE = int(os.environ.get("INSPIRAITION_ROSTER_MAX_SIZE", 10_000))
+# Entries shown per roster page
+ROSTER_PAGE_SIZE = 24
+# Filter results kept per roster, so paging through one filter doesn't look it up again
+QUERY_CACHE_SIZE = 16
+
+# Alignment codes are 3 * law/chaos + good/evil, the same combinations generator.generate_alignment picks from
+ALIGNMENTS = [
+    "Lawful Good", "Lawful Neutral", "Lawful Evil",
+    "Neutral Good", "True Neutral", "Neutral Evil",
+    "Chaotic Good", "Chaotic Neutral", "Chaotic Evil",
+]
+_ALIGNMENT_CODES = {alignment: code for code, alignment in enumerate(ALIGNMENTS)}
+
+# stat_engine codes unknown races and classes as the row after its tables
+_RACE_LABELS = stat_engine.RACES + ["Unknown"]
+_CLASS_LABELS = stat_engine.CLASSES + ["Unknown"]
+
+_NO_ROWS = np.empty(0, dtype=np.int32)
+
+
+# What a roster page shows of one citizen, row is the entry's position in the roster
+@dataclass(frozen=True, slots=True)
+class RosterEntry:
+    row: int
+    name: str
+    race: str
+    character_class: str
+    level: int
+    alignment: str
+    armor_class: int
+    hit_points: int
+
+
+# Function to index a column of codes: code -> sorted array of the rows holding it
+def build_index(values):
+    order = np.argsort(values, kind="stable").astype(np.int32)
+    codes, starts = np.unique(values[order], return_index=True)
+    return {int(code): rows for code, rows in zip(codes, np.split(order, starts[1:]))}
+
+
+class Roster:
+    def __init__(self, names, stats, alignments, seed):
+        self.stats = stats
+        self.alignments = alignments
+        # Seeds the details drawn when an entry is opened, so reopening an entry shows the same citizen
+        self.seed = seed
+        # All names in one string, entry i spans _name_starts[i] up to the separator before _name_starts[i + 1]
+        self._names = "\n".join(names)
+        self._name_starts = np.zeros(len(names) + 1, dtype=np.int32)
+        np.cumsum([len(name) + 1 for name in names], out=self._name_starts[1:])
+        self._indexes = {
+            "race": build_index(stats.races),
+            "class": build_index(stats.classes),
+            "level": build_index(stats.levels),
+            "alignment": build_index(alignments),
+        }
+        # Rosters are shared between sessions (see dndsitetester.get_roster), so the filter results are locked
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.alignments)
+
+    def name(self, row):
+        return self._names[self._name_starts[row]:self._name_starts[row + 1] - 1]
+
+    def entry(self, row):
+        stats = self.stats
+        return RosterEntry(
+            row=int(row),
+            name=self.name(row),
+            race=_RACE_LABELS[stats.races[row]],
+            character_class=_CLASS_LABELS[stats.classes[row]],
+            level=int(stats.levels[row]),
+            alignment=ALIGNMENTS[self.alignments[row]],
+            armor_class=int(stats.armor_class[row]),
+            hit_points=int(stats.hit_points[row]),
+        )
+
+    # Function to get the races, classes and levels present in the roster, for filter choices
+    def races(self):
+        return [_RACE_LABELS[code] for code in self._indexes["race"]]
+
+    def classes(self):
+        return [_CLASS_LABELS[code] for code in self._indexes["class"]]
+
+    def levels(self):
+        return list(self._indexes["level"])
+
+    # Function to find the rows matching every given filter, an empty filter matches everything
+    # races, classes and alignments are names, levels are ints. Returns a sorted array of rows
+    def find(self, races=(), classes=(), levels=(), alignments=()):
+        key = (frozenset(races), frozenset(classes), frozenset(levels), frozenset(alignments))
+        with self._queries_lock:
+            rows = self._queries.get(key)
+            if rows is not None:
+                self._queries.move_to_end(key)
+                return rows
+
+        filters = [
+            ("race", stat_engine.race_codes(list(races)).tolist() if races else ()),
+            ("class", stat_engine.class_codes(list(classes)).tolist() if classes else ()),
+            ("level", levels),
+            ("alignment", [_ALIGNMENT_CODES.get(alignment, -1) for alignment in alignments]),
+        ]
+        rows = None
+        for column, codes in filters:
+            if not codes:
+                continue
+            index = self._indexes[column]
+            matches = [index[code] for code in set(codes) if code in index]
+            if len(matches) == 1:
+                matches = matches[0]
+            else:
+                matches = np.sort(np.concatenate(matches)) if matches else _NO_ROWS
+            rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+        if rows is None:
+            rows = np.arange(len(self), dtype=np.int32)
+
+        with self._queries_lock:
+            self._queries[key] = rows
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return rows
+
+    @staticmethod
+    def page_count(rows, page_size=ROSTER_PAGE_SIZE):
+        return max(1, -(-len(rows) // page_size))
+
+    # Function to get the entries on one page (counted from 0) of the rows from find
+    def page(self, rows, page, page_size=ROSTER_PAGE_SIZE):
+        return [self.entry(row) for row in rows[page * page_size:(page + 1) * page_size]]
+
+    # Bytes held by the roster's columns and indexes
+    @property
+    def nbytes(self):
+        stats = self.stats
+        columns = [stats.races, stats.classes, stats.levels, stats.ability_scores, stats.passive_perception, stats.armor_class,
+                   stats.hit_points, stats.attack_modifier, stats.spell_attack_modifier, stats.spell_save, self.alignments, self._name_starts]
+        indexes = sum(rows.nbytes for index in self._indexes.values() for rows in index.values())
+        return sum(column.nbytes for column in columns) + indexes + len(self._names.encode("utf-8"))
+
+
+# Function to generate a roster of size citizens with races and classes picked uniformly from the given names
+def generate_roster(size, level_range, race_names=stat_engine.RACES, class_names=stat_engine.CLASSES, seed=None):
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    rng = np.random.default_rng(seed)
+    stats = stat_engine.generate_population(size, level_range, rng, race_names, class_names)
+    alignments = (3 * rng.integers(0, 3, size=size) + rng.integers(0, 3, size=size)).astype(np.int8)
+    names = get_name_engine().names_for_races([_RACE_LABELS[code] for code in stats.races], random.Random(seed))
+    return Roster(names, stats, alignments, seed)
@@ -0,0 +1,291 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import http_client
+
+# Base URL for the D&D 5e API (the offline benchmark points this at a local stub)
+api_base_url = os.environ.get("INSPIRAITION_SRD_API_URL", "https://www.dnd5eapi.co/api")
+
+# Bump this whenever the layout of the snapshot file changes so stale caches get ignored
+# Version 2 added rarity and category to every magic item
+SNAPSHOT_VERSION = 2
+
+# Snapshot shipped with the repo, used on first start and whenever the API can't be reached
+BUNDLED_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "srd_snapshot.json")
+
+# Local copy of the latest snapshot fetched from the API
+CACHE_PATH = os.environ.get(
+    "INSPIRAITION_SRD_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "inspiraition", "srd_snapshot.json")
+)
+
+# How long a snapshot is considered fresh before we try to refresh it (default one week)
+CACHE_TTL_SECONDS = int(os.environ.get("INSPIRAITION_SRD_TTL", 7 * 24 * 60 * 60))
+
+# Set INSPIRAITION_OFFLINE=1 to never touch the network for SRD data
+OFFLINE = os.environ.get("INSPIRAITION_OFFLINE", "0") == "1"
+
+
+# Function to read a snapshot file, returns None if it is missing, corrupt or an old version
+def load_snapshot(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+# Function to write a snapshot atomically so a crash never leaves a half written cache behind
+def save_snapshot(snapshot, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+# Function to fetch one SRD resource as JSON
+# Coalesced, so sessions asking for the same resource at the same time share one request
+def fetch_json(path):
+    return http_client.get_json(f"{api_base_url}{path}", coalesce=True)
+
+
+# Function to fetch the details of one magic item, trimmed to what the magic item index needs
+def fetch_magic_item(item):
+    details = fetch_json(f"/magic-items/{item['index']}")
+    return {
+        "index": details["index"],
+        "name": details["name"],
+        "rarity": details.get("rarity", {}).get("name", "Varies"),
+        "category": details.get("equipment_category", {}).get("name", "Wondrous Items"),
+        "url": details.get("url", item.get("url")),
+    }
+
+
+# Function to download a complete snapshot of everything the generator needs from the API
+def fetch_snapshot():
+    races = fetch_json("/races")["results"]
+    classes = fetch_json("/classes")["results"]
+    # The list endpoint has no rarity, so every item's details are fetched, several at a time
+    with ThreadPoolExecutor(max_workers=http_client.MAX_CONNECTIONS_PER_HOST) as executor:
+        magic_items = list(executor.map(fetch_magic_item, fetch_json("/magic-items")["results"]))
+    race_details = {}
+    for race in races:
+        details = fetch_json(f"/races/{race['index']}")
+        race_details[race["index"]] = {
+            "index": details["index"],
+            "name": details["name"],
+            "size": details["size"],
+            "speed": details["speed"],
+            "traits": details["traits"],
+            "url": details.get("url", race.get("url")),
+        }
+    return {
+        "version": SNAPSHOT_VERSION,
+        "fetched_at": int(time.time()),
+        "races": races,
+        "classes": classes,
+        "race_details": race_details,
+        "magic_items": magic_items,
+    }
+
+
+# Rarity tiers from least to most powerful, "Varies" items (the +1/+2/+3 kind) count as uncommon
+RARITY_TIERS = ("common", "uncommon", "rare", "very rare", "legendary")
+_RARITY_ALIASES = {"varies": "uncommon"}
+
+# Chance of each rarity tier by NPC level, following the DMG's minimum levels per rarity
+# (rare from 5, very rare from 11, legendary from 17), as (highest level, weights in RARITY_TIERS order)
+# The SRD has only two common items, so common stays a small share even at low levels
+RARITY_WEIGHTS_BY_LEVEL = (
+    (4, (20, 80, 0, 0, 0)),
+    (10, (10, 55, 35, 0, 0)),
+    (16, (5, 25, 45, 25, 0)),
+    (20, (0, 10, 35, 35, 20)),
+)
+
+# Magic item link, the wiki keeps every magic item under wondrous-items: whatever its category
+MAGIC_ITEM_LINK = "https://dnd5e.wikidot.com/wondrous-items:{index}"
+
+
+class MagicItem:
+    __slots__ = ("index", "name", "rarity", "category", "link")
+
+    def __init__(self, index, name, rarity, category):
+        self.index = index
+        self.name = name
+        self.rarity = rarity
+        self.category = category
+        self.link = MAGIC_ITEM_LINK.format(index=index)
+
+
+# Magic items bucketed by rarity tier, built once per snapshot
+# Picking an item is a weighted choice between the five tiers and then a random.choice in the tier
+class MagicItemIndex:
+    def __init__(self, items):
+        buckets = {tier: [] for tier in RARITY_TIERS}
+        for item in items:
+            rarity = item.get("rarity", "").lower()
+            tier = _RARITY_ALIASES.get(rarity, rarity)
+            # Artifacts and anything unrated are left out, no NPC should walk around with those
+            if tier in buckets:
+                buckets[tier].append(MagicItem(item["index"], item["name"], tier, item.get("category", "")))
+        self.tiers = {tier: tuple(bucket) for tier, bucket in buckets.items()}
+        self._weights = [
+            (max_level, [weight if self.tiers[tier] else 0 for tier, weight in zip(RARITY_TIERS, weights)])
+            for max_level, weights in RARITY_WEIGHTS_BY_LEVEL
+        ]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.tiers.values())
+
+    def weights_for_level(self, level):
+        for max_level, weights in self._weights:
+            if level <= max_level:
+                return weights
+        return self._weights[-1][1]
+
+    # Function to pick count different items suited to an NPC of the given level
+    def sample(self, level, count, rng=random):
+        weights = self.weights_for_level(level)
+        if count <= 0 or not any(weights):
+            return []
+        available = sum(len(self.tiers[tier]) for tier, weight in zip(RARITY_TIERS, weights) if weight)
+        picked = {}
+        while len(picked) < min(count, available):
+            tier = rng.choices(RARITY_TIERS, weights)[0]
+            item = rng.choice(self.tiers[tier])
+            picked.setdefault(item.index, item)
+        return list(picked.values())
+
+
+class SRDCatalog:
+    def __init__(self, cache_path=CACHE_PATH, bundled_path=BUNDLED_SNAPSHOT_PATH, ttl=CACHE_TTL_SECONDS, offline=OFFLINE):
+        self.cache_path = cache_path
+        self.bundled_path = bundled_path
+        self.ttl = ttl
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._snapshot = None
+        self._race_details = {}
+        self._magic_item_index = MagicItemIndex([])
+        self.source = None
+
+        # Prefer our own cache, fall back to the bundled snapshot
+        snapshot = load_snapshot(self.cache_path)
+        if snapshot is not None:
+            self._install(snapshot, "cache")
+        else:
+            snapshot = load_snapshot(self.bundled_path)
+            if snapshot is not None:
+                self._install(snapshot, "bundled")
+
+        if self._snapshot is None and not self.offline:
+            # Nothing on disk at all, the first request has to wait for the API
+            self.refresh()
+        else:
+            self.refresh_if_stale()
+
+    # Swap in a new snapshot and rebuild the in-process index
+    def _install(self, snapshot, source):
+        race_details = dict(snapshot.get("race_details", {}))
+        magic_item_index = MagicItemIndex(snapshot.get("magic_items", []))
+        with self._lock:
+            self._snapshot = snapshot
+            self._race_details = race_details
+            self._magic_item_index = magic_item_index
+            self.source = source
+
+    def is_stale(self):
+        if self._snapshot is None:
+            return True
+        return time.time() - self._snapshot.get("fetched_at", 0) > self.ttl
+
+    # Refresh from the API, keeping whatever we already have if the API is unreachable
+    def refresh(self):
+        try:
+            snapshot = fetch_snapshot()
+        except (requests.RequestException, KeyError, ValueError):
+            return False
+        self._install(snapshot, "api")
+        try:
+            save_snapshot(snapshot, self.cache_path)
+        except OSError:
+            pass
+        return True
+
+    # Refresh a stale snapshot in the background so the page never waits on it
+    def refresh_if_stale(self):
+        if self.offline or not self.is_stale():
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="srd-catalog-refresh", daemon=True).start()
+
+    def races(self):
+        return list(self._snapshot["races"]) if self._snapshot else []
+
+    def classes(self):
+        return list(self._snapshot["classes"]) if self._snapshot else []
+
+    def magic_items(self):
+        return list(self._snapshot["magic_items"]) if self._snapshot else []
+
+    def magic_item_index(self):
+        return self._magic_item_index
+
+    def race_details(self, race_index):
+        details = self._race_details.get(race_index)
+        if details is not None or self.offline:
+            return details or {}
+
+        # Race that isn't in the snapshot (e.g. the API added one), fetch it once and remember it
+        try:
+            details = fetch_json(f"/races/{race_index}")
+        except (requests.RequestException, ValueError):
+            return {}
+        with self._lock:
+            self._race_details[race_index] = details
+        return details
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+# Function to get the process wide catalog, created on first use
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SRDCatalog()
+    return _catalog
+
+
+if __name__ == "__main__":
+    # Rebuild the bundled snapshot: python srd_catalog.py [output path]
+    import sys
+
+    output_path = sys.argv[1] if len(sys.argv) > 1 else BUNDLED_SNAPSHOT_PATH
+    save_snapshot(fetch_snapshot(), output_path)
+    print(f"Wrote SRD snapshot to {output_path}")
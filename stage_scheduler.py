@@ -0,0 +1,106 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+
+class Stage:
+    # func is called with the results of its dependencies, in the order they are listed in deps
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class StageRun:
+    def __init__(self):
+        self.results = {}
+        # Stage name -> (start, end) in seconds since the run started
+        self.timings = {}
+        self.total_seconds = 0.0
+
+    def duration(self, name):
+        start, end = self.timings[name]
+        return end - start
+
+    # Function to describe the run in one line, e.g. "description 1.20s, history 2.31s, ..."
+    def summary(self):
+        stages = sorted(self.timings, key=lambda name: self.timings[name][0])
+        parts = [f"{name} {self.duration(name):.2f}s" for name in stages]
+        return f"{', '.join(parts)} (total {self.total_seconds:.2f}s)"
+
+
+# Function to check that every dependency exists and that there are no cycles
+def _check_stages(stages):
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through stage {name}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+
+
+# Function to run stages as soon as their dependencies are done, independent stages run concurrently
+# If a stage fails nothing new is started, the running stages are waited for and the first error is raised
+# on_complete is called with (stage name, result) as soon as a stage succeeds, in the worker thread that ran it
+def run_stages(stages, max_workers=None, initializer=None, on_complete=None):
+    _check_stages(stages)
+    run = StageRun()
+    pending = list(stages)
+    running = {}
+    error = None
+    run_start = time.perf_counter()
+
+    def timed(stage, args):
+        start = time.perf_counter() - run_start
+        try:
+            with tracing.span(f"stage.{stage.name}"):
+                result = stage.func(*args)
+        finally:
+            run.timings[stage.name] = (start, time.perf_counter() - run_start)
+        if on_complete is not None:
+            on_complete(stage.name, result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1, initializer=initializer) as executor:
+        while pending or running:
+            if error is None:
+                for stage in [stage for stage in pending if all(dep in run.results for dep in stage.deps)]:
+                    pending.remove(stage)
+                    args = [run.results[dep] for dep in stage.deps]
+                    running[executor.submit(tracing.run_in_context(timed), stage, args)] = stage
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    run.results[stage.name] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+
+    run.total_seconds = time.perf_counter() - run_start
+    if error is not None:
+        raise error
+    return run
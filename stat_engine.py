@@ -0,0 +1,185 @@
+import numpy as np
+
+# Column order of every ability score array in this module
+ABILITIES = ["Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma"]
+STR, DEX, CON, INT, WIS, CHA = range(6)
+
+RACES = ["Dragonborn", "Dwarf", "Elf", "Gnome", "Half-Elf", "Half-Orc", "Halfling", "Human", "Tiefling"]
+CLASSES = ["Artificer", "Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
+
+# Races and classes that aren't in the tables get the last row, which holds the same defaults as the per-NPC functions
+UNKNOWN = -1
+
+# Fixed racial bonuses, one row per race in RACES plus a zero row for unknown races
+RACE_BONUSES = np.array([
+    # STR DEX CON INT WIS CHA
+    [2, 0, 0, 0, 0, 1],  # Dragonborn
+    [0, 0, 2, 0, 0, 0],  # Dwarf
+    [0, 2, 0, 0, 0, 0],  # Elf
+    [0, 0, 0, 2, 0, 0],  # Gnome
+    [0, 0, 0, 0, 0, 1],  # Half-Elf, plus +1 to two other random abilities
+    [2, 0, 1, 0, 0, 0],  # Half-Orc
+    [0, 2, 0, 0, 0, 0],  # Halfling
+    [1, 1, 1, 1, 1, 1],  # Human
+    [0, 0, 0, 0, 0, 2],  # Tiefling
+    [0, 0, 0, 0, 0, 0],  # Unknown
+], dtype=np.int16)
+HALF_ELF = RACES.index("Half-Elf")
+
+# Per class tables, one entry per class in CLASSES plus the default for unknown classes
+CLASS_PRIMARY = np.array([INT, STR, CHA, WIS, WIS, STR, DEX, CHA, WIS, DEX, CHA, CHA, INT, STR], dtype=np.int8)
+CLASS_SPELL_ABILITY = np.array([INT, CHA, CHA, WIS, WIS, INT, WIS, CHA, WIS, INT, CHA, CHA, INT, INT], dtype=np.int8)
+
+# AC is min(AC_CAP, AC_BASE + AC_DEX * dex_mod): unarmored, light armor, medium armor or a flat 18 in heavy armor
+AC_BASE = np.array([12, 14, 12, 14, 12, 18, 10, 18, 14, 12, 10, 12, 10, 18], dtype=np.int16)
+AC_CAP = np.array([14, 16, 14, 16, 14, 18, 99, 18, 16, 14, 99, 14, 99, 18], dtype=np.int16)
+AC_DEX = np.array([1, 1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0], dtype=np.int16)
+
+# HP is HP_FIRST + (level - 1) * HP_PER_LEVEL + level * con_mod
+HP_FIRST = np.array([8, 12, 8, 8, 8, 10, 8, 10, 10, 8, 6, 8, 6, 10], dtype=np.int16)
+HP_PER_LEVEL = np.array([5, 7, 5, 5, 5, 6, 5, 6, 6, 5, 4, 5, 4, 5], dtype=np.int16)
+
+_RACE_CODES = {race: code for code, race in enumerate(RACES)}
+_CLASS_CODES = {character_class: code for code, character_class in enumerate(CLASSES)}
+
+
+# Function to turn a list of race or class names into table rows, unknown names map to the default row
+def _codes(names, codes, unknown_row):
+    names = np.asarray(names)
+    if np.issubdtype(names.dtype, np.integer):
+        return np.where(names == UNKNOWN, unknown_row, names)
+    return np.array([codes.get(name, unknown_row) for name in names], dtype=np.int16)
+
+
+def race_codes(races):
+    return _codes(races, _RACE_CODES, len(RACES))
+
+
+def class_codes(classes):
+    return _codes(classes, _CLASS_CODES, len(CLASSES))
+
+
+def modifiers(scores):
+    return (scores - 10) // 2
+
+
+# Columnar stats for a batch of NPCs, every array has one entry (or row) per NPC
+class StatBatch:
+    def __init__(self, races, classes, levels, ability_scores):
+        self.races = races
+        self.classes = classes
+        self.levels = levels
+        self.ability_scores = ability_scores
+
+        mods = modifiers(ability_scores)
+        proficiency = (levels + 3) // 4 + 1
+        spell_mods = np.take_along_axis(mods, CLASS_SPELL_ABILITY[classes][:, None].astype(np.intp), axis=1)[:, 0]
+
+        self.passive_perception = 10 + mods[:, WIS]
+        self.armor_class = np.minimum(AC_CAP[classes], AC_BASE[classes] + AC_DEX[classes] * mods[:, DEX])
+        self.hit_points = HP_FIRST[classes] + (levels - 1) * HP_PER_LEVEL[classes] + levels * mods[:, CON]
+        self.attack_modifier = proficiency + np.maximum(mods[:, STR], mods[:, DEX])
+        self.spell_attack_modifier = proficiency + spell_mods
+        self.spell_save = self.spell_attack_modifier + 8
+
+    def __len__(self):
+        return len(self.levels)
+
+    # Function to get the batch as plain named columns, e.g. for a DataFrame or Parquet file
+    def columns(self):
+        columns = {
+            "race": np.array(RACES + ["Unknown"])[self.races],
+            "class": np.array(CLASSES + ["Unknown"])[self.classes],
+            "level": self.levels,
+        }
+        for i, ability in enumerate(ABILITIES):
+            columns[ability] = self.ability_scores[:, i]
+        columns.update({
+            "armor_class": self.armor_class,
+            "hit_points": self.hit_points,
+            "passive_perception": self.passive_perception,
+            "attack_modifier": self.attack_modifier,
+            "spell_attack_modifier": self.spell_attack_modifier,
+            "spell_save": self.spell_save,
+        })
+        return columns
+
+    # Function to get one NPC's stats in the same shape assign_race_class_level uses
+    def row(self, i):
+        return {
+            "ability_scores": {ability: int(self.ability_scores[i, j]) for j, ability in enumerate(ABILITIES)},
+            "passive_perception": int(self.passive_perception[i]),
+            "armor_class": int(self.armor_class[i]),
+            "hit_points": int(self.hit_points[i]),
+            "attack_modifier": int(self.attack_modifier[i]),
+            "spell_attack_modifier": int(self.spell_attack_modifier[i]),
+            "spell_save": int(self.spell_save[i]),
+        }
+
+
+# Function to roll 4d6 drop lowest six times for n NPCs, each row sorted highest first
+def roll_ability_scores(n, rng):
+    rolls = rng.integers(1, 7, size=(n, 6, 4), dtype=np.int16)
+    scores = rolls.sum(axis=2) - rolls.min(axis=2)
+    return -np.sort(-scores, axis=1)
+
+
+# Function to roll and assign ability scores for a batch: highest roll to the class primary, the rest shuffled
+def generate_ability_scores(classes, rng):
+    n = len(classes)
+    rolls = roll_ability_scores(n, rng)
+
+    # Sorting random keys gives a random ability order per NPC, forcing the primary's key lowest puts it first
+    keys = rng.random((n, 6))
+    keys[np.arange(n), CLASS_PRIMARY[classes]] = -1.0
+    order = np.argsort(keys, axis=1)
+
+    ability_scores = np.empty((n, 6), dtype=np.int16)
+    np.put_along_axis(ability_scores, order, rolls, axis=1)
+    return ability_scores
+
+
+# Function to apply racial bonuses to a batch of ability scores in place
+def apply_racial_bonuses(races, ability_scores, rng):
+    ability_scores += RACE_BONUSES[races]
+
+    # Half-Elves get +1 to two random abilities other than Charisma
+    half_elves = np.flatnonzero(races == HALF_ELF)
+    if len(half_elves):
+        keys = rng.random((len(half_elves), 6))
+        keys[:, CHA] = np.inf
+        picks = np.argsort(keys, axis=1)[:, :2]
+        ability_scores[half_elves[:, None], picks] += 1
+    return ability_scores
+
+
+# Function to generate the full stat block for a batch of NPCs
+# races and classes may be names or table codes, levels is an int array
+def generate_stats(races, classes, levels, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    races = race_codes(races)
+    classes = class_codes(classes)
+    levels = np.asarray(levels, dtype=np.int16)
+    ability_scores = generate_ability_scores(classes, rng)
+    apply_racial_bonuses(races, ability_scores, rng)
+    return StatBatch(races, classes, levels, ability_scores)
+
+
+# Function to generate a random population of n NPCs with uniformly picked races, classes and levels
+def generate_population(n, level_range, rng=None, race_names=RACES, class_names=CLASSES):
+    rng = rng if rng is not None else np.random.default_rng()
+    races = race_codes(race_names)[rng.integers(0, len(race_names), size=n)]
+    classes = class_codes(class_names)[rng.integers(0, len(class_names), size=n)]
+    levels = rng.integers(level_range[0], level_range[1] + 1, size=n, dtype=np.int16)
+    return generate_stats(races, classes, levels, rng)
+
+
+if __name__ == "__main__":
+    # Quick timing: python stat_engine.py [number of NPCs]
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    start = time.perf_counter()
+    batch = generate_population(n, (1, 20))
+    print(f"Generated {len(batch)} NPCs in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules live at the top of the repository, next to dndsitetester.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep every test local: SRD data from the bundled snapshot, names from the name engine
+os.environ.setdefault("INSPIRAITION_OFFLINE", "1")
+os.environ.setdefault("INSPIRAITION_NAME_SOURCE", "local")
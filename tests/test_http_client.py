@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import http_client
+
+URL = "https://srd.example.com/api/races/elf"
+ENDPOINT = "srd.example.com/api/races/elf"
+CALLERS = 8
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(http_client, "_stats", {})
+    monkeypatch.setattr(http_client, "_flights", {})
+    monkeypatch.setattr(http_client, "_recent", http_client.OrderedDict())
+
+
+# Stands in for the upstream request: counts calls and holds every one until release() is called
+class Upstream:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self._release = threading.Event()
+
+    def __call__(self, url, params, timeout):
+        self.calls += 1
+        self._release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self._release.set()
+
+
+# Function to start callers concurrent get_json calls, release the upstream once they have all joined the first one
+def call_together(upstream, callers=CALLERS, **kwargs):
+    with ThreadPoolExecutor(callers) as executor:
+        futures = [executor.submit(http_client.get_json, URL, coalesce=True, **kwargs) for _ in range(callers)]
+        deadline = time.monotonic() + 5
+        while http_client.get_stats().get(ENDPOINT, {}).get("coalesced", 0) < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        upstream.release()
+    return futures
+
+
+def test_concurrent_callers_share_one_request(monkeypatch):
+    upstream = Upstream(result={"name": "Elf"})
+    monkeypatch.setattr(http_client, "_get_json", upstream)
+    results = [future.result() for future in call_together(upstream)]
+    assert upstream.calls == 1
+    assert all(result is results[0] for result in results)
+    assert http_client.get_coalescing_stats()["coalesced"] == CALLERS - 1
+
+
+def test_results_are_shared_for_the_ttl(monkeypatch):
+    upstream = Upstream(result={"name": "Elf"})
+    upstream.release()
+    monkeypatch.setattr(http_client, "_get_json", upstream)
+    http_client.get_json(URL, coalesce=True)
+    http_client.get_json(URL, coalesce=True)
+    assert upstream.calls == 1
+    assert http_client.get_coalescing_stats()["cache_hits"] == 1
+
+    monkeypatch.setattr(http_client, "COALESCE_TTL", 0)
+    http_client._recent.clear()
+    http_client.get_json(URL, coalesce=True)
+    http_client.get_json(URL, coalesce=True)
+    assert upstream.calls == 3
+
+
+def test_different_params_are_not_shared(monkeypatch):
+    upstream = Upstream(result={})
+    upstream.release()
+    monkeypatch.setattr(http_client, "_get_json", upstream)
+    http_client.get_json(URL, params={"page": 1}, coalesce=True)
+    http_client.get_json(URL, params={"page": 2}, coalesce=True)
+    http_client.get_json(URL, params={"page": 1})
+    assert upstream.calls == 3
+
+
+def test_errors_reach_every_waiter_and_are_not_shared(monkeypatch):
+    error = requests.ConnectionError("srd.example.com is down")
+    upstream = Upstream(error=error)
+    monkeypatch.setattr(http_client, "_get_json", upstream)
+    futures = call_together(upstream)
+    assert upstream.calls == 1
+    assert all(future.exception() is error for future in futures)
+    assert not http_client._flights
+
+    # The failure isn't remembered, the next caller tries the upstream again
+    upstream.error, upstream.result = None, {"name": "Elf"}
+    assert http_client.get_json(URL, coalesce=True) == {"name": "Elf"}
+    assert upstream.calls == 2
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import image_store
+import tile_renderer
+
+
+def test_static_url_follows_the_image_dir():
+    assert image_store.static_url(image_store.STATIC_DIR) == "app/static"
+    assert image_store.static_url(os.path.join(image_store.STATIC_DIR, "art", "towns")) == "app/static/art/towns"
+    assert image_store.static_url(os.path.join(image_store.STATIC_DIR, "town_images")) == image_store.IMAGE_URL_PREFIX
+
+
+@pytest.mark.parametrize("directory", ["/tmp/town_images", os.path.join(image_store.STATIC_DIR, "..", "static_art")])
+def test_static_url_outside_static(directory):
+    assert image_store.static_url(directory) is None
+
+
+def test_image_dir_outside_static_fails_loudly(monkeypatch):
+    monkeypatch.setattr(image_store, "IMAGE_URL_PREFIX", None)
+    with pytest.raises(RuntimeError, match="INSPIRAITION_IMAGE_DIR"):
+        image_store.check_served()
+    with pytest.raises(RuntimeError):
+        image_store.variant_url("0" * 32, 160)
+    assert tile_renderer.safe_image_url("app/static/town_images/x.webp") == ""
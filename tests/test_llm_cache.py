@@ -0,0 +1,122 @@
+import pytest
+
+import llm_cache
+from llm_cache import CACHE_ONLY, FRESH, PREFER_CACHE, CacheMiss, LLMCache, cache_key, cached_call
+
+
+# Stands in for the time module, so last_used and expiry times are under the test's control
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    return cache
+
+
+# Function to make a compute() for cached_call that counts its calls
+def counting(value):
+    def compute():
+        compute.calls += 1
+        return f"{value} {compute.calls}"
+    compute.calls = 0
+    return compute
+
+
+def test_prefer_cache_calls_once(cache):
+    compute = counting("history")
+    assert cached_call("history", {"town": "Stonebridge"}, compute, PREFER_CACHE) == "history 1"
+    assert cached_call("history", {"town": "Stonebridge"}, compute, PREFER_CACHE) == "history 1"
+    assert compute.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_fresh_always_calls_and_replaces(cache):
+    compute = counting("history")
+    cached_call("history", {"town": "Stonebridge"}, compute, FRESH)
+    assert cached_call("history", {"town": "Stonebridge"}, compute, FRESH) == "history 2"
+    assert cached_call("history", {"town": "Stonebridge"}, compute, PREFER_CACHE) == "history 2"
+    assert compute.calls == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_cache_only(cache):
+    compute = counting("history")
+    with pytest.raises(CacheMiss):
+        cached_call("history", {"town": "Stonebridge"}, compute, CACHE_ONLY)
+    assert compute.calls == 0
+    cached_call("history", {"town": "Stonebridge"}, compute)
+    assert cached_call("history", {"town": "Stonebridge"}, compute, CACHE_ONLY) == "history 1"
+
+
+def test_unknown_policy(cache):
+    with pytest.raises(ValueError):
+        cached_call("history", {}, counting("history"), "sometimes")
+
+
+def test_requests_and_kinds_get_their_own_keys():
+    assert cache_key("history", {"a": 1, "b": 2}) == cache_key("history", {"b": 2, "a": 1})
+    assert cache_key("history", {"a": 1}) != cache_key("description", {"a": 1})
+    assert cache_key("history", {"a": 1}) != cache_key("history", {"a": 2})
+
+
+def test_created_at_is_when_the_response_was_made(cache, clock):
+    compute = counting("history")
+    value, created_at = cached_call("history", {}, compute, with_created_at=True)
+    # A replay gets the time the response was stored, not the time of the replay
+    replayed, stored_at = cached_call("history", {}, compute, with_created_at=True)
+    assert replayed == value and created_at <= stored_at < clock.now
+    assert cached_call("history", {}, compute, FRESH, with_created_at=True)[1] > stored_at
+
+
+def test_expired_responses_are_misses(cache, clock):
+    cache.put("key", "history", "old", ttl=10)
+    assert cache.get("key") == "old"
+    clock.now += 60
+    assert cache.get("key") is None
+    cache.evict()
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_are_evicted_past_max_entries(tmp_path, clock):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite3"), max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, "history", key)
+    cache.get("a")
+    cache.put("d", "history", "d")
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_least_recently_used_are_evicted_past_max_bytes(tmp_path, clock):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite3"), max_bytes=250)
+    for key in "abc":
+        cache.put(key, "history", key * 100)
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 200
+    assert cache.get("a") is None and cache.get("c") == "c" * 100
+
+
+def test_limits_hold_across_instances(tmp_path, clock):
+    # Other processes write to the same file, a new instance counts what is already there
+    path = str(tmp_path / "llm_cache.sqlite3")
+    first = LLMCache(path)
+    for key in "abcd":
+        first.put(key, "history", key)
+    second = LLMCache(path, max_entries=2)
+    second.put("e", "history", "e")
+    assert second.stats()["entries"] == 2
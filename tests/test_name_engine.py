@@ -0,0 +1,38 @@
+import random
+
+from name_engine import MIN_LENGTH, MarkovNameModel, NameEngine, get_name_engine
+
+
+def test_generated_names_follow_the_corpus():
+    model = MarkovNameModel(["anna", "anne", "annie"])
+    rng = random.Random(0)
+    names = {model.generate(rng) for _ in range(200)}
+    assert all(name.startswith("Ann") for name in names)
+    assert {"Anna", "Anne", "Annie"} <= names
+
+
+def test_transition_weights():
+    # After "^b" the model writes "a" three times out of four
+    model = MarkovNameModel(["bar", "bal", "bat", "bor"])
+    rng = random.Random(1)
+    names = [model.generate(rng) for _ in range(4000)]
+    share = sum(1 for name in names if name.startswith("Ba")) / len(names)
+    assert 0.72 < share < 0.78
+
+
+def test_empty_model():
+    assert MarkovNameModel([]).generate() == ""
+
+
+def test_names_are_unique():
+    races = ["Human", "Elf", "Half-Orc", "Dwarf"] * 500
+    names = get_name_engine().names_for_races(races, random.Random(0))
+    assert len(names) == len(races) == len(set(names))
+    assert all(len(name.split()[0]) >= MIN_LENGTH for name in names)
+
+
+def test_byname_fallback_is_logged(caplog):
+    engine = NameEngine({"Common": {"first": ["bob"]}})
+    names = engine.names_for_races(["Human"] * 3, random.Random(0))
+    assert names == ["Bob", "Bob the 2nd", "Bob the 3rd"]
+    assert "2 of 3 names fell back to a byname" in caplog.text
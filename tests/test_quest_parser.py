@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+from quest_parser import _ALIAS_TO_SECTION, _SECTION_ALIASES, QUEST_SECTIONS, parse_quest, split_quest_sections
+from quest_stream import QuestSectionParser
+
+# Quests recorded from the model, the same ones benchmarks/bench_quest_parser.py times
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "quest_corpus.jsonl")
+with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+    CORPUS = [json.loads(line)["quest_text"] for line in f if line.strip()]
+
+# Title, giver and the start of the conclusion of every recorded quest
+EXPECTED = [
+    ("The Drowned Bell", "[Mara Thistle|Neutral Good|Cleric]", "With the bell silent"),
+    ("Ashes of the Old Mill", "[Borin Coalhand|Lawful Neutral|Fighter]", "The truth about the mill"),
+    # Headers in capitals, the old parser matched case-sensitively and found none of the six sections
+    ("The Goblin Tax", "[Elowen Brightleaf|Chaotic Good|Ranger]", "The north road opens again"),
+    # The whole quest on one line
+    ("The Lost Heir", "[Lady Seraphine Vale|Lawful Good|Paladin]", "House Vale owes the party"),
+    # A preamble before the first header and the colon outside the bold
+    ("Whispers in the Wine Cellar", "[Tobias Merrow|Neutral|Rogue]", "Whatever the party decides"),
+    # Other names for the sections ("Quest Name", "Giver", "Quest Stages"...), the old parser only found the conclusion
+    ("A Dragon's Debt", "[Vyrenthia|Lawful Evil|Sorcerer]", "The town learns"),
+]
+
+
+# Function to feed a quest to a QuestSectionParser in chunks of chunk_size, the way the OpenAI stream delivers it
+def stream(quest_text, chunk_size):
+    parser = QuestSectionParser()
+    for i in range(0, len(quest_text), chunk_size):
+        parser.feed(quest_text[i:i + chunk_size])
+    parser.finish()
+    return parser
+
+
+@pytest.mark.parametrize("quest_text, expected", list(zip(CORPUS, EXPECTED)))
+def test_recorded_quests(quest_text, expected):
+    title, giver, conclusion = expected
+    quest = parse_quest(quest_text)
+    assert all(quest.parts)
+    assert quest.title == title
+    assert quest.giver == giver
+    assert quest.conclusion.startswith(conclusion)
+    # Stages and resolutions are numbered lists, every item after the first on its own line
+    assert quest.stages.startswith("1.") and "<br>2." in quest.stages
+    assert quest.resolutions.startswith("1.") and "<br>2." in quest.resolutions
+
+
+def test_section_names_inside_the_text():
+    # The old parser cut a section at the first "Conclusion" or "Quest Giver" anywhere, even in the middle of a sentence
+    quest_text = (
+        "Quest Title: The Last Conclusion\n"
+        "Quest Giver: [Odo Fen|Neutral|Bard]\n"
+        "Quest Background: Odo wants the conclusion of his ballad back. The quest giver swears a rival stole it.\n"
+        "Stages of the Quest:\n1. Find the rival.\n2. Get the pages back.\n"
+        "Possible Resolutions:\n1. Return the pages.\n2. Write a better ending.\n"
+        "Conclusion: The ballad is finished at last."
+    )
+    quest = parse_quest(quest_text)
+    assert quest.title == "The Last Conclusion"
+    assert quest.background == "Odo wants the conclusion of his ballad back. The quest giver swears a rival stole it."
+    assert quest.conclusion == "The ballad is finished at last."
+
+
+def test_missing_sections_stay_empty():
+    quest = parse_quest("Some text the model wrote instead of a quest.")
+    assert quest.title == "Untitled Quest"
+    assert quest.parts[1:] == [""] * (len(QUEST_SECTIONS) - 1)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 10_000])
+@pytest.mark.parametrize("quest_text", CORPUS)
+def test_streaming_matches_the_whole_text(quest_text, chunk_size):
+    parser = stream(quest_text, chunk_size)
+    assert parser.parts == split_quest_sections(quest_text)
+    assert parser.record() == parse_quest(quest_text)
+
+
+def test_streamed_record_shows_only_finished_sections():
+    quest_text = CORPUS[1]
+    cut = quest_text.index("### Stages of the Quest") + len("### Stages of the Quest\n1. Talk")
+    parser = QuestSectionParser()
+    completed = parser.feed(quest_text[:cut])
+    assert completed == [0, 1, 2]
+    assert parser.current == 3
+    record = parser.record()
+    assert record.title == "Ashes of the Old Mill"
+    assert record.background.startswith("The old mill burned down")
+    assert record.stages == record.resolutions == record.conclusion == ""
+
+
+# Every spelling of every section, in the header styles the model writes
+@pytest.mark.parametrize("alias", [alias for aliases in _SECTION_ALIASES.values() for alias in aliases])
+@pytest.mark.parametrize("style", ["{}: body", "**{}:** body", "### {}\nbody", "**{}**: body", "{}:\nbody"])
+def test_section_aliases(alias, style):
+    section = _ALIAS_TO_SECTION[alias]
+    for name in (alias, alias.title(), alias.upper()):
+        parts = split_quest_sections("Here is your quest!\n" + style.format(name))
+        assert parts[section].strip(" :*\n") == "body", name
+        assert sum(1 for part in parts if part) == 1
+
+
+def test_longest_alias_wins():
+    # "Quest Stages" is one header, not "Quest" followed by a "Stages" header
+    parts = split_quest_sections("Quest Background: a dragon\nQuest Stages:\n1. Run.\n2. Hide.")
+    assert parts[2].strip() == "a dragon"
+    assert parts[3].strip() == "1. Run.\n2. Hide."
+
+
+def test_only_the_first_header_of_a_section_counts():
+    parts = split_quest_sections("Conclusion: the end\nConclusion: another end")
+    assert parts[5].strip() == "the end\nConclusion: another end"
@@ -0,0 +1,95 @@
+import json
+import zlib
+
+import pytest
+
+from records import SNAPSHOT_MAGIC, NPCRecord, StoredQuest, TownRecord, session_from_bytes, session_to_bytes
+
+
+def make_npc(name="Ilda Brightwater", **changes):
+    fields = dict(
+        name=name, race="Dwarf", character_class="Cleric", level=4, alignment="Lawful Good", size="Medium", speed=25,
+        traits=("Darkvision", "Dwarven Resilience"), languages="Common, Dwarvish", magic_items=(("bag-of-holding", "Bag of Holding"),),
+        ability_scores=bytes([14, 10, 16, 9, 17, 12]), armor_class=16, hit_points=35, passive_perception=13,
+        attack_modifier=5, spell_attack_modifier=6, spell_save=14,
+    )
+    fields.update(changes)
+    return NPCRecord(**fields)
+
+
+def make_snapshot(npcs=(), quests=(), titles=()):
+    town = TownRecord("Stonebridge", "Town", 1200, 12, "A river town.", "Founded by dwarves.", "https://example.com/town.png",
+                      notable_locations=("The Old Bridge",))
+    return session_to_bytes(town, list(npcs), [StoredQuest.from_text(text) for text in quests], list(titles))
+
+
+# Function to rewrite the JSON payload of a snapshot, to build corrupt ones
+def edit_payload(data, edit):
+    payload = json.loads(zlib.decompress(data[len(SNAPSHOT_MAGIC):]))
+    edit(payload)
+    return SNAPSHOT_MAGIC + zlib.compress(json.dumps(payload).encode("utf-8"))
+
+
+@pytest.mark.parametrize("field, value", [
+    ("armor_class", 70000),
+    ("hit_points", -40000),
+    ("level", "4"),
+    ("speed", 2.5),
+    ("spell_save", None),
+])
+def test_out_of_range_npc_numbers_are_rejected(field, value):
+    index = list(NPCRecord.__dataclass_fields__).index(field)
+
+    def edit(payload):
+        payload["npcs"][0][index] = value
+
+    with pytest.raises(ValueError):
+        session_from_bytes(edit_payload(make_snapshot([make_npc()]), edit))
+
+
+def test_session_round_trip():
+    npcs = [make_npc(), make_npc("Korga", race="Half-Orc", traits=(), magic_items=(), spell_save=0)]
+    quests = ["Quest Title: The Drowned Bell\nConclusion: The bell is silent.", "Quest Title: Ünïcode ✓"]
+    town, loaded, stored, titles = session_from_bytes(make_snapshot(npcs, quests, ["The Drowned Bell", "Ünïcode ✓"]))
+    assert town.name == "Stonebridge" and town.population == 1200
+    assert town.notable_locations == ("The Old Bridge",)
+    assert [loaded[i] for i in range(len(loaded))] == npcs
+    assert [quest.text for quest in stored] == quests
+    assert titles == ["The Drowned Bell", "Ünïcode ✓"]
+
+
+def test_empty_session_round_trip():
+    town, npcs, quests, titles = session_from_bytes(session_to_bytes(None, [], [], []))
+    assert town is None and len(npcs) == 0 and quests == [] and titles == []
+
+
+def _drop_npcs(payload):
+    del payload["npcs"]
+
+
+def _extra_title(payload):
+    payload["quest_titles"].append("No such quest")
+
+
+def _short_npc(payload):
+    payload["npcs"][0] = payload["npcs"][0][:5]
+
+
+def _scores_as_text(payload):
+    payload["npcs"][0][10] = "abcdef"
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: b"PK\x03\x04" + data[4:],  # not a snapshot at all
+    lambda data: data[:len(data) // 2],  # truncated download
+    lambda data: SNAPSHOT_MAGIC + zlib.compress(b"{not json"),
+    lambda data: SNAPSHOT_MAGIC + zlib.compress(b"[1, 2, 3]"),
+    lambda data: edit_payload(data, _drop_npcs),
+    lambda data: edit_payload(data, _extra_title),
+    lambda data: edit_payload(data, _short_npc),
+    lambda data: edit_payload(data, _scores_as_text),
+])
+def test_corrupt_snapshots_are_rejected(corrupt):
+    data = make_snapshot([make_npc()], ["Quest Title: The Drowned Bell"], ["The Drowned Bell"])
+    with pytest.raises(ValueError):
+        session_from_bytes(corrupt(data))
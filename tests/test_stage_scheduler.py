@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from stage_scheduler import Stage, run_stages
+
+
+def test_dependencies_get_their_results_in_order():
+    run = run_stages([
+        Stage("name", lambda: "Stonebridge"),
+        Stage("size", lambda: "Town"),
+        Stage("description", lambda size, name: f"{name}, a {size}", deps=("size", "name")),
+        Stage("history", lambda description: description + " with a past", deps=("description",)),
+    ])
+    assert run.results["history"] == "Stonebridge, a Town with a past"
+    assert run.timings["description"][0] >= max(run.timings["name"][1], run.timings["size"][1])
+    assert "history" in run.summary()
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    run = run_stages([Stage(name, barrier.wait) for name in ("description", "history", "image")])
+    assert len(run.results) == 3
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("history", lambda: 1), Stage("history", lambda: 2)], "Duplicate stage name: history"),
+    ([Stage("history", lambda lore: lore, deps=("lore",))], "depends on unknown stage lore"),
+    ([Stage("history", lambda history: history, deps=("history",))], "Dependency cycle"),
+    ([
+        Stage("name", lambda: "Stonebridge"),
+        Stage("description", lambda name, history: name, deps=("name", "history")),
+        Stage("history", lambda description: description, deps=("description",)),
+    ], "Dependency cycle"),
+])
+def test_bad_stage_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_stages(stages)
+
+
+def test_failure_stops_dependent_stages():
+    started = []
+
+    def fail():
+        raise RuntimeError("the model is down")
+
+    with pytest.raises(RuntimeError, match="the model is down"):
+        run_stages([
+            Stage("description", fail),
+            Stage("history", lambda description: started.append("history"), deps=("description",)),
+        ])
+    assert started == []
+
+
+def test_on_complete_sees_every_result():
+    completed = {}
+    run_stages([Stage("name", lambda: "Stonebridge"), Stage("size", lambda: "Town")], on_complete=completed.__setitem__)
+    assert completed == {"name": "Stonebridge", "size": "Town"}
@@ -0,0 +1,80 @@
+import re
+
+from quest_parser import parse_quest
+from records import NPCRecord, StoredQuest, TownRecord, session_from_bytes, session_to_bytes
+from roster import RosterEntry
+from srd_catalog import MAGIC_ITEM_LINK
+from tile_renderer import Markup, compile_template, render_npc_tile, render_quest_tile, render_roster_card, render_template, render_town_tile
+
+SCRIPT = "<script>alert(1)</script>"
+ATTRIBUTE = '" onerror="alert(2)'
+MARKUP = SCRIPT + ATTRIBUTE + "<img src=x onerror=alert(3)>"
+
+
+# Fails if markup from a field made it into the HTML as a tag
+def assert_no_tags(rendered):
+    assert "<script" not in rendered
+    assert "<img src=x" not in rendered
+
+
+# Tiles put fields in attributes too, so quotes must not get through either
+def assert_no_injection(rendered):
+    assert_no_tags(rendered)
+    assert 'onerror="' not in rendered
+    assert "'onerror" not in rendered
+
+
+def markup_session():
+    town = TownRecord(
+        name=MARKUP, size=MARKUP, population=1200, unique_characters=12, description=MARKUP, history=MARKUP,
+        image_url=ATTRIBUTE, image_id="", notable_locations=(MARKUP, MARKUP),
+    )
+    npc = NPCRecord(
+        name=MARKUP, race=MARKUP, character_class=MARKUP, level=3, alignment=MARKUP, size=MARKUP, speed=30,
+        traits=(MARKUP,), languages=MARKUP, magic_items=((MARKUP, MARKUP), ("' onmouseover='alert(4)", MARKUP)),
+        ability_scores=bytes([10, 12, 14, 8, 13, 15]), armor_class=12, hit_points=20, passive_perception=11,
+        attack_modifier=4, spell_attack_modifier=4, spell_save=12,
+    )
+    quest_text = "\n".join(f"**{section}:** {MARKUP}" for section in
+                           ["Quest Title", "Quest Giver", "Quest Background", "Stages of the Quest", "Possible Resolutions", "Conclusion"])
+    return session_to_bytes(town, [npc], [StoredQuest.from_text(quest_text)], [MARKUP])
+
+
+def test_snapshot_with_markup_in_every_field_renders_escaped():
+    town, npcs, quests, titles = session_from_bytes(markup_session())
+    assert town.description == MARKUP and titles == [MARKUP]
+
+    town_tile = render_town_tile(town)
+    assert_no_injection(town_tile)
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in town_tile
+    assert_no_injection(render_npc_tile(npcs[0]))
+    # Quest sections are only ever text content, where quotes are harmless
+    assert_no_tags(render_quest_tile(parse_quest(quests[0].text)))
+
+
+def test_magic_item_links_stay_on_the_srd_site():
+    _, npcs, _, _ = session_from_bytes(markup_session())
+    for href in re.findall(r"href='([^']*)'", render_npc_tile(npcs[0])):
+        assert href.startswith(MAGIC_ITEM_LINK.format(index=""))
+        assert "<" not in href and "'" not in href
+
+
+def test_town_image_url_must_be_http_data_or_the_image_store():
+    town = TownRecord("Town", "Village", 100, 5, "", "", image_url="javascript:alert(1)")
+    assert "javascript:" not in render_town_tile(town)
+    town = TownRecord("Town", "Village", 100, 5, "", "", image_url="https://example.com/a.png?x=1&y=2")
+    assert 'src="https://example.com/a.png?x=1&amp;y=2"' in render_town_tile(town)
+    # A crafted image id doesn't become a file path or URL, the tile falls back to the checked image_url
+    town = TownRecord("Town", "Village", 100, 5, "", "", image_url="", image_id="../../secrets")
+    assert "secrets" not in render_town_tile(town)
+
+
+def test_roster_card_escapes_every_field():
+    entry = RosterEntry(row=0, name=MARKUP, race=MARKUP, character_class=MARKUP, level=1, alignment=MARKUP, armor_class=10, hit_points=5)
+    assert_no_injection(render_roster_card(entry))
+
+
+def test_render_template_escapes_everything_but_markup():
+    template = compile_template("<p title='{title}'>{body}</p>{tile}")
+    rendered = render_template(template, {"title": "' onclick='x", "body": "<b>", "tile": Markup("<div></div>")})
+    assert rendered == "<p title='&#x27; onclick=&#x27;x'>&lt;b&gt;</p><div></div>"
@@ -0,0 +1,483 @@
+import functools
+import html
+import string
+from urllib.parse import quote
+
+import image_store
+from records import NPCRecord, QuestRecord, TownRecord, calculate_modifier
+from roster import RosterEntry
+from srd_catalog import MAGIC_ITEM_LINK
+
+# Number of rendered tiles kept per tile type, enough for several big settlements per server process
+TILE_CACHE_SIZE = 4096
+
+# Styles of every tile, shared by the settlement view and exports
+TILE_STYLES = """
+<style>
+.gradient {
+    background: linear-gradient(10deg, #A73335, #f0f0f0);
+    height:5px;
+    margin:7px 0px;
+}
+.name {
+    font-size:225%;
+    font-family:Georgia, serif;
+    font-variant:small-caps;
+    font-weight:bold;
+    color:#A73335;
+}
+.description {
+    font-style:italic;    
+}
+.bold {
+    font-weight:bold;
+}
+.red {
+    color:#A73335;
+}
+table {
+    width:100%;
+    border:0px;
+    border-collapse:collapse;
+    color:#A73335;
+}
+th, td {
+    width:50px;
+    text-align:center;
+}
+.actions {
+    font-size:175%;
+    font-variant:small-caps;
+    margin:17px 0px 0px 0px;
+}
+.hr {
+    background: #A73335;
+    height:2px;
+}
+.attack {
+    margin:5px 0px;
+}
+.attackname {
+    font-weight:bold;
+    font-style:italic;
+}
+.town-tile {
+    width: 85%;
+    background-color: #f0f0f0;
+    border: 1px solid #ddd;
+    border-radius: 7.5px;
+    padding: 20px;
+    margin-bottom: 20px;
+    margin-left: auto;
+    margin-right: auto;
+}
+.character-tiles-container-wrapper {
+    display: flex;
+    align-items: center;
+    justify-content: center;
+}
+.character-tiles-container {
+    display: flex;
+    overflow-x: auto;
+    white-space: nowrap;
+    scroll-snap-type: x mandatory;
+    width: 80%;
+    padding: 10px;
+}
+.character-tile {
+    background-color: #f0f0f0;
+    border: 1px solid #ddd;
+    border-radius: 7.5px;  /* Increased bevel on corners by 50% */
+    margin-right: 10px;
+    padding: 20px;
+    min-width: 95%;
+    max-width: 95%;
+    flex: 0 0 auto;
+    scroll-snap-align: start;
+    white-space: normal;
+}
+.scroll-button {
+    background-color: #007bff;
+    border: none;
+    color: white;
+    padding: 10px;
+    text-align: center;
+    text-decoration: none;
+    display: inline-block;
+    font-size: 16px;
+    margin: 4px 2px;
+    cursor: pointer;
+    border-radius: 5px;
+}
+.scroll-button:disabled {
+    background-color: #cccccc;
+    cursor: not-allowed;
+}
+.character-tiles-container::-webkit-scrollbar {
+    display: none;
+}
+</style>
+"""
+
+# Carousel scrolling for the settlement view
+CAROUSEL_SCRIPT = """
+<script>
+function scrollTilesContainer(direction) {
+    const container = document.querySelector('.character-tiles-container');
+    const tileWidth = container.querySelector('.character-tile').clientWidth + 10;  // Tile width + margin-right
+    container.scrollBy({ left: direction * tileWidth, behavior: 'smooth' });
+}
+window.onload = function() {
+    const container = document.querySelector('.character-tiles-container');
+    const largestTile = Array.from(container.querySelectorAll('.character-tile')).reduce((maxHeight, tile) => {
+        return Math.max(maxHeight, tile.clientHeight);
+    }, 0);
+    container.style.height = largestTile + 'px';
+};
+</script>
+"""
+
+# Styles and carousel script shared by the settlement view, this never changes so it's built once
+CUSTOM_CSS = TILE_STYLES + CAROUSEL_SCRIPT
+
+NPC_TILE_TEMPLATE = """
+<div class="character-tile">
+    <div contenteditable="true"  style="width:85%; height:auto; font-family:Arial,Helvetica,sans-serif;font-size:11px;">
+    <div class="name">{name}</div>
+    <div class="description">{race} {character_class}, {alignment}</div>
+
+    <div class="gradient"></div>
+
+    <div class="red">
+        <div ><span class="bold red">Armor Class</span><span> {armor_class} </span></div>
+        <div><span class="bold red">Hit Points</span><span> {hit_points} </span></div>
+        <div><span class="bold red">Speed</span><span> {speed} ft.</span></div>
+    </div>
+
+    <div class="gradient"></div>
+
+    <table>
+        <tr><th>STR    </th><th>DEX   </th><th>CON    </th><th>INT   </th><th>WIS   </th><th>CHA   </th></tr>
+        <tr><td>{str} ({str_mod})</td><td>{dex} ({dex_mod})</td><td>{con} ({con_mod})</td><td>{int} ({int_mod})</td><td>{wis} ({wis_mod})</td><td>{cha} ({cha_mod})</td></tr>
+    </table>
+
+    <div class="gradient"></div>
+
+    <div><span class="bold">Traits</span><span> {traits}</span></div>
+    <div><span class="bold">Passive Perception</span><span> {passive_perception}</span></div>
+    <div><span class="bold">Languages</span><span> {languages}</span></div>
+    <div><span class="bold">Level </span><span> {level}</span></div> 
+
+    <div class="gradient"></div>
+
+    <div class="actions red">Actions</div>
+
+    <div class="hr"></div>
+
+    <div><span class="bold">Magic Items: </span><span> {magic_items}</span></div>
+    <div><span class="bold">Attack Modifier:</span> {attack_modifier} &emsp; <span class="bold">Spell Attack Modifier:</span> {spell_attack_modifier} &emsp; <span class="bold">Spell Save:</span> {spell_save}</div>
+    </div>
+</div>
+"""
+
+TOWN_TILE_TEMPLATE = """
+<div class="town-tile" style="margin: 0 auto; text-align: left; position: relative; display: flex; height: auto;">
+    <div class="town-info" style="display: flex; align-items: stretch; height: 100%;">
+        {image_tag}
+        <div contenteditable="true" style="width: 55%; font-family:Arial,Helvetica,sans-serif;font-size:11px; overflow: auto;">
+            <div class="name" style="text-align: left;">{name}</div>
+            <div class="description" style="text-align: left;">{size}, Population of {population}, containing {unique_characters} NPCs</div>
+            <div class="gradient"></div>
+            <p><strong>Description:</strong> {description}</p>
+            <p><strong>History: </strong>{history}</p>
+            {notable_locations}
+        </div>
+    </div>
+</div>
+"""
+
+QUEST_TILE_TEMPLATE = """
+<div class="quest-tile" style="margin: 0 auto; text-align: left; width: 85%; background-color: #ffffff; border: 1px solid #ddd; border-radius: 7.5px; padding: 20px; margin-bottom: 20px;">
+    <div contenteditable="true"  style="width:100%; font-family:Arial,Helvetica,sans-serif;font-size:11px;">
+    <h2 class="name" style = "font-size:225%; font-family:Georgia, serif; font-variant:small-caps; font-weight:bold; color:#A73335;">Quest: {title}</h2>
+    <div style = "font-style:italic;">Quest Giver: {giver}</div>
+    <br>
+    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Quest Background</div>
+    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
+    <p>{background}</p>
+    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Quest Stages</div>
+    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
+    <p>{stages}</p>
+    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Possible Resolutions</div>
+    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
+    <p>{resolutions}</p>
+    <div style="font-size:175%;font-variant:small-caps;margin:17px 0px 0px 0px; color:#A73335;">Conclusion</div>
+    <div class="gradient" style="background: linear-gradient(10deg, #A73335, #f0f0f0); height:5px; margin:7px 0px;"></div>
+    <p>{conclusion}</p>
+    </div>
+
+</div>
+"""
+
+SETTLEMENT_TEMPLATE = """
+{custom_css}
+{town_tile}
+<div class="character-tiles-container-wrapper">
+    <button class="scroll-button" onclick="scrollTilesContainer(-1)">&lt;</button>
+    <div class="character-tiles-container">
+        {character_tiles}
+    </div>
+    <button class="scroll-button" onclick="scrollTilesContainer(1)">&gt;</button>
+</div>
+"""
+
+# One opened NPC on its own, wrapped like the carousel so the shared styles and script apply
+NPC_DETAIL_TEMPLATE = """
+{custom_css}
+<div class="character-tiles-container-wrapper">
+    <div class="character-tiles-container">
+        {npc_tile}
+    </div>
+</div>
+"""
+
+# A page of the citizen roster: small cards with the summary every roster entry has
+ROSTER_PAGE_TEMPLATE = """
+<style>
+.roster-page {{
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(180px, 1fr));
+    gap: 8px;
+    font-family: Arial, Helvetica, sans-serif;
+    font-size: 11px;
+}}
+.roster-card {{
+    background-color: #f0f0f0;
+    border: 1px solid #ddd;
+    border-radius: 7.5px;
+    padding: 8px 10px;
+}}
+.roster-name {{
+    font-family: Georgia, serif;
+    font-variant: small-caps;
+    font-weight: bold;
+    font-size: 140%;
+    color: #A73335;
+}}
+</style>
+<div class="roster-page">{cards}</div>
+"""
+
+ROSTER_CARD_TEMPLATE = """
+<div class="roster-card">
+    <div class="roster-name">{name}</div>
+    <div style="font-style: italic;">{race} {character_class}, {alignment}</div>
+    <div style="color: #A73335;">Level {level} &emsp; AC {armor_class} &emsp; HP {hit_points}</div>
+</div>
+"""
+
+_formatter = string.Formatter()
+
+
+# HTML that is already safe to insert (a rendered tile, a sanitized quest section), render_template leaves it as it is
+class Markup(str):
+    __slots__ = ()
+
+
+# Function to split a template into (literal text, field name) pairs once, so rendering is only list appends and a join
+def compile_template(template):
+    return [(literal, field) for literal, field, _, _ in _formatter.parse(template)]
+
+
+# Every value is HTML-escaped (quotes included, so values are safe in attributes too) unless it is Markup
+# Records can come from uploaded snapshots and batch files, so no field is trusted to be plain text
+def render_template(compiled, values):
+    pieces = []
+    for literal, field in compiled:
+        pieces.append(literal)
+        if field is not None:
+            value = values[field]
+            pieces.append(value if isinstance(value, Markup) else html.escape(str(value)))
+    return Markup("".join(pieces))
+
+
+_NPC_TILE = compile_template(NPC_TILE_TEMPLATE)
+_TOWN_TILE = compile_template(TOWN_TILE_TEMPLATE)
+_QUEST_TILE = compile_template(QUEST_TILE_TEMPLATE)
+_SETTLEMENT = compile_template(SETTLEMENT_TEMPLATE)
+_NPC_DETAIL = compile_template(NPC_DETAIL_TEMPLATE)
+_ROSTER_PAGE = compile_template(ROSTER_PAGE_TEMPLATE)
+_ROSTER_CARD = compile_template(ROSTER_CARD_TEMPLATE)
+_MAGIC_ITEM = compile_template("<a href='{href}' style='color:#A73335;'>{name}</a>")
+_NOTABLE_LOCATIONS = compile_template("<p><strong>Notable Locations: </strong>{locations}</p>")
+_TOWN_IMAGE = compile_template('<img src="{src}" alt="Town Image" style="{style}">')
+
+_ABILITY_KEYS = ("str", "dex", "con", "int", "wis", "cha")
+
+
+def format_bonus(value):
+    return f"{'+' if value >= 0 else ''}{value}"
+
+
+def render_magic_items(magic_items):
+    if not magic_items:
+        return "None"
+    return Markup(", ".join(
+        render_template(_MAGIC_ITEM, {"href": MAGIC_ITEM_LINK.format(index=quote(index, safe="")), "name": name})
+        for index, name in magic_items
+    ))
+
+
+# URL prefixes a town image may have: OpenAI, the image store, or the data: URI of an exported image
+# Anything else (javascript:, a relative path out of a crafted snapshot) is dropped
+_IMAGE_URL_PREFIXES = ("https://", "http://", "data:image/")
+
+
+def safe_image_url(url):
+    if url.startswith(_IMAGE_URL_PREFIXES) or (image_store.IMAGE_URL_PREFIX and url.startswith(image_store.IMAGE_URL_PREFIX + "/")):
+        return url
+    return ""
+
+
+# Tiles are memoized per record, an unchanged NPC, town or quest is never rendered twice
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def render_npc_tile(npc: NPCRecord):
+    values = {
+        "name": npc.name,
+        "race": npc.race,
+        "character_class": npc.character_class,
+        "alignment": npc.alignment,
+        "armor_class": npc.armor_class,
+        "hit_points": npc.hit_points,
+        "speed": npc.speed,
+        "traits": ", ".join(npc.traits),
+        "passive_perception": npc.passive_perception,
+        "languages": npc.languages,
+        "level": npc.level,
+        "magic_items": render_magic_items(npc.magic_items),
+        "attack_modifier": format_bonus(npc.attack_modifier),
+        "spell_attack_modifier": format_bonus(npc.spell_attack_modifier),
+        "spell_save": npc.spell_save,
+    }
+    for key, score in zip(_ABILITY_KEYS, npc.ability_scores):
+        values[key] = score
+        values[f"{key}_mod"] = calculate_modifier(score)
+    return render_template(_NPC_TILE, values)
+
+
+TOWN_IMAGE_STYLE = "border-radius:7.5px; float: left; margin-right: 15px; width: 40%; max-height: 100%;"
+# Shown in place of the town image while it is still being painted
+TOWN_IMAGE_PLACEHOLDER = (
+    f'<div style="{TOWN_IMAGE_STYLE} min-height: 240px; display: flex; align-items: center; justify-content: center; '
+    'background: linear-gradient(135deg, #E0E5E1, #CBD2CD); color: #A73335; font-style: italic;">Painting the town...</div>'
+)
+
+
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def render_town_tile(town: TownRecord):
+    if town.image_pending:
+        image_tag = Markup(TOWN_IMAGE_PLACEHOLDER)
+    elif image_store.is_image_id(town.image_id):
+        image_tag = Markup(image_store.image_tag(town.image_id, "Town Image", TOWN_IMAGE_STYLE))
+    else:
+        image_tag = render_template(_TOWN_IMAGE, {"src": safe_image_url(town.image_url), "style": TOWN_IMAGE_STYLE})
+    return render_template(_TOWN_TILE, {
+        "image_tag": image_tag,
+        "name": town.name,
+        "size": town.size,
+        "population": town.population,
+        "unique_characters": town.unique_characters,
+        "description": town.description,
+        "history": town.history,
+        "notable_locations": render_template(_NOTABLE_LOCATIONS, {"locations": ", ".join(town.notable_locations)}) if town.notable_locations else "",
+    })
+
+
+# Quest records from quest_parser already hold sanitized HTML for every section
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def render_quest_tile(quest: QuestRecord):
+    return render_template(_QUEST_TILE, {
+        "title": Markup(quest.title),
+        "giver": Markup(quest.giver),
+        "background": Markup(quest.background),
+        "stages": Markup(quest.stages),
+        "resolutions": Markup(quest.resolutions),
+        "conclusion": Markup(quest.conclusion),
+    })
+
+
+# Function to render the whole settlement view: styles, town tile and the NPC carousel
+def render_settlement(town_tile, npc_tiles):
+    return render_template(_SETTLEMENT, {
+        "custom_css": Markup(CUSTOM_CSS),
+        "town_tile": Markup(town_tile),
+        "character_tiles": Markup("".join(npc_tiles)),
+    })
+
+
+# Function to render a single NPC tile with the styles it needs, e.g. a roster entry that was opened
+def render_npc_detail(npc_tile):
+    return render_template(_NPC_DETAIL, {"custom_css": Markup(CUSTOM_CSS), "npc_tile": Markup(npc_tile)})
+
+
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def render_roster_card(entry: RosterEntry):
+    return render_template(_ROSTER_CARD, {
+        "name": entry.name,
+        "race": entry.race,
+        "character_class": entry.character_class,
+        "alignment": entry.alignment,
+        "level": entry.level,
+        "armor_class": entry.armor_class,
+        "hit_points": entry.hit_points,
+    })
+
+
+# Function to render one page of roster entries, only the entries on the page are ever rendered
+def render_roster_page(entries):
+    return render_template(_ROSTER_PAGE, {"cards": Markup("".join(render_roster_card(entry) for entry in entries))})
+
+
+# Memoized settlement payload, so reruns of the settlement view reuse the same string instead of joining it again
+# npc_tiles has to be a tuple to be hashable, str hashes are cached so the lookup stays cheap
+@functools.lru_cache(maxsize=64)
+def render_settlement_view(town_tile, npc_tiles):
+    return render_settlement(town_tile, npc_tiles)
+
+
+WATERFALL_ROW_TEMPLATE = """
+<div style="display:flex; align-items:center; height:18px; font-family:monospace; font-size:11px;">
+    <div style="width:30%; padding-left:{indent}px; white-space:nowrap; overflow:hidden; text-overflow:ellipsis;" title="{details}">{name}</div>
+    <div style="position:relative; width:60%; height:12px; background:#f0f0f0;">
+        <div style="position:absolute; left:{left}%; width:{width}%; min-width:1px; height:100%; background:{color};"></div>
+    </div>
+    <div style="width:10%; text-align:right;">{duration_ms} ms</div>
+</div>
+"""
+
+_WATERFALL_ROW = compile_template(WATERFALL_ROW_TEMPLATE)
+
+
+# Function to render the spans of a trace (tracing.Trace.rows()) as a waterfall, one bar per span
+def render_waterfall(rows):
+    total_ms = max((row["offset_ms"] + row["duration_ms"] for row in rows), default=0) or 1
+    return "".join(
+        render_template(_WATERFALL_ROW, {
+            "indent": 12 * row["depth"],
+            "name": row["name"],
+            "details": f"{row['thread']} {row['attrs']}",
+            "left": round(100 * row["offset_ms"] / total_ms, 2),
+            "width": round(100 * row["duration_ms"] / total_ms, 2),
+            "color": "#A73335" if row["error"] else "#4a7ab5",
+            "duration_ms": round(row["duration_ms"]),
+        })
+        for row in rows
+    )
+
+
+def clear_tile_caches():
+    render_npc_tile.cache_clear()
+    render_town_tile.cache_clear()
+    render_quest_tile.cache_clear()
+    render_roster_card.cache_clear()
+    render_settlement_view.cache_clear()
@@ -0,0 +1,253 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight spans around network calls and pipeline stages.
+#   with tracing.trace("settlement") as run:     # collects every span opened below it, in any thread
+#       with tracing.span("stage.lore"):          # also feeds the latency histogram of "stage.lore"
+#           ...
+# Worker threads only see the current trace if they run inside a copy of the caller's context,
+# see run_in_context (stage_scheduler and build_characters do this)
+
+# Every finished trace is appended here as one JSON line when set
+TRACE_JSONL_PATH = os.environ.get("INSPIRAITION_TRACE_JSONL")
+# Port of the Prometheus /metrics endpoint, not started when unset
+METRICS_PORT = os.environ.get("INSPIRAITION_METRICS_PORT")
+
+# Histogram buckets in seconds, from a cache hit to a DALL-E render
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Recent durations kept per span name for p50/p95
+SAMPLES_PER_NAME = 1000
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "parent", "thread", "start", "end", "error")
+
+    def __init__(self, name, attrs, parent):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def depth(self):
+        depth, parent = 0, self.parent
+        while parent is not None:
+            depth, parent = depth + 1, parent.parent
+        return depth
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def total_seconds(self):
+        return max((span.end for span in self.spans), default=self.start) - self.start
+
+    # Function to get the spans in start order as dicts, offsets and durations in milliseconds
+    def rows(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return [
+            {
+                "name": span.name,
+                "depth": span.depth(),
+                "offset_ms": round(1000 * (span.start - self.start), 2),
+                "duration_ms": round(1000 * span.duration, 2),
+                "thread": span.thread,
+                "error": span.error,
+                "attrs": span.attrs,
+            }
+            for span in spans
+        ]
+
+    def as_dict(self):
+        return {"trace": self.name, "started_at": self.started_at, "total_ms": round(1000 * self.total_seconds, 2), "spans": self.rows()}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.errors = {}
+        self.sums = {}
+        self.buckets = {}
+        self.samples = {}
+
+    def observe(self, name, seconds, error):
+        with self._lock:
+            if name not in self.counts:
+                self.counts[name] = 0
+                self.errors[name] = 0
+                self.sums[name] = 0.0
+                self.buckets[name] = [0] * len(HISTOGRAM_BUCKETS)
+                self.samples[name] = deque(maxlen=SAMPLES_PER_NAME)
+            self.counts[name] += 1
+            self.sums[name] += seconds
+            if error:
+                self.errors[name] += 1
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if seconds <= bound:
+                    self.buckets[name][i] += 1
+            self.samples[name].append(seconds)
+
+    # Function to get count, errors and p50/p95 latency per span name
+    def summary(self):
+        with self._lock:
+            names = sorted(self.counts)
+            samples = {name: sorted(self.samples[name]) for name in names}
+            return {
+                name: {
+                    "count": self.counts[name],
+                    "errors": self.errors[name],
+                    "avg_ms": round(1000 * self.sums[name] / self.counts[name], 1),
+                    "p50_ms": round(1000 * _percentile(samples[name], 0.50), 1),
+                    "p95_ms": round(1000 * _percentile(samples[name], 0.95), 1),
+                }
+                for name in names
+            }
+
+    # Function to export the histograms and error counters in the Prometheus text format
+    def prometheus(self):
+        lines = [
+            "# HELP inspiraition_span_seconds Duration of traced spans.",
+            "# TYPE inspiraition_span_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self.counts):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                for bound, count in zip(HISTOGRAM_BUCKETS, self.buckets[name]):
+                    lines.append(f'inspiraition_span_seconds_bucket{{span="{label}",le="{bound}"}} {count}')
+                lines.append(f'inspiraition_span_seconds_bucket{{span="{label}",le="+Inf"}} {self.counts[name]}')
+                lines.append(f'inspiraition_span_seconds_sum{{span="{label}"}} {self.sums[name]:.6f}')
+                lines.append(f'inspiraition_span_seconds_count{{span="{label}"}} {self.counts[name]}')
+            lines.append("# HELP inspiraition_span_errors_total Traced spans that raised.")
+            lines.append("# TYPE inspiraition_span_errors_total counter")
+            for name in sorted(self.errors):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'inspiraition_span_errors_total{{span="{label}"}} {self.errors[name]}')
+        return "\n".join(lines) + "\n"
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+
+metrics = Metrics()
+_jsonl_lock = threading.Lock()
+
+
+@contextmanager
+def span(name, **attrs):
+    current = Span(name, attrs, _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace_run = _current_trace.get()
+        if trace_run is not None:
+            trace_run.add(current)
+        metrics.observe(name, current.end - current.start, current.error)
+
+
+# Function to record a span whose start and end were measured by the caller, e.g. one spread over a generator's lifetime
+def record_span(name, start, end, error=None, **attrs):
+    current = Span(name, attrs, _current_span.get())
+    current.start = start
+    current.end = end
+    current.error = error
+    trace_run = _current_trace.get()
+    if trace_run is not None:
+        trace_run.add(current)
+    metrics.observe(name, end - start, error)
+
+
+# Function to collect every span opened inside it into a new Trace, which is also a span itself
+@contextmanager
+def trace(name, **attrs):
+    trace_run = Trace(name)
+    token = _current_trace.set(trace_run)
+    try:
+        with span(name, **attrs):
+            yield trace_run
+    finally:
+        _current_trace.reset(token)
+        if TRACE_JSONL_PATH:
+            export_jsonl(trace_run, TRACE_JSONL_PATH)
+
+
+# Function to wrap func so it runs in a copy of the calling thread's context (current trace and span)
+# Needed for work handed to thread pools, whose threads don't inherit context variables
+def run_in_context(func):
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def export_jsonl(trace_run, path):
+    line = json.dumps(trace_run.as_dict()) + "\n"
+    with _jsonl_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+# Function to serve /metrics for Prometheus on a background thread, only the first call starts a server
+def start_metrics_server(port=None):
+    global _metrics_server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(("", int(port)), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+    return _metrics_server
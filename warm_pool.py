@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import generator
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Ready-made settlements kept per size, 0 turns the pool off
+WARM_POOL_SIZE = int(os.environ.get("INSPIRAITION_WARM_POOL_SIZE", 0))
+# Background workers generating settlements for the pool
+WARM_POOL_WORKERS = int(os.environ.get("INSPIRAITION_WARM_POOL_WORKERS", 2))
+# Most settlements the pool may generate in any hour, every one costs a chat completion and a DALL-E image
+WARM_POOL_HOURLY_LIMIT = int(os.environ.get("INSPIRAITION_WARM_POOL_HOURLY_LIMIT", 20))
+
+# Without a locally stored image a pooled settlement only has the OpenAI URL, which expires
+UNSTORED_IMAGE_MAX_AGE = generator.IMAGE_URL_TTL
+
+
+# Function to check that a pooled settlement can still show its town image
+# The age is the URL's own (image_created_at), a URL from the response cache may be older than the settlement
+def image_usable(settlement, now=None):
+    if settlement.get("image_id"):
+        return True
+    created_at = settlement.get("image_created_at")
+    return created_at is not None and (now or time.time()) - created_at < UNSTORED_IMAGE_MAX_AGE
+
+
+# Pool of pre-generated settlements per size, refilled in the background whenever one is taken
+# Settlements are the dicts generator.generate_settlement returns
+class WarmPool:
+    def __init__(self, sizes, target=WARM_POOL_SIZE, workers=WARM_POOL_WORKERS, hourly_limit=WARM_POOL_HOURLY_LIMIT, generate=None):
+        self.sizes = list(sizes)
+        self.target = target
+        self.hourly_limit = hourly_limit
+        self._generate = generate or generator.generate_settlement
+        self._ready = {size: deque() for size in self.sizes}
+        self._pending = {size: 0 for size in self.sizes}
+        # Start times of the generations in the last hour, for the spend limit
+        self._started = deque()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="warm-pool")
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def start(self):
+        self._refill()
+
+    def stop(self):
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Function to take a ready settlement of the given size, returns None when there isn't one
+    # Taking one (or finding none) queues a replacement in the background
+    def take(self, size):
+        settlement = None
+        with self._lock:
+            ready = self._ready.get(size, ())
+            while ready:
+                candidate = ready.popleft()
+                if image_usable(candidate):
+                    settlement = candidate
+                    break
+            if settlement is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._refill()
+        return settlement
+
+    def stats(self):
+        with self._lock:
+            self._expire_started()
+            return {
+                "ready": {size: len(ready) for size, ready in self._ready.items()},
+                "pending": dict(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "generated_last_hour": len(self._started),
+            }
+
+    def _expire_started(self):
+        hour_ago = time.time() - 3600
+        while self._started and self._started[0] < hour_ago:
+            self._started.popleft()
+
+    # Function to queue generations until every size has target settlements ready or pending
+    # or the hourly limit is reached, in which case it tries again once the oldest generation is an hour old
+    def _refill(self):
+        with self._lock:
+            if self._closed or self.target <= 0 or self.hourly_limit <= 0:
+                return
+            self._expire_started()
+            while len(self._started) < self.hourly_limit:
+                # The size with the fewest settlements on the way goes first, so all sizes fill up evenly
+                size = min(self.sizes, key=lambda s: len(self._ready[s]) + self._pending[s])
+                if len(self._ready[size]) + self._pending[size] >= self.target:
+                    return
+                self._pending[size] += 1
+                self._started.append(time.time())
+                self._executor.submit(self._build, size)
+
+            if self._timer is None:
+                self._timer = threading.Timer(self._started[0] + 3600 - time.time(), self._retry_refill)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _retry_refill(self):
+        with self._lock:
+            self._timer = None
+        self._refill()
+
+    def _build(self, size):
+        settlement = None
+        try:
+            with tracing.trace("warm_pool.settlement", size=size):
+                settlement = self._generate(size)
+        except Exception as e:
+            logger.warning("Warm pool failed to generate a %s: %r", size, e)
+        with self._lock:
+            self._pending[size] -= 1
+            if settlement is None:
+                self.failures += 1
+            else:
+                self._ready[size].append(settlement)
+        self._refill()